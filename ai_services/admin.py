@@ -1,10 +1,10 @@
 from django.contrib import admin
-from .models import APIKey
+from .models import APIKey, CategorySet, DailyUsage, Document, HourlyUsage, IdempotencyRecord, Job
 
 @admin.register(APIKey)
 class APIKeyAdmin(admin.ModelAdmin):
-    list_display = ('user', 'key', 'created_at', 'is_active', 'usage_count')
-    list_filter = ('is_active', 'created_at')
+    list_display = ('user', 'key', 'created_at', 'is_active', 'usage_count', 'priority_class', 'weight')
+    list_filter = ('is_active', 'priority_class', 'created_at')
     search_fields = ('user__username', 'user__email', 'key')
     readonly_fields = ('key', 'created_at', 'usage_count')
     
@@ -12,3 +12,58 @@ class APIKeyAdmin(admin.ModelAdmin):
         if obj:  # Editing an existing object
             return self.readonly_fields + ('user',)
         return self.readonly_fields
+
+
+@admin.register(Document)
+class DocumentAdmin(admin.ModelAdmin):
+    list_display = ('id', 'api_key', 'size_bytes', 'stored_bytes', 'token_count', 'created_at', 'expires_at')
+    list_filter = ('created_at', 'expires_at')
+    search_fields = ('id', 'api_key__user__username', 'content_hash')
+    exclude = ('content',)
+    readonly_fields = ('id', 'api_key', 'content_hash', 'size_bytes', 'stored_bytes', 'token_count',
+                       'chunks', 'created_at', 'expires_at')
+
+
+@admin.register(CategorySet)
+class CategorySetAdmin(admin.ModelAdmin):
+    list_display = ('name', 'api_key', 'created_at', 'updated_at')
+    search_fields = ('name', 'api_key__user__username')
+    readonly_fields = ('id', 'api_key', 'prompt_block', 'lookup', 'created_at', 'updated_at')
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'api_key', 'service', 'status', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status', 'service', 'created_at')
+    search_fields = ('id', 'api_key__user__username')
+    readonly_fields = ('id', 'api_key', 'service', 'payload', 'result', 'error', 'attempts',
+                       'locked_by', 'locked_at', 'created_at', 'finished_at', 'expires_at')
+
+
+@admin.register(IdempotencyRecord)
+class IdempotencyRecordAdmin(admin.ModelAdmin):
+    list_display = ('key', 'api_key', 'endpoint', 'status', 'response_status', 'created_at', 'expires_at')
+    list_filter = ('status', 'endpoint', 'created_at')
+    search_fields = ('key', 'api_key__user__username')
+    readonly_fields = ('api_key', 'key', 'endpoint', 'request_hash', 'status', 'response_status',
+                       'response_body', 'locked_at', 'created_at', 'expires_at')
+
+
+class UsageRollupAdmin(admin.ModelAdmin):
+    """Read-only view of the usage rollups; raw UsageEvent rows are not scanned here."""
+    list_display = ('bucket_start', 'api_key', 'endpoint', 'model', 'requests', 'errors',
+                    'input_tokens', 'output_tokens', 'average_latency_ms')
+    list_filter = ('endpoint', 'model', 'bucket_start')
+    search_fields = ('api_key__user__username',)
+    date_hierarchy = 'bucket_start'
+    list_select_related = ('api_key__user',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+admin.site.register(HourlyUsage, UsageRollupAdmin)
+admin.site.register(DailyUsage, UsageRollupAdmin)
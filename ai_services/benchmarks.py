@@ -0,0 +1,234 @@
+"""
+Microbenchmarks for the in-process hot paths: API key middleware, request serializers,
+prompt construction in the logic modules, response rendering and key generation.
+The LLM is replaced by the offline `local` provider, so only our own code is measured.
+Run with `manage.py benchmark`; compare two result files with `manage.py compare_benchmarks`.
+"""
+import json
+import platform
+import statistics
+import time
+
+import django
+from django.contrib.auth.models import User
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+
+from .logic.text_chunker import chunk_spans
+from .middleware import APIKeyAuthenticationMiddleware
+from .models import APIKey
+from .services import SERVICES, get_serializer, plain_arguments
+
+# Input sizes in characters used by the size-dependent benchmarks
+SIZES = (100, 10_000, 100_000)
+
+# Logic modules are benchmarked below the token budgets of every service
+LOGIC_SIZES = (100, 2_000)
+
+_SENTENCE = "The quick brown fox jumps over the lazy dog while the team ships another release. "
+
+
+def sample_text(size):
+    return (_SENTENCE * (size // len(_SENTENCE) + 1))[:size]
+
+
+def sample_payload(service, size):
+    """A valid request body for `service` whose main text field has `size` characters"""
+    text = sample_text(size)
+    if service == "answer":
+        return {"question": "What does the fox do?", "context": text}
+    if service == "generate":
+        return {"prompt_text": text, "content_type": "general", "max_length": 200}
+    payload = {"text": text}
+    if service == "classify":
+        payload["categories"] = ["Technology", "Sports", "Animals", "Business"]
+    elif service == "translate":
+        payload["target_language"] = "French"
+    elif service == "keywords":
+        payload["count"] = 5
+    return payload
+
+
+class Suite:
+    """Registry of named benchmarks; each entry is a setup function returning the callable to time"""
+
+    def __init__(self):
+        self.benchmarks = {}
+
+    def add(self, name, setup):
+        self.benchmarks[name] = setup
+
+    def register(self, name):
+        def decorator(setup):
+            self.add(name, setup)
+            return setup
+        return decorator
+
+
+SUITE = Suite()
+
+
+def _api_key():
+    user, _ = User.objects.get_or_create(username="benchmark")
+    api_key = APIKey.objects.filter(user=user).first()
+    return api_key or APIKey.objects.create(user=user)
+
+
+def _middleware():
+    return APIKeyAuthenticationMiddleware(lambda request: None)
+
+
+@SUITE.register("auth.skip_non_api_path")
+def _auth_skip():
+    middleware, factory = _middleware(), RequestFactory()
+    request = factory.get("/dashboard/")
+    return lambda: middleware.process_request(request)
+
+
+@SUITE.register("auth.header_key_lookup")
+def _auth_header():
+    middleware, factory = _middleware(), RequestFactory()
+    key = _api_key().key
+    return lambda: middleware.process_request(factory.post("/sentiment/", HTTP_X_API_KEY=key))
+
+
+@SUITE.register("auth.missing_key")
+def _auth_missing():
+    middleware, factory = _middleware(), RequestFactory()
+    return lambda: middleware.process_request(factory.get("/sentiment/"))
+
+
+def _auth_body(size):
+    def setup():
+        middleware, factory = _middleware(), RequestFactory()
+        body = json.dumps({"api_key": _api_key().key, "text": sample_text(size)})
+        return lambda: middleware.process_request(
+            factory.post("/sentiment/", body, content_type="application/json")
+        )
+    return setup
+
+
+def _serializer(service, size):
+    def setup():
+        payload = sample_payload(service, size)
+
+        def run():
+            serializer = get_serializer(service, payload)
+            if not serializer.is_valid():
+                raise ValueError(serializer.errors)
+        return run
+    return setup
+
+
+def _logic(service, size):
+    def setup():
+        serializer = get_serializer(service, sample_payload(service, size))
+        serializer.is_valid(raise_exception=True)
+        data = plain_arguments(serializer.validated_data)
+        _, runner = SERVICES[service]
+        return lambda: runner(data)
+    return setup
+
+
+def _render(size):
+    def setup():
+        renderer = JSONRenderer()
+        data = {
+            "summary": sample_text(size),
+            "metadata": {"llm_calls": 1, "providers": ["local"], "models": ["gemini-2.0-flash"],
+                         "estimated_input_tokens": size // 4, "max_output_tokens": 1024, "truncated": False},
+        }
+        return lambda: renderer.render(data)
+    return setup
+
+
+def _chunker(size):
+    def setup():
+        text = sample_text(size)
+        return lambda: chunk_spans(text)
+    return setup
+
+
+@SUITE.register("models.generate_api_key")
+def _generate_api_key():
+    return APIKey.generate_api_key
+
+
+for _size in SIZES:
+    SUITE.add(f"auth.body_key_lookup[{_size}]", _auth_body(_size))
+    SUITE.add(f"render.json_response[{_size}]", _render(_size))
+    SUITE.add(f"chunker.chunk_spans[{_size}]", _chunker(_size))
+    for _service in SERVICES:
+        SUITE.add(f"serializer.{_service}[{_size}]", _serializer(_service, _size))
+
+for _size in LOGIC_SIZES:
+    for _service in SERVICES:
+        SUITE.add(f"logic.{_service}[{_size}]", _logic(_service, _size))
+
+
+def measure(func, repeat=5, min_time=0.05):
+    """
+    Time func() like timeit: calibrate the loop count so one run takes at least
+    `min_time` seconds, then report per-call statistics over `repeat` runs.
+    """
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        loops *= 10 if elapsed < min_time / 10 else 2
+
+    timings = [elapsed / loops]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        timings.append((time.perf_counter() - started) / loops)
+
+    return {
+        "median_us": statistics.median(timings) * 1e6,
+        "min_us": min(timings) * 1e6,
+        "mean_us": statistics.mean(timings) * 1e6,
+        "stdev_us": statistics.pstdev(timings) * 1e6,
+        "loops": loops,
+        "repeat": repeat,
+    }
+
+
+def run_suite(names=None, repeat=5, min_time=0.05, progress=None):
+    """Run the selected benchmarks and return a JSON-serializable results document"""
+    results = {}
+    for name, setup in SUITE.benchmarks.items():
+        if names is not None and name not in names:
+            continue
+        results[name] = measure(setup(), repeat=repeat, min_time=min_time)
+        if progress:
+            progress(name, results[name])
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+def compare_results(baseline, current, threshold=0.10):
+    """
+    Compare two results documents by median time per call.
+    Returns [(name, baseline_us, current_us, change)] for benchmarks present in both,
+    plus the names whose change is above `threshold` (0.10 = 10% slower).
+    """
+    rows, regressions = [], []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        change = result["median_us"] / base["median_us"] - 1
+        rows.append((name, base["median_us"], result["median_us"], change))
+        if change > threshold:
+            regressions.append(name)
+    return rows, regressions
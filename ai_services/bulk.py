@@ -0,0 +1,235 @@
+"""
+Streaming bulk processing of NDJSON request bodies.
+Each input line is one request body for a service. A reader thread parses and validates
+lines as they arrive and hands them to a pool of `window` workers; results are streamed
+back as NDJSON in input order or as they complete. A line's result is counted against the
+window until it has been written, so at most `window` lines are held at any time and
+memory stays flat however long the stream is. Errors are reported on the line they belong
+to and never end the stream.
+Under ASGI, Django reads the whole request body (spooled to disk when large) before the view
+runs, so only the output is streamed; iterate_async() serves it without buffering.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+from .exceptions import ServiceError
+from .logic.invocation import invocation_context
+from .services import SERVICES, get_serializer, plain_arguments
+from .usage import record_usage
+
+logger = logging.getLogger(__name__)
+
+# Services that make sense per record; the long-running ones belong in /jobs/
+BULK_SERVICES = ("sentiment", "keywords", "classify", "detect_language", "translate")
+
+INPUT_ORDER = "input"
+COMPLETION_ORDER = "completion"
+
+# Seconds between checks for a stopped stream while the reader waits for a free slot
+_POLL_SECONDS = 0.5
+
+_END = object()
+
+
+class LineTooLong(Exception):
+    pass
+
+
+def read_lines(stream, max_bytes):
+    """
+    (line number, raw line) for every non-blank line of a byte stream. Lines longer than
+    max_bytes are skipped and reported as LineTooLong instead of their content.
+    """
+    number = 0
+    while True:
+        line = stream.readline(max_bytes + 1)
+        if not line:
+            return
+        number += 1
+        if len(line) > max_bytes and not line.endswith(b"\n"):
+            # Drop the rest of the line
+            while line and not line.endswith(b"\n"):
+                line = stream.readline(max_bytes)
+            yield number, LineTooLong(f"Line exceeds the {max_bytes} byte limit")
+            continue
+        if line.strip():
+            yield number, line
+
+
+def _output(number, record_id, **fields):
+    output = {"line": number}
+    if record_id is not None:
+        output["id"] = record_id
+    output.update(fields)
+    return output
+
+
+class _Fatal:
+    """The body could not be read any further; reported after the lines read before it"""
+
+    def __init__(self, output):
+        self.output = output
+
+
+class BulkStream:
+    """Runs one NDJSON stream; iterate it for the encoded output lines"""
+
+    def __init__(self, service, stream, api_key, tenant, hints, window, order):
+        self.service = service
+        self.stream = stream
+        self.api_key = api_key
+        self.tenant = tenant
+        self.hints = hints
+        self.window = window
+        self.order = order
+        self.slots = threading.Semaphore(window)
+        self.results = queue.Queue()
+        self.stopped = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=window, thread_name_prefix="bulk")
+        self.counts = {"lines": 0, "succeeded": 0, "failed": 0}
+
+    def __iter__(self):
+        reader = threading.Thread(target=self._read, name="bulk-reader", daemon=True)
+        reader.start()
+        pending = {}  # line number -> output, waiting for earlier lines (input order)
+        sequence = deque()  # line numbers submitted and not yet written (input order)
+        fatal = None
+        try:
+            while True:
+                item = self.results.get()
+                if item is _END:
+                    break
+                if isinstance(item, int):
+                    sequence.append(item)
+                elif isinstance(item, _Fatal):
+                    fatal = item.output
+                elif self.order == COMPLETION_ORDER:
+                    yield self._emit(item[1])
+                else:
+                    number, output = item
+                    pending[number] = output
+                    while sequence and sequence[0] in pending:
+                        yield self._emit(pending.pop(sequence.popleft()))
+            if fatal is not None:
+                yield self._encode(fatal)
+            yield self._encode({"summary": dict(self.counts)})
+        finally:
+            # Also reached when the client goes away and the server closes the response
+            self.stop()
+
+    async def iterate_async(self):
+        """
+        The output lines for ASGI servers, which would otherwise collect a sync iterator into
+        a list before sending any of it. Each line is fetched in a worker thread.
+        """
+        lines = iter(self)
+        try:
+            while True:
+                line = await sync_to_async(next, thread_sensitive=False)(lines, None)
+                if line is None:
+                    return
+                yield line
+        finally:
+            # On a disconnect the pending next() returns once the reader has seen the stop
+            self.stop()
+
+    def stop(self):
+        self.stopped.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _emit(self, output):
+        self.slots.release()
+        self.counts["lines"] += 1
+        self.counts["failed" if "error" in output else "succeeded"] += 1
+        metrics.bulk_lines.inc(service=self.service, outcome="error" if "error" in output else "ok")
+        return self._encode(output)
+
+    @staticmethod
+    def _encode(output):
+        return json.dumps(output, ensure_ascii=False, default=str).encode("utf-8") + b"\n"
+
+    def _acquire(self):
+        while not self.stopped.is_set():
+            if self.slots.acquire(timeout=_POLL_SECONDS):
+                return True
+        return False
+
+    def _read(self):
+        try:
+            for number, line in read_lines(self.stream, settings.BULK_MAX_LINE_BYTES):
+                if not self._acquire():
+                    return
+                if self.order == INPUT_ORDER:
+                    # The line's place in the output is known before its result
+                    self.results.put(number)
+                job = self._prepare(number, line)
+                if isinstance(job, dict):
+                    self.results.put((number, job))
+                else:
+                    self.executor.submit(self._run, number, *job)
+        except ServiceError as e:
+            # The body itself is unreadable (e.g. corrupt compression); nothing after it can be parsed
+            self.results.put(_Fatal({"status": e.status_code, "error": e.to_dict()}))
+        except Exception as e:
+            if not self.stopped.is_set():
+                logger.error(f"Bulk {self.service} stream failed while reading: {str(e)}")
+                self.results.put(_Fatal({"status": 400, "error": {"error": "Unreadable request body"}}))
+        finally:
+            connections.close_all()
+            self.executor.shutdown(wait=True)
+            self.results.put(_END)
+
+    def _prepare(self, number, line):
+        """(arguments, record id) for a valid line, or its error output"""
+        if isinstance(line, LineTooLong):
+            return _output(number, None, status=413, error={"error": "Line too long", "message": str(line)})
+        try:
+            data = json.loads(line)
+        except (UnicodeDecodeError, ValueError) as e:
+            return _output(number, None, status=400, error={"error": "Invalid JSON", "message": str(e)})
+        if not isinstance(data, dict):
+            return _output(
+                number, None, status=400, error={"error": "Invalid JSON", "message": "Each line must be a JSON object"},
+            )
+        record_id = data.pop("id", None)
+        serializer = get_serializer(self.service, data, api_key=self.api_key)
+        if not serializer.is_valid():
+            return _output(number, record_id, status=400, error=serializer.errors)
+        return plain_arguments(serializer.validated_data), record_id
+
+    def _run(self, number, arguments, record_id):
+        if self.stopped.is_set():
+            return
+        started = time.perf_counter()
+        _, runner = SERVICES[self.service]
+        status = 200
+        # Calls still waiting for the model are abandoned when the stream stops
+        with invocation_context(self.tenant, cancelled=self.stopped, **self.hints) as context:
+            try:
+                result = runner(arguments)
+                if isinstance(result, dict) and "error" in result:
+                    status = 500
+                    output = _output(number, record_id, status=status, error=result)
+                else:
+                    if context.calls and isinstance(result, dict):
+                        result["metadata"] = context.metadata()
+                    output = _output(number, record_id, result=result)
+            except ServiceError as e:
+                status = e.status_code
+                output = _output(number, record_id, status=status, error=e.to_dict())
+            except Exception as e:
+                logger.error(f"Bulk {self.service} line {number} failed: {str(e)}")
+                status = 500
+                output = _output(number, record_id, status=status, error={"error": "Processing failed", "message": str(e)})
+        record_usage(self.api_key, self.service, status, (time.perf_counter() - started) * 1000, context.calls)
+        self.results.put((number, output))
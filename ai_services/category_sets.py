@@ -0,0 +1,105 @@
+"""
+Registry of classification category sets.
+Clients register a named list of categories once per API key and classify against it by
+category_set_id. The prompt block and the normalized label lookup are computed when the set
+is stored, so classification requests neither resend nor re-render the categories. Sets with
+nested `children` are compiled level by level and classified hierarchically.
+"""
+import logging
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .exceptions import CategorySetQuotaExceeded, CategorySetTooLarge
+from .logic.text_chunker import estimate_tokens
+from .logic.text_classifier import build_lookup, render_category_block
+from .logic.token_budget import get_token_budget
+from .models import CategorySet
+
+logger = logging.getLogger(__name__)
+
+
+def compile_categories(categories):
+    """
+    Return (prompt block, lookup table, subtrees) for a list of category dicts.
+    `subtrees` maps the name of each category with children to the same three parts
+    for its children.
+    """
+    subtrees = {}
+    for category in categories:
+        if category.get("children"):
+            prompt_block, lookup, children = compile_categories(category["children"])
+            subtrees[category["name"]] = {"prompt_block": prompt_block, "lookup": lookup, "subtrees": children}
+    return render_category_block(categories), build_lookup([category["name"] for category in categories]), subtrees
+
+
+def count_categories(categories):
+    """Number of categories in a list, subcategories included"""
+    return sum(1 + count_categories(category.get("children", [])) for category in categories)
+
+
+def largest_prompt_block(prompt_block, subtrees):
+    """Estimated tokens of the largest prompt block of a compiled set, over every level"""
+    return max(
+        [estimate_tokens(prompt_block)]
+        + [largest_prompt_block(node["prompt_block"], node["subtrees"]) for node in subtrees.values()]
+    )
+
+
+def store_category_set(api_key, name, categories):
+    """
+    Register categories under `name` for the API key and return (category_set, created).
+    Registering an existing name replaces its categories and keeps its ID. A set whose
+    categories alone would not fit in the classify input budget (at any level) is rejected
+    here, rather than with every classification request.
+    """
+    prompt_block, lookup, subtrees = compile_categories(categories)
+    estimated = largest_prompt_block(prompt_block, subtrees)
+    limit = get_token_budget("classify")["input"]
+    if estimated > limit:
+        raise CategorySetTooLarge(
+            f"The categories are estimated at {estimated} tokens per prompt; the classify limit is {limit}",
+            estimated_input_tokens=estimated,
+            input_token_limit=limit,
+        )
+    fields = {"categories": categories, "prompt_block": prompt_block, "lookup": lookup, "subtrees": subtrees}
+
+    existing = CategorySet.objects.filter(api_key=api_key, name=name).first()
+    if existing is not None:
+        for field, value in fields.items():
+            setattr(existing, field, value)
+        existing.save()
+        return existing, False
+
+    if CategorySet.objects.filter(api_key=api_key).count() >= settings.CATEGORY_SET_MAX_COUNT:
+        raise CategorySetQuotaExceeded(
+            f"At most {settings.CATEGORY_SET_MAX_COUNT} category sets can be registered per API key",
+            limit_category_sets=settings.CATEGORY_SET_MAX_COUNT,
+        )
+    try:
+        with transaction.atomic():
+            return CategorySet.objects.create(api_key=api_key, name=name, **fields), True
+    except IntegrityError:
+        # Registered concurrently under the same name
+        return store_category_set(api_key, name, categories)
+
+
+def get_category_set(api_key, category_set_id):
+    """Return the category set owned by api_key, or None"""
+    if api_key is None:
+        return None
+    return CategorySet.objects.filter(api_key=api_key, id=category_set_id).first()
+
+
+def describe_category_set(category_set, include_categories=False):
+    data = {
+        "category_set_id": str(category_set.id),
+        "name": category_set.name,
+        "category_count": count_categories(category_set.categories),
+        "hierarchical": bool(category_set.subtrees),
+        "created_at": category_set.created_at.isoformat(),
+        "updated_at": category_set.updated_at.isoformat(),
+    }
+    if include_categories:
+        data["categories"] = category_set.categories
+    return data
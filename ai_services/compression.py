@@ -0,0 +1,229 @@
+"""
+HTTP body compression.
+Request bodies sent with `Content-Encoding: gzip`, `deflate` or `br` are decompressed while
+they are read, and reading fails once the decompressed size passes
+REQUEST_DECOMPRESSED_MAX_BYTES, so a small compressed body cannot expand into an
+arbitrarily large one. Responses are compressed with the best encoding the client accepts.
+Brotli needs the `brotli` package; without it only gzip and deflate are available. Brotli
+request bodies also need brotli 1.2 or later, the first release that can bound the output
+of a decompression call; with older releases they are rejected with 415.
+"""
+import re
+import zlib
+
+from .exceptions import MalformedRequestBody, RequestBodyTooLarge, UnsupportedContentEncoding
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BROTLI_BOUNDED = brotli is not None and hasattr(brotli.Decompressor, "can_accept_more_data")
+
+# Decompressed bytes produced per read from the decoder
+READ_SIZE = 64 * 1024
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # quality 11 is several times slower for a few percent
+
+# Response types worth compressing; HTML pages carry CSRF tokens and API keys (BREACH)
+COMPRESSIBLE_TYPES = {"application/json", "application/x-ndjson", "text/plain", "text/csv"}
+
+
+def request_encodings():
+    encodings = ["gzip", "deflate"]
+    if BROTLI_BOUNDED:
+        encodings.append("br")
+    return encodings
+
+
+class _ZlibDecoder:
+    # Bounded output per call; input the decoder has not consumed yet stays in unconsumed_tail
+    input_size = READ_SIZE
+
+    def __init__(self, wbits):
+        self._obj = zlib.decompressobj(wbits)
+
+    def needs_input(self):
+        return not self._obj.unconsumed_tail
+
+    def decompress(self, data, max_length):
+        try:
+            return self._obj.decompress(self._obj.unconsumed_tail + data, max_length)
+        except zlib.error as e:
+            raise MalformedRequestBody(f"Invalid compressed request body: {str(e)}")
+
+    def finished(self):
+        return self._obj.eof
+
+
+class _BrotliDecoder:
+    # Bounded output per call; the decoder keeps the input it has not decoded yet, and is
+    # called with empty input until it has no output left before it is given more
+    input_size = READ_SIZE
+
+    def __init__(self):
+        self._obj = brotli.Decompressor()
+        self._drained = True
+
+    def needs_input(self):
+        return self._drained and self._obj.can_accept_more_data()
+
+    def decompress(self, data, max_length):
+        try:
+            output = self._obj.process(data, output_buffer_limit=max_length)
+        except brotli.error as e:
+            raise MalformedRequestBody(f"Invalid compressed request body: {str(e)}")
+        self._drained = not output
+        return output
+
+    def finished(self):
+        return self._obj.is_finished()
+
+
+def _decoder(encoding):
+    if encoding == "gzip" or encoding == "x-gzip":
+        return _ZlibDecoder(16 + zlib.MAX_WBITS)
+    if encoding == "deflate":
+        return _ZlibDecoder(zlib.MAX_WBITS)
+    if encoding == "br" and BROTLI_BOUNDED:
+        return _BrotliDecoder()
+    raise UnsupportedContentEncoding(
+        f"Content-Encoding '{encoding}' is not supported", supported=request_encodings(),
+    )
+
+
+class DecompressingStream:
+    """File-like reader over a compressed stream that fails past `max_bytes` of output (None: no limit)"""
+
+    def __init__(self, stream, encoding, max_bytes):
+        self.stream = stream
+        self.decoder = _decoder(encoding)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.buffer = b""
+        self.eof = False
+
+    def _fill(self):
+        if self.decoder.needs_input():
+            data = self.stream.read(self.decoder.input_size)
+            if not data:
+                self.eof = True
+                if not self.decoder.finished():
+                    raise MalformedRequestBody("Compressed request body is truncated")
+                return
+        else:
+            data = b""
+        output = self.decoder.decompress(data, READ_SIZE)
+        self.size += len(output)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            raise RequestBodyTooLarge(
+                f"Decompressed request body exceeds the {self.max_bytes} byte limit", max_bytes=self.max_bytes,
+            )
+        self.buffer += output
+        if self.decoder.finished():
+            self.eof = True
+
+    def read(self, size=-1):
+        unbounded = size is None or size < 0
+        while not self.eof and (unbounded or len(self.buffer) < size):
+            self._fill()
+        if unbounded:
+            data, self.buffer = self.buffer, b""
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def readline(self, size=-1):
+        while not self.eof and b"\n" not in self.buffer and (size is None or size < 0 or len(self.buffer) < size):
+            self._fill()
+        end = self.buffer.find(b"\n") + 1 or len(self.buffer)
+        if size is not None and size >= 0:
+            end = min(end, size)
+        data, self.buffer = self.buffer[:end], self.buffer[end:]
+        return data
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+
+def negotiate_encoding(accept_encoding):
+    """The preferred response encoding allowed by an Accept-Encoding header, or None"""
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        match = re.search(r"q=([0-9.]+)", params)
+        if match:
+            try:
+                q = float(match.group(1))
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best, best_q = None, 0.0
+    for encoding in candidates:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class _GzipCompressor:
+    def __init__(self):
+        self._obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        # Sync flush so each streamed chunk reaches the client without waiting for the next
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._obj.flush()
+
+
+class _BrotliCompressor:
+    def __init__(self):
+        self._obj = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data):
+        return self._obj.process(data) + self._obj.flush()
+
+    def finish(self):
+        return self._obj.finish()
+
+
+def compressor(encoding):
+    return _BrotliCompressor() if encoding == "br" else _GzipCompressor()
+
+
+def compress_bytes(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return obj.compress(data) + obj.flush()
+
+
+def compress_chunks(chunks, encoding):
+    obj = compressor(encoding)
+    for chunk in chunks:
+        data = obj.compress(chunk)
+        if data:
+            yield data
+    yield obj.finish()
+
+
+async def acompress_chunks(chunks, encoding):
+    obj = compressor(encoding)
+    async for chunk in chunks:
+        data = obj.compress(chunk)
+        if data:
+            yield data
+    yield obj.finish()
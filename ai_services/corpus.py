@@ -0,0 +1,154 @@
+"""
+Offline corpus processing for `manage.py process_corpus`.
+Records are read from JSONL or CSV files, validated and prepared like API requests (in a
+process pool when one is configured), run directly through the service registry and
+written to a JSONL output. A checkpoint next to the output records which records are done,
+so an interrupted run resumes where it stopped without duplicating output.
+"""
+import csv
+import json
+import os
+import sys
+import threading
+import time
+
+from .logic.text_chunker import chunk_text
+from .services import get_serializer, plain_arguments
+
+CSV_EXTENSIONS = (".csv",)
+
+
+class RecordError(Exception):
+    """A record that cannot be run; reported in the output instead of its result"""
+
+    def __init__(self, error):
+        super().__init__(str(error))
+        self.error = error
+
+
+def input_format(path):
+    return "csv" if path.lower().endswith(CSV_EXTENSIONS) else "jsonl"
+
+
+def _csv_value(value):
+    # Cells holding JSON lists or objects (e.g. categories) are decoded
+    if value and value[0] in "[{":
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    return value
+
+
+def read_records(path, fmt=None):
+    """(index, record dict or RecordError) for every record of a JSONL or CSV file"""
+    fmt = fmt or input_format(path)
+    with open(path, newline="" if fmt == "csv" else None, encoding="utf-8") as f:
+        if fmt == "csv":
+            csv.field_size_limit(sys.maxsize)
+            for index, row in enumerate(csv.DictReader(f)):
+                yield index, {name: _csv_value(value) for name, value in row.items() if value != ""}
+            return
+        index = 0
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("Each line must be a JSON object")
+            except ValueError as e:
+                record = RecordError({"error": "Invalid JSON", "message": str(e)})
+            yield index, record
+            index += 1
+
+
+def prepare_record(service, record, api_key=None):
+    """
+    Validate a record with the service's serializer and return plain arguments for
+    run_service. CPU-bound preparation (chunking texts for map_reduce and refine summaries)
+    happens here, so it can run in a worker process.
+    """
+    serializer = get_serializer(service, record, api_key=api_key)
+    if not serializer.is_valid():
+        raise RecordError(serializer.errors)
+    arguments = plain_arguments(serializer.validated_data)
+    if service == "summarize" and arguments.get("method") != "stuff" and arguments.get("chunks") is None:
+        arguments["chunks"] = chunk_text(arguments["text"])
+    return arguments
+
+
+class RateLimiter:
+    """Spaces out acquire() calls to at most `rate` per second across threads"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.next_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class Checkpoint:
+    """
+    Which records of an input are done, and how much of the output they account for.
+    Records below `next_index` are all done; `done` holds the ones completed out of order
+    above it, so its size stays within the number of records in flight.
+    """
+
+    def __init__(self, path, input_path, service, next_index=0, done=(), output_bytes=0, complete=False):
+        self.path = path
+        self.input_path = os.path.abspath(input_path)
+        self.service = service
+        self.next_index = next_index
+        self.done = set(done)
+        self.output_bytes = output_bytes
+        self.complete = complete
+
+    @classmethod
+    def load(cls, path, input_path, service):
+        """The saved checkpoint, or None; raises ValueError when it belongs to another run"""
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        checkpoint = cls(path, input_path, service, data["next_index"], data["done"], data["output_bytes"],
+                         data.get("complete", False))
+        if data["input"] != checkpoint.input_path or data["service"] != service:
+            raise ValueError(f"Checkpoint {path} is for {data['service']} over {data['input']}")
+        return checkpoint
+
+    def is_done(self, index):
+        return index < self.next_index or index in self.done
+
+    def mark(self, index):
+        self.done.add(index)
+        while self.next_index in self.done:
+            self.done.remove(self.next_index)
+            self.next_index += 1
+
+    def save(self, output_bytes, complete=False):
+        """Write atomically; the output must already be flushed up to output_bytes"""
+        self.output_bytes = output_bytes
+        self.complete = complete
+        data = {
+            "input": self.input_path,
+            "service": self.service,
+            "next_index": self.next_index,
+            "done": sorted(self.done),
+            "output_bytes": output_bytes,
+            "complete": complete,
+        }
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
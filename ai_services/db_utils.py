@@ -74,6 +74,13 @@ def safe_database_operation(operation, *args, **kwargs):
     
     return None
 
+def database_pool_stats():
+    """Statistics of the psycopg connection pool, or None when pooling is off"""
+    pool = getattr(connection, 'pool', None)
+    if pool is None:
+        return None
+    return pool.get_stats()
+
 def check_database_health():
     """
     Comprehensive database health check with detailed error reporting
@@ -111,6 +118,8 @@ def check_database_health():
                 health_status['error'] += " (Check database credentials)"
             return health_status
         
+        health_status['pool'] = database_pool_stats()
+
         # Check if tables exist
         table_names = connection.introspection.table_names()
         health_status['tables_exist'] = len(table_names) > 0
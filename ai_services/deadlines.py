@@ -0,0 +1,94 @@
+"""
+Client deadlines and disconnects.
+Clients bound how long they will wait with `X-Request-Timeout` (seconds from arrival) or
+`X-Request-Deadline` (Unix time in seconds); when both are sent the earlier one wins. The
+deadline is kept as a time.monotonic() value on the request and in the invocation context,
+where it caps queueing for a concurrency slot and the upstream timeout of every LLM call.
+Under ASGI, DisconnectWatcher sets a per-request event when the client goes away, so LLM
+calls still in flight are abandoned instead of awaited.
+"""
+import math
+import threading
+import time
+
+from .exceptions import InvalidDeadline
+
+TIMEOUT_HEADER = "X-Request-Timeout"
+DEADLINE_HEADER = "X-Request-Deadline"
+
+# ASGI scope keys set by DisconnectWatcher
+RECEIVED_AT_KEY = "ai_services.received_at"
+CANCELLED_KEY = "ai_services.cancelled"
+
+
+def _header_seconds(request, header):
+    value = request.headers.get(header)
+    if value is None:
+        return None
+    try:
+        seconds = float(value.strip())
+    except ValueError:
+        raise InvalidDeadline(f"{header} must be a number of seconds")
+    if not math.isfinite(seconds) or seconds < 0:
+        raise InvalidDeadline(f"{header} must be a non-negative number of seconds")
+    return seconds
+
+
+def received_at(request):
+    """time.monotonic() when the request arrived (when the ASGI server handed it over, if known)"""
+    return getattr(request, "scope", {}).get(RECEIVED_AT_KEY) or time.monotonic()
+
+
+def request_deadline(request):
+    """The client's deadline as a time.monotonic() value, or None when it did not send one"""
+    timeout = _header_seconds(request, TIMEOUT_HEADER)
+    deadline = _header_seconds(request, DEADLINE_HEADER)
+    candidates = []
+    if timeout is not None:
+        candidates.append(received_at(request) + timeout)
+    if deadline is not None:
+        # Wall clock to monotonic; relies on the client's clock being roughly in sync
+        candidates.append(time.monotonic() + deadline - time.time())
+    return min(candidates) if candidates else None
+
+
+def cancellation_event(request):
+    """threading.Event set when the client disconnects (ASGI only), or None"""
+    return getattr(request, "scope", {}).get(CANCELLED_KEY)
+
+
+class DisconnectWatcher:
+    """
+    ASGI wrapper (see service_hub/asgi.py) that records when each HTTP request arrived and
+    sets its cancellation event if the client disconnects before the response is complete.
+    Django cancels the request's task on disconnect, but a sync view keeps running in its
+    thread; the event is how that thread finds out.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        cancelled = threading.Event()
+        scope = dict(scope)
+        scope[RECEIVED_AT_KEY] = time.monotonic()
+        scope[CANCELLED_KEY] = cancelled
+        completed = False
+
+        async def watched_receive():
+            message = await receive()
+            # Servers also report a disconnect after a complete response; that one is harmless
+            if message["type"] == "http.disconnect" and not completed:
+                cancelled.set()
+            return message
+
+        async def watched_send(message):
+            nonlocal completed
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                completed = True
+            await send(message)
+
+        return await self.app(scope, watched_receive, watched_send)
@@ -0,0 +1,119 @@
+"""
+Server-side document store.
+Large texts are uploaded once per API key, stored compressed with their chunking precomputed,
+and referenced by doc_id from the service endpoints.
+"""
+import hashlib
+import logging
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .exceptions import DocumentTooLarge, DocumentQuotaExceeded
+from .logic.text_chunker import chunk_spans, estimate_tokens
+from .models import Document
+
+logger = logging.getLogger(__name__)
+
+
+def active_documents(api_key):
+    """Documents owned by the API key that have not expired yet"""
+    return Document.objects.filter(api_key=api_key, expires_at__gt=timezone.now())
+
+
+def purge_expired_documents(api_key=None):
+    """Delete expired documents, optionally only those of one API key"""
+    expired = Document.objects.filter(expires_at__lte=timezone.now())
+    if api_key is not None:
+        expired = expired.filter(api_key=api_key)
+    deleted, _ = expired.delete()
+    if deleted:
+        logger.info(f"Purged {deleted} expired documents")
+    return deleted
+
+
+def _expiry(ttl_seconds):
+    ttl = ttl_seconds or settings.DOCUMENT_DEFAULT_TTL_SECONDS
+    ttl = min(ttl, settings.DOCUMENT_MAX_TTL_SECONDS)
+    return timezone.now() + timedelta(seconds=ttl)
+
+
+def store_document(api_key, text, ttl_seconds=None):
+    """
+    Store text for the API key and return (document, created).
+    Uploading the same text again refreshes its expiry instead of storing a second copy.
+    """
+    raw = text.encode('utf-8')
+    if len(raw) > settings.DOCUMENT_MAX_BYTES:
+        raise DocumentTooLarge(
+            f"Documents are limited to {settings.DOCUMENT_MAX_BYTES} bytes",
+            size_bytes=len(raw),
+            limit_bytes=settings.DOCUMENT_MAX_BYTES,
+        )
+
+    purge_expired_documents(api_key)
+
+    content_hash = hashlib.sha256(raw).hexdigest()
+    existing = Document.objects.filter(api_key=api_key, content_hash=content_hash).first()
+    if existing is not None:
+        existing.expires_at = _expiry(ttl_seconds)
+        existing.save(update_fields=['expires_at'])
+        return existing, False
+
+    content = zlib.compress(raw, settings.DOCUMENT_COMPRESSION_LEVEL)
+
+    documents = active_documents(api_key)
+    if documents.count() >= settings.DOCUMENT_MAX_COUNT:
+        raise DocumentQuotaExceeded(
+            f"At most {settings.DOCUMENT_MAX_COUNT} documents can be stored per API key",
+            limit_documents=settings.DOCUMENT_MAX_COUNT,
+        )
+    used = documents.aggregate(total=Sum('stored_bytes'))['total'] or 0
+    if used + len(content) > settings.DOCUMENT_QUOTA_BYTES:
+        raise DocumentQuotaExceeded(
+            f"Storing this document would exceed the {settings.DOCUMENT_QUOTA_BYTES} byte quota",
+            used_bytes=used,
+            limit_bytes=settings.DOCUMENT_QUOTA_BYTES,
+        )
+
+    try:
+        with transaction.atomic():
+            document = Document.objects.create(
+                api_key=api_key,
+                content=content,
+                content_hash=content_hash,
+                size_bytes=len(raw),
+                stored_bytes=len(content),
+                token_count=estimate_tokens(text),
+                chunks=chunk_spans(text, settings.DOCUMENT_CHUNK_TOKENS),
+                expires_at=_expiry(ttl_seconds),
+            )
+    except IntegrityError:
+        # The same text was uploaded concurrently; refresh and return that copy
+        return store_document(api_key, text, ttl_seconds)
+    document._text = text
+    return document, True
+
+
+def get_document(api_key, doc_id):
+    """Return the active document with doc_id owned by api_key, or None"""
+    if api_key is None:
+        return None
+    return active_documents(api_key).filter(id=doc_id).first()
+
+
+def describe_document(document):
+    """Public metadata for a document (never includes the text itself)"""
+    return {
+        'doc_id': str(document.id),
+        'size_bytes': document.size_bytes,
+        'stored_bytes': document.stored_bytes,
+        'token_count': document.token_count,
+        'chunk_count': len(document.chunks),
+        'created_at': document.created_at.isoformat(),
+        'expires_at': document.expires_at.isoformat(),
+    }
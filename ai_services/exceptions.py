@@ -0,0 +1,117 @@
+"""
+Exceptions raised by the service layer that map to specific HTTP responses
+"""
+import math
+
+
+class ServiceError(Exception):
+    """Base class for errors that carry their own HTTP status and error payload"""
+    status_code = 500
+    error = 'Service error'
+
+    def __init__(self, message=None, retry_after=None, **details):
+        self.message = message or self.error
+        self.retry_after = retry_after
+        self.details = details
+        super().__init__(self.message)
+
+    def to_dict(self):
+        data = {'error': self.error, 'message': self.message}
+        data.update(self.details)
+        return data
+
+    def headers(self):
+        """Extra response headers (Retry-After when the client should come back later)"""
+        if self.retry_after is None:
+            return {}
+        return {'Retry-After': str(max(1, math.ceil(self.retry_after)))}
+
+
+class DocumentTooLarge(ServiceError):
+    status_code = 413
+    error = 'Document too large'
+
+
+class DocumentQuotaExceeded(ServiceError):
+    status_code = 413
+    error = 'Document quota exceeded'
+
+
+class RequestBodyTooLarge(ServiceError):
+    status_code = 413
+    error = 'Request body too large'
+
+
+class TokenBudgetExceeded(ServiceError):
+    status_code = 413
+    error = 'Input too large'
+
+
+class UpstreamTimeout(ServiceError):
+    status_code = 504
+    error = 'Upstream timeout'
+
+
+class ProvidersUnavailable(ServiceError):
+    status_code = 503
+    error = 'Service unavailable'
+
+
+class ServiceOverloaded(ServiceError):
+    status_code = 503
+    error = 'Service overloaded'
+
+
+class MalformedRequestBody(ServiceError):
+    status_code = 400
+    error = 'Malformed request body'
+
+
+class UnsupportedContentEncoding(ServiceError):
+    status_code = 415
+    error = 'Unsupported content encoding'
+
+
+class InvalidIdempotencyKey(ServiceError):
+    status_code = 400
+    error = 'Invalid idempotency key'
+
+
+class IdempotencyKeyInProgress(ServiceError):
+    status_code = 409
+    error = 'Request in progress'
+
+
+class IdempotencyKeyReused(ServiceError):
+    status_code = 422
+    error = 'Idempotency key reused'
+
+
+class CategorySetQuotaExceeded(ServiceError):
+    status_code = 409
+    error = 'Category set quota exceeded'
+
+
+class CategorySetTooLarge(ServiceError):
+    status_code = 422
+    error = 'Category set too large'
+
+
+class InvalidDeadline(ServiceError):
+    status_code = 400
+    error = 'Invalid deadline'
+
+
+class RequestAbandoned(ServiceError):
+    """The client no longer wants the answer; says nothing about the health of the upstream"""
+
+
+class DeadlineExceeded(RequestAbandoned):
+    status_code = 504
+    error = 'Deadline exceeded'
+
+
+class RequestCancelled(RequestAbandoned):
+    # Nobody reads the response; 499 (client closed request) keeps these apart in logs and metrics
+    status_code = 499
+    error = 'Request cancelled'
@@ -0,0 +1,143 @@
+"""
+Idempotency keys for the service endpoints.
+A request sent with an `Idempotency-Key` header claims that key for its API key, and its
+response is stored for IDEMPOTENCY_TTL_SECONDS and replayed to retries of the same request.
+A retry that arrives while the original is still running waits for its result instead of
+calling the LLM again; reusing a key for a different request is rejected.
+"""
+import hashlib
+import json
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.response import Response
+
+from .exceptions import (
+    DeadlineExceeded, IdempotencyKeyInProgress, IdempotencyKeyReused, InvalidIdempotencyKey, RequestCancelled,
+)
+from .models import IdempotencyRecord
+
+logger = logging.getLogger(__name__)
+
+# Responses worth retrying are not stored; the key is released so the retry runs again.
+# That includes requests the client abandoned (disconnect or deadline): nobody saw their
+# response, and the retry is how the client still gets an answer.
+RETRYABLE_STATUSES = {408, 409, 425, 429, RequestCancelled.status_code, DeadlineExceeded.status_code}
+
+
+class Replay(Exception):
+    """Raised by begin_request() when a stored response answers the request"""
+
+    def __init__(self, record):
+        super().__init__(record.key)
+        self.record = record
+
+    def response(self):
+        return Response(
+            self.record.response_body,
+            status=self.record.response_status,
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+
+def request_hash(endpoint, data, query_params):
+    """Fingerprint of a request's parsed body and query string"""
+    payload = {
+        "endpoint": endpoint,
+        "data": {name: value for name, value in data.items() if name != "api_key"},
+        "query": {name: query_params.getlist(name) for name in query_params},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def purge_expired_records(api_key=None):
+    """Delete idempotency records past their retention window"""
+    expired = IdempotencyRecord.objects.filter(expires_at__lte=timezone.now())
+    if api_key is not None:
+        expired = expired.filter(api_key=api_key)
+    deleted, _ = expired.delete()
+    return deleted
+
+
+def begin_request(api_key, key, endpoint, fingerprint):
+    """
+    Claim `key` for this request and return its record, or raise Replay when the request
+    has already completed. Waits up to IDEMPOTENCY_WAIT_SECONDS while another request
+    holds the key.
+    """
+    if not key or len(key) > 255:
+        raise InvalidIdempotencyKey("Idempotency-Key must be 1 to 255 characters")
+
+    purge_expired_records(api_key)
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    delay = 0.05
+    while True:
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                return IdempotencyRecord.objects.create(
+                    api_key=api_key,
+                    key=key,
+                    endpoint=endpoint,
+                    request_hash=fingerprint,
+                    locked_at=now,
+                    expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_TTL_SECONDS),
+                )
+        except IntegrityError:
+            pass
+
+        record = IdempotencyRecord.objects.filter(api_key=api_key, key=key).first()
+        if record is None:
+            # Released by a failed request in the meantime; claim it again
+            continue
+        if record.endpoint != endpoint or record.request_hash != fingerprint:
+            raise IdempotencyKeyReused(
+                "This Idempotency-Key was already used for a different request",
+                idempotency_key=key,
+            )
+        if record.status == IdempotencyRecord.COMPLETED:
+            raise Replay(record)
+
+        # The request holding the key died without completing or releasing it
+        stale_before = now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+        if record.locked_at <= stale_before and IdempotencyRecord.objects.filter(
+            pk=record.pk, status=IdempotencyRecord.IN_PROGRESS, locked_at=record.locked_at,
+        ).update(locked_at=now):
+            logger.warning(f"Taking over stale idempotency key {key} for {endpoint}")
+            record.locked_at = now
+            return record
+
+        if time.monotonic() + delay > deadline:
+            raise IdempotencyKeyInProgress(
+                "A request with this Idempotency-Key is still being processed",
+                retry_after=1,
+                idempotency_key=key,
+            )
+        time.sleep(delay)
+        delay = min(delay * 2, 1.0)
+
+
+def finish_request(record, response, abandoned=False):
+    """
+    Store the response for replay, or release the key when the request should be retried.
+    `abandoned` is set when the request ended in RequestAbandoned, whatever its status.
+    """
+    if abandoned or response.status_code >= 500 or response.status_code in RETRYABLE_STATUSES:
+        release_request(record)
+        return
+    IdempotencyRecord.objects.filter(pk=record.pk).update(
+        status=IdempotencyRecord.COMPLETED,
+        response_status=response.status_code,
+        response_body=getattr(response, "data", None),
+    )
+
+
+def release_request(record):
+    # Unless another request has taken the key over in the meantime
+    IdempotencyRecord.objects.filter(
+        pk=record.pk, status=IdempotencyRecord.IN_PROGRESS, locked_at=record.locked_at,
+    ).delete()
@@ -0,0 +1,197 @@
+"""
+Database-backed job queue for long-running service requests.
+Jobs are submitted by the API and executed by `manage.py run_jobs` workers, which claim
+them with SELECT ... FOR UPDATE SKIP LOCKED where the database supports it. Every claim gets
+its own lock token, and a worker refreshes locked_at of its running jobs as a heartbeat;
+jobs without a heartbeat for JOB_LOCK_TIMEOUT_SECONDS are re-queued, and results of a claim
+that was taken away are dropped.
+"""
+import logging
+import random
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .exceptions import ServiceError
+from .logic.concurrency import BULK, tenant_for
+from .models import Job
+from .services import get_serializer, plain_arguments, run_service
+
+logger = logging.getLogger(__name__)
+
+ROUTING_HINTS = ("quality", "latency")
+
+
+class JobFailed(Exception):
+    """Raised by execute_job when a job should not be retried"""
+
+
+def submit_job(api_key, service, payload):
+    return Job.objects.create(
+        api_key=api_key,
+        service=service,
+        payload=payload,
+        max_attempts=settings.JOB_MAX_ATTEMPTS,
+        run_after=timezone.now(),
+    )
+
+
+def claim_jobs(worker_id, limit):
+    """Atomically claim up to `limit` runnable jobs for this worker"""
+    now = timezone.now()
+    with transaction.atomic():
+        runnable = Job.objects.filter(status=Job.QUEUED, run_after__lte=now).order_by('run_after')
+        if connection.features.has_select_for_update_skip_locked:
+            runnable = runnable.select_for_update(skip_locked=True)
+        candidates = list(runnable.values_list('id', flat=True)[:limit])
+
+        claimed = []
+        for job_id in candidates:
+            # The status check keeps claims safe on backends without SKIP LOCKED (SQLite)
+            updated = Job.objects.filter(id=job_id, status=Job.QUEUED).update(
+                status=Job.RUNNING, locked_by=worker_id, locked_at=now, lock_token=uuid.uuid4(),
+                attempts=F('attempts') + 1,
+            )
+            if updated:
+                claimed.append(job_id)
+
+    return list(Job.objects.filter(id__in=claimed).select_related('api_key'))
+
+
+def prepare_job(job):
+    """Validate the stored payload and return (plain arguments, routing hints)"""
+    serializer = get_serializer(job.service, job.payload, api_key=job.api_key)
+    if not serializer.is_valid():
+        raise JobFailed(f"Invalid payload: {serializer.errors}")
+    hints = {name: job.payload[name] for name in ROUTING_HINTS if job.payload.get(name)}
+    return plain_arguments(serializer.validated_data), hints
+
+
+def job_tenant(job):
+    """Jobs are scheduled as bulk work of their API key"""
+    return tenant_for(job.api_key, BULK)
+
+
+def execute_job(service, arguments, hints, tenant=None):
+    """
+    Run one job's service call. Kept free of database access so it can run in a worker process.
+    Raises JobFailed for errors that a retry cannot fix.
+    """
+    try:
+        result = run_service(service, arguments, tenant=tenant, **hints)
+    except ServiceError as e:
+        if e.status_code < 500:
+            raise JobFailed(e.message)
+        raise
+    if isinstance(result, dict) and "error" in result:
+        raise RuntimeError(result["error"])
+    return result
+
+
+def _owned(job):
+    """
+    The job's row while this claim still holds it; empty once the job was re-queued, even
+    when the same worker has claimed it again since
+    """
+    return Job.objects.filter(id=job.id, status=Job.RUNNING, lock_token=job.lock_token)
+
+
+def heartbeat_jobs(jobs):
+    """Refresh locked_at of the jobs this worker is still running, so they are not taken as stale"""
+    tokens = [job.lock_token for job in jobs]
+    if not tokens:
+        return 0
+    return Job.objects.filter(status=Job.RUNNING, lock_token__in=tokens).update(locked_at=timezone.now())
+
+
+def complete_job(job, result):
+    now = timezone.now()
+    updated = _owned(job).update(
+        status=Job.SUCCEEDED,
+        result=result,
+        error='',
+        finished_at=now,
+        expires_at=now + timedelta(seconds=settings.JOB_RESULT_TTL_SECONDS),
+    )
+    if not updated:
+        logger.warning(f"Job {job.id} finished after it was taken from worker {job.locked_by}; result dropped")
+
+
+def fail_job(job, error, retryable=True):
+    """Record a failed attempt, re-queueing with exponential backoff while attempts remain"""
+    now = timezone.now()
+    if retryable and job.attempts < job.max_attempts:
+        delay = settings.JOB_RETRY_BASE_SECONDS * (2 ** (job.attempts - 1))
+        delay = delay * (1 + random.random() * 0.25)
+        updated = _owned(job).update(
+            status=Job.QUEUED,
+            error=str(error),
+            locked_by='',
+            locked_at=None,
+            lock_token=None,
+            run_after=now + timedelta(seconds=delay),
+        )
+        if updated:
+            logger.warning(f"Job {job.id} attempt {job.attempts} failed, retrying in {delay:.1f}s: {error}")
+        return
+    updated = _owned(job).update(
+        status=Job.FAILED,
+        error=str(error),
+        finished_at=now,
+        expires_at=now + timedelta(seconds=settings.JOB_RESULT_TTL_SECONDS),
+    )
+    if updated:
+        logger.error(f"Job {job.id} failed after {job.attempts} attempts: {error}")
+
+
+def requeue_stale_jobs():
+    """
+    Put back jobs whose worker stopped sending heartbeats while running them. Jobs that have
+    used all their attempts fail instead, so a job that keeps killing its worker is not run
+    forever.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT_SECONDS)
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED,
+        error='The worker running this job stopped responding',
+        locked_by='',
+        locked_at=None,
+        lock_token=None,
+        finished_at=now,
+        expires_at=now + timedelta(seconds=settings.JOB_RESULT_TTL_SECONDS),
+    )
+    if failed:
+        logger.error(f"Failed {failed} stale jobs that had no attempts left")
+    count = stale.update(status=Job.QUEUED, locked_by='', locked_at=None, lock_token=None)
+    if count:
+        logger.warning(f"Re-queued {count} stale jobs")
+    return count
+
+
+def purge_expired_jobs():
+    deleted, _ = Job.objects.filter(expires_at__lte=timezone.now()).delete()
+    if deleted:
+        logger.info(f"Purged {deleted} expired jobs")
+    return deleted
+
+
+def describe_job(job):
+    data = {
+        'job_id': str(job.id),
+        'service': job.service,
+        'status': job.status,
+        'attempts': job.attempts,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if job.status == Job.SUCCEEDED:
+        data['result'] = job.result
+    elif job.error:
+        data['error'] = job.error
+    return data
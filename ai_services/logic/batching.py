@@ -0,0 +1,232 @@
+"""
+Micro-batching of short, concurrent requests into one multi-item prompt.
+The first short request for a service opens a batch and waits up to max_wait_ms for
+compatible requests to join (same service, options and, unless cross_tenant is set, API key).
+The batch is then sent as one numbered prompt that asks for a JSON array of answers, and
+each answer is handed back to its waiting request. Requests whose answer is missing or
+unparseable fall back to an individual call, as does a batch of one.
+Opt-in through settings.AI_MICRO_BATCHING.
+"""
+
+import json
+import logging
+import threading
+
+from django.conf import settings
+from langchain_core.prompts import PromptTemplate
+
+from .. import metrics
+from ..exceptions import RequestAbandoned, ServiceError, TokenBudgetExceeded
+from .invocation import current_context, invocation_context, invoke_prompt
+from .model_router import choose_model
+from .text_chunker import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCHING = {
+    "enabled": False,
+    "services": ["sentiment", "detect_language", "classify"],
+    "max_items": 16,
+    "max_wait_ms": 20,
+    "max_item_tokens": 250,  # longer texts are always sent on their own
+    "cross_tenant": False,  # texts of different API keys never share a prompt by default
+}
+
+BATCH_TEMPLATE = """{instruction}
+
+Texts (JSON strings):
+{items}
+
+Respond with only a JSON array containing one object per text, in order, like:
+[{{"id": 1, "answer": "..."}}, {{"id": 2, "answer": "..."}}]"""
+
+
+def get_batching_config():
+    config = dict(DEFAULT_BATCHING)
+    config.update(getattr(settings, "AI_MICRO_BATCHING", {}))
+    return config
+
+
+def batch_service(service):
+    """Service name of batched calls; budgets and timeouts are configured under it"""
+    return f"{service}_batch"
+
+
+def format_items(texts):
+    return "\n".join(f"{number}. {json.dumps(text, ensure_ascii=False)}" for number, text in enumerate(texts, 1))
+
+
+def parse_answers(content, count):
+    """Answers by position from the model's JSON array; None where an answer is missing"""
+    answers = [None] * count
+    start, end = content.find("["), content.rfind("]")
+    if start == -1 or end < start:
+        return answers
+    try:
+        entries = json.loads(content[start:end + 1])
+    except ValueError:
+        return answers
+    if not isinstance(entries, list):
+        return answers
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        number, answer = entry.get("id"), entry.get("answer")
+        if isinstance(number, int) and 1 <= number <= count and isinstance(answer, str):
+            answers[number - 1] = answer
+    return answers
+
+
+class _Item:
+    __slots__ = ("text", "context", "answer", "error", "done")
+
+    def __init__(self, text, context):
+        self.text = text
+        self.context = context
+        self.answer = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class _Batch:
+    def __init__(self):
+        self.items = []
+        self.full = threading.Event()
+
+
+class MicroBatcher:
+    def __init__(self, max_items=16, max_wait_ms=20, max_item_tokens=250, cross_tenant=False, **_):
+        self.max_items = max_items
+        self.max_wait = max_wait_ms / 1000
+        self.max_item_tokens = max_item_tokens
+        self.cross_tenant = cross_tenant
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def answer(self, service, instruction, text, variables=None, temperature=0.0):
+        """
+        The raw model answer for `text` from a batched call, or None when the caller
+        should make its own call. Raises the ServiceError of a failed batch.
+        """
+        if estimate_tokens(text) > self.max_item_tokens:
+            return None
+        variables = variables or {}
+        context = current_context()
+        tenant = context.tenant if context is not None else None
+        key = (service, temperature, tuple(sorted(variables.items())),
+               None if self.cross_tenant or tenant is None else tenant.id)
+
+        item = _Item(text, context)
+        with self._lock:
+            batch = self._pending.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._pending[key] = _Batch()
+            batch.items.append(item)
+            if len(batch.items) >= self.max_items:
+                del self._pending[key]
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.max_wait)
+            with self._lock:
+                if self._pending.get(key) is batch:
+                    del self._pending[key]
+            self._run(service, instruction, variables, temperature, batch.items)
+        else:
+            item.done.wait()
+
+        if item.error is not None:
+            raise item.error
+        return item.answer
+
+    def _run(self, service, instruction, variables, temperature, items):
+        try:
+            if len(items) == 1:
+                return
+            self._run_batch(service, instruction, variables, temperature, items)
+        finally:
+            fallbacks = sum(item.answer is None and item.error is None for item in items)
+            if len(items) > 1:
+                metrics.llm_batched_items.inc(len(items) - fallbacks, service=service, outcome="batched")
+            metrics.llm_batched_items.inc(fallbacks, service=service, outcome="individual")
+            for item in items:
+                item.done.set()
+
+    def _run_batch(self, service, instruction, variables, temperature, items):
+        texts = [item.text for item in items]
+        prompt = PromptTemplate(
+            input_variables=["instruction", "items"],
+            template=BATCH_TEMPLATE,
+        )
+        batch_variables = dict(variables, instruction=instruction, items=format_items(texts), texts=texts)
+        leader_context = items[0].context
+        hints = leader_context.hints if leader_context is not None else {}
+        model = choose_model(
+            service, estimate_tokens(batch_variables["items"]), hints.get("quality"), hints.get("latency"),
+        )
+        # The call serves every member, so it must not stop for one client's deadline or
+        # disconnect: no cancellation, and the latest deadline (none if any member has none)
+        deadlines = [item.context.deadline if item.context is not None else None for item in items]
+        deadline = None if None in deadlines else max(deadlines)
+        tenant = leader_context.tenant if leader_context is not None else None
+        try:
+            with invocation_context(tenant, deadline=deadline, **hints) as batch_context:
+                result = invoke_prompt(
+                    batch_service(service), prompt, batch_variables,
+                    temperature=temperature, truncate_field=None, model=model,
+                )
+        except (TokenBudgetExceeded, RequestAbandoned):
+            # Every member falls back to its own call, under its own deadline
+            return
+        except ServiceError as e:
+            for item in items:
+                item.error = e
+            return
+        except Exception as e:
+            logger.warning(f"Batched {service} call for {len(items)} texts failed, calling individually: {str(e)}")
+            return
+
+        answers = parse_answers(result.content, len(items))
+        missing = answers.count(None)
+        if missing:
+            logger.warning(f"Batched {service} response had no usable answer for {missing} of {len(items)} texts")
+        for item, answer in zip(items, answers):
+            item.answer = answer
+        self._share_call(batch_context, items)
+
+    def _share_call(self, batch_context, items):
+        """Split the batch call's metadata evenly over the requests it answered"""
+        if not batch_context.calls:
+            return
+        record = batch_context.calls[-1]
+        count = len(items)
+        share = dict(record, batch_size=count)
+        for field in ("estimated_input_tokens", "input_tokens", "output_tokens"):
+            if share.get(field) is not None:
+                share[field] = share[field] // count
+        share["max_output_tokens"] = record["max_output_tokens"] // count
+        for item in items:
+            if item.context is not None:
+                item.context.calls.append(dict(share))
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher():
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = MicroBatcher(**get_batching_config())
+    return _batcher
+
+
+def batched_answer(service, instruction, text, variables=None, temperature=0.0):
+    """Raw answer from a micro-batch, or None when batching is off or the caller must call alone"""
+    config = get_batching_config()
+    if not config["enabled"] or service not in config["services"]:
+        return None
+    return get_batcher().answer(service, instruction, text, variables, temperature)
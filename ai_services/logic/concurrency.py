@@ -0,0 +1,353 @@
+"""
+Adaptive concurrency limit and fair scheduling for upstream LLM calls.
+Every invoke_prompt call holds a slot while it talks to the providers. The limit grows
+additively while calls succeed with the limit in use, and shrinks multiplicatively (AIMD)
+when a call fails, times out, or takes longer than latency_tolerance times the usual latency
+of its service and model (scaled by the output it asked for). Like TCP, it shrinks at most once per
+congestion window: calls that started before the last decrease cannot cause another one.
+
+Calls over the limit queue per tenant (API key) and are dispatched by weighted fair
+queueing: each call is tagged with a virtual finish time of start + cost / weight, where
+cost is its token estimate, and the smallest tag goes next. Interactive calls are always
+dispatched before bulk ones, and bulk calls never hold more than bulk_max_share of the
+limit, so interactive requests find a free slot while bulk work runs. Calls that wait
+longer than their class's queue timeout are shed with ServiceOverloaded (503 + Retry-After);
+calls whose client deadline comes first stop queueing then with DeadlineExceeded. Calls the
+client abandoned free their slot without adjusting the limit.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .. import metrics
+from ..exceptions import DeadlineExceeded, RequestAbandoned, ServiceOverloaded
+from ..timing import phase
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITY_CLASSES = (INTERACTIVE, BULK)  # in dispatch order
+
+DEFAULT_CONCURRENCY = {
+    "enabled": True,
+    "initial_limit": 20,
+    "min_limit": 2,
+    "max_limit": 200,
+    "backoff_ratio": 0.9,
+    "latency_tolerance": 2.0,  # slower than this multiple of the usual latency counts as congestion
+    "queue_timeout": 2.0,
+    "bulk_queue_timeout": 30.0,
+    "bulk_max_share": 0.75,
+    "max_queue": 50,
+    "bulk_max_queue": 200,  # bulk waiters have their own limit and never crowd out interactive calls
+    "retry_after": 2,
+}
+
+# Weight of a new sample in a service's usual latency, and samples needed before judging
+BASELINE_ALPHA = 0.05
+BASELINE_MIN_SAMPLES = 10
+# Requested output tokens that add one baseline's worth of expected latency
+BASELINE_OUTPUT_TOKENS = 256
+
+# Who an LLM call is made for; plain data so it can be passed to job worker processes
+Tenant = namedtuple("Tenant", ["id", "weight", "priority_class"])
+
+ANONYMOUS = Tenant("anonymous", 1, INTERACTIVE)
+
+
+def tenant_for(api_key, priority_class=None):
+    """Scheduling tenant for an APIKey (None for calls made outside a request)"""
+    if api_key is None:
+        return ANONYMOUS
+    return Tenant(str(api_key.pk), max(1, api_key.weight), priority_class or api_key.priority_class)
+
+
+def get_concurrency_config():
+    config = dict(DEFAULT_CONCURRENCY)
+    config.update(getattr(settings, "AI_CONCURRENCY", {}))
+    return config
+
+
+class _Waiter:
+    __slots__ = ("tenant", "start", "finish", "enqueued_at", "granted", "cancelled")
+
+    def __init__(self, tenant, start, finish):
+        self.tenant = tenant
+        self.start = start
+        self.finish = finish
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.cancelled = False
+
+
+class AdaptiveLimiter:
+    """Process-wide AIMD limit on concurrent upstream calls with a weighted fair queue"""
+
+    def __init__(self, enabled=True, initial_limit=20, min_limit=2, max_limit=200, backoff_ratio=0.9,
+                 latency_tolerance=2.0, queue_timeout=2.0, bulk_queue_timeout=30.0, bulk_max_share=0.75,
+                 max_queue=50, bulk_max_queue=200, retry_after=2):
+        self.enabled = enabled
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self.queue_timeouts = {INTERACTIVE: queue_timeout, BULK: bulk_queue_timeout}
+        self.bulk_max_share = bulk_max_share
+        self.max_queues = {INTERACTIVE: max_queue, BULK: bulk_max_queue}
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.queued = 0
+        self.shed = 0
+        self.baselines = {}  # (service, model) -> [usual latency per output unit, samples]
+        self.last_decrease = float("-inf")
+        self.class_in_flight = dict.fromkeys(PRIORITY_CLASSES, 0)
+        self.waiting = dict.fromkeys(PRIORITY_CLASSES, 0)
+        self.queues = {priority_class: [] for priority_class in PRIORITY_CLASSES}
+        self.virtual_time = dict.fromkeys(PRIORITY_CLASSES, 0.0)
+        self.last_finish = {priority_class: {} for priority_class in PRIORITY_CLASSES}
+        self.tenants = {}  # tenant id -> counters
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def _tenant_stats(self, tenant):
+        stats = self.tenants.get(tenant.id)
+        if stats is None:
+            stats = self.tenants[tenant.id] = {
+                "priority_class": tenant.priority_class, "weight": tenant.weight, "in_flight": 0,
+                "queued": 0, "calls": 0, "waits": 0, "wait_seconds": 0.0, "shed": 0,
+            }
+        return stats
+
+    def _can_start(self, priority_class):
+        limit = int(self.limit)
+        if self.in_flight >= limit:
+            return False
+        if priority_class == BULK:
+            return self.class_in_flight[BULK] < max(1, int(limit * self.bulk_max_share))
+        return True
+
+    def _start(self, tenant):
+        self.in_flight += 1
+        self.class_in_flight[tenant.priority_class] += 1
+        stats = self._tenant_stats(tenant)
+        stats["in_flight"] += 1
+        stats["calls"] += 1
+
+    def _dispatch(self):
+        """Hand free slots to queued calls: interactive first, smallest finish tag first"""
+        granted = False
+        for priority_class in PRIORITY_CLASSES:
+            queue = self.queues[priority_class]
+            while queue and self._can_start(priority_class):
+                _, _, waiter = heapq.heappop(queue)
+                if waiter.cancelled:
+                    continue
+                self.virtual_time[priority_class] = max(self.virtual_time[priority_class], waiter.start)
+                self.waiting[priority_class] -= 1
+                waiter.granted = True
+                self._start(waiter.tenant)
+                granted = True
+            if not self.waiting[priority_class]:
+                # Idle class: earlier bursts must not count against a tenant later
+                self.last_finish[priority_class].clear()
+        if granted:
+            self._condition.notify_all()
+
+    def acquire(self, service, tenant=None, cost=1, deadline=None):
+        """
+        Take a slot, queueing fairly behind other tenants; returns the seconds spent waiting.
+        `deadline` (time.monotonic()) is when the client stops waiting, if it said so.
+        """
+        tenant = tenant or ANONYMOUS
+        priority_class = tenant.priority_class if tenant.priority_class in PRIORITY_CLASSES else INTERACTIVE
+        tenant = tenant._replace(priority_class=priority_class)
+        with self._condition:
+            if not self.waiting[priority_class] and self._can_start(priority_class):
+                self._start(tenant)
+                return 0.0
+            stats = self._tenant_stats(tenant)
+            if self.waiting[priority_class] >= self.max_queues[priority_class]:
+                self._shed(service, stats)
+
+            last_finish = self.last_finish[priority_class]
+            start = max(self.virtual_time[priority_class], last_finish.get(tenant.id, 0.0))
+            waiter = _Waiter(tenant, start, start + max(1, cost) / tenant.weight)
+            last_finish[tenant.id] = waiter.finish
+            heapq.heappush(self.queues[priority_class], (waiter.finish, next(self._sequence), waiter))
+            self.waiting[priority_class] += 1
+            self.queued += 1
+            stats["queued"] += 1
+
+            shed_at = waiter.enqueued_at + self.queue_timeouts[priority_class]
+            give_up_at = shed_at if deadline is None else min(shed_at, deadline)
+            try:
+                while not waiter.granted:
+                    remaining = give_up_at - time.monotonic()
+                    if remaining <= 0:
+                        waiter.cancelled = True
+                        self.waiting[priority_class] -= 1
+                        if give_up_at < shed_at:
+                            metrics.deadline_rejections.inc(stage="queue")
+                            raise DeadlineExceeded("The request's deadline passed while waiting for the AI model")
+                        self._shed(service, stats)
+                    self._condition.wait(remaining)
+            finally:
+                self.queued -= 1
+                stats["queued"] -= 1
+            waited = time.monotonic() - waiter.enqueued_at
+            stats["waits"] += 1
+            stats["wait_seconds"] += waited
+        metrics.llm_queue_wait.observe(waited, priority_class=priority_class)
+        return waited
+
+    def _shed(self, service, stats):
+        self.shed += 1
+        stats["shed"] += 1
+        metrics.llm_shed.inc(service=service)
+        raise ServiceOverloaded(
+            "Too many requests are waiting for the AI model; retry shortly",
+            retry_after=self.retry_after,
+        )
+
+    def release(self, service, seconds, failed, tenant=None, abandoned=False, output_tokens=0, model=None):
+        tenant = tenant or ANONYMOUS
+        # Long generations are expected to take longer; the baseline is kept per output unit
+        scale = 1 + output_tokens / BASELINE_OUTPUT_TOKENS
+        with self._condition:
+            # The limit only grows when calls actually use it
+            saturated = self.in_flight * 2 >= self.limit
+            self.in_flight -= 1
+            priority_class = tenant.priority_class if tenant.priority_class in PRIORITY_CLASSES else INTERACTIVE
+            self.class_in_flight[priority_class] -= 1
+            self._tenant_stats(tenant)["in_flight"] -= 1
+            if abandoned:
+                # Cut short by the client, so it says nothing about congestion
+                self._dispatch()
+                return
+
+            # Models routed for the same service differ widely in latency
+            baseline = self.baselines.get((service, model))
+            slow = (
+                baseline is not None and baseline[1] >= BASELINE_MIN_SAMPLES
+                and seconds > baseline[0] * scale * self.latency_tolerance
+            )
+            now = time.monotonic()
+            if failed or slow:
+                # A burst of failures from one window of calls is one congestion signal
+                if now - seconds >= self.last_decrease:
+                    self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+                    self.last_decrease = now
+            elif saturated:
+                # About +1 per limit's worth of successful calls, like TCP congestion avoidance
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+            if not failed:
+                if baseline is None:
+                    self.baselines[(service, model)] = [seconds / scale, 1]
+                else:
+                    baseline[0] += BASELINE_ALPHA * (seconds / scale - baseline[0])
+                    baseline[1] += 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, service, tenant=None, cost=1, deadline=None, output_tokens=0, model=None):
+        """
+        Hold a slot for one upstream call; the call's latency and outcome adjust the limit.
+        `output_tokens` is how much output the call asked for and `model` the model it was
+        routed to, which together set its expected latency.
+        """
+        if not self.enabled:
+            yield
+            return
+        with phase("queue"):
+            self.acquire(service, tenant, cost, deadline)
+        started = time.monotonic()
+        failed = True
+        abandoned = False
+        try:
+            yield
+            failed = False
+        except RequestAbandoned:
+            abandoned = True
+            raise
+        finally:
+            self.release(service, time.monotonic() - started, failed, tenant, abandoned, output_tokens, model)
+
+    def status(self):
+        with self._condition:
+            tenants = {}
+            for tenant_id, stats in self.tenants.items():
+                tenants[tenant_id] = dict(stats)
+                tenants[tenant_id]["average_wait_ms"] = (
+                    round(stats["wait_seconds"] / stats["waits"] * 1000) if stats["waits"] else 0
+                )
+            return {
+                "enabled": self.enabled,
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "queued": self.queued,
+                "shed": self.shed,
+                "classes": {
+                    priority_class: {
+                        "in_flight": self.class_in_flight[priority_class],
+                        "queued": self.waiting[priority_class],
+                    }
+                    for priority_class in PRIORITY_CLASSES
+                },
+                "tenants": tenants,
+            }
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = AdaptiveLimiter(**get_concurrency_config())
+    return _limiter
+
+
+def reset_limiter():
+    """Drop the limiter so it is rebuilt from settings on next use"""
+    global _limiter
+    with _limiter_lock:
+        _limiter = None
+
+
+def limiter_status():
+    return get_limiter().status()
+
+
+def _limiter_metrics():
+    if _limiter is None:
+        return []
+    status = _limiter.status()
+    tenants = status["tenants"].items()
+    return [
+        ("ai_services_llm_concurrency_limit", "gauge", "Current adaptive limit on concurrent LLM calls",
+         [({}, status["limit"])]),
+        ("ai_services_llm_concurrency_in_flight", "gauge", "LLM calls holding a concurrency slot",
+         [({"priority_class": name}, values["in_flight"]) for name, values in status["classes"].items()]),
+        ("ai_services_llm_concurrency_queued", "gauge", "LLM calls waiting for a concurrency slot",
+         [({"priority_class": name}, values["queued"]) for name, values in status["classes"].items()]),
+        ("ai_services_llm_tenant_queue_depth", "gauge", "LLM calls waiting for a slot per API key",
+         [({"tenant": tenant, "priority_class": stats["priority_class"]}, stats["queued"])
+          for tenant, stats in tenants]),
+        ("ai_services_llm_tenant_wait_seconds_total", "counter", "Time LLM calls spent queued per API key",
+         [({"tenant": tenant}, stats["wait_seconds"]) for tenant, stats in tenants]),
+        ("ai_services_llm_tenant_calls_total", "counter", "LLM calls started per API key",
+         [({"tenant": tenant}, stats["calls"]) for tenant, stats in tenants]),
+    ]
+
+
+metrics.REGISTRY.register_collector(_limiter_metrics)
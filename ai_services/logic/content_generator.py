@@ -1,5 +1,9 @@
 from langchain_core.prompts import PromptTemplate
-from .langchain_init import get_initialized_llm
+from ..exceptions import ServiceError
+from .invocation import invoke_prompt
+
+# Rough output tokens per requested word, for the scheduler's latency expectations
+TOKENS_PER_WORD = 1.4
 
 def generate_content(prompt_text, content_type="general", max_length=500):
     """Generate creative content based on the prompt and content type."""
@@ -49,11 +53,12 @@ Be creative and provide useful, well-written content."""
         template=template
     )
     
-    llm = get_initialized_llm(model="gemini-2.0-flash", temperature=0.7)
-    chain = prompt | llm
-    
     try:
-        result = chain.invoke({"prompt_text": prompt_text, "max_length": max_length})
+        result = invoke_prompt(
+            "generate", prompt, {"prompt_text": prompt_text, "max_length": max_length},
+            temperature=0.7, truncate_field="prompt_text",
+            expected_output_tokens=int(max_length * TOKENS_PER_WORD),
+        )
         return {
             "generated_content": result.content.strip(),
             "content_type": content_type,
@@ -61,5 +66,7 @@ Be creative and provide useful, well-written content."""
             "max_length": max_length,
             "word_count": len(result.content.strip().split())
         }
+    except ServiceError:
+        raise
     except Exception as e:
         return {"error": f"Content generation failed: {str(e)}"}
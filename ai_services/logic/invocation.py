@@ -0,0 +1,172 @@
+"""
+Single entry point for LLM calls made by the logic modules.
+Every call goes through invoke_prompt so budgets, model routing, timeouts and
+per-call metadata are handled in one place.
+"""
+
+import contextvars
+import math
+import time
+from contextlib import contextmanager
+
+from .. import metrics
+from ..exceptions import DeadlineExceeded, RequestAbandoned, RequestCancelled
+from ..timing import phase
+from .concurrency import get_limiter
+from .model_router import choose_model
+from .providers import get_provider_pool
+from .token_budget import get_token_budget, render_within_budget
+from .upstream import call_upstream, ensure_capacity, get_timeout
+
+# Context of the request currently making LLM calls (None outside a tracked request)
+_current_context = contextvars.ContextVar("ai_services_invocation_context", default=None)
+
+
+class InvocationContext:
+    """Per-request state shared by every LLM call: client hints in, call metadata out."""
+
+    def __init__(self, tenant=None, deadline=None, cancelled=None, **hints):
+        self.tenant = tenant
+        self.deadline = deadline  # time.monotonic() value the client stops waiting at
+        self.cancelled = cancelled  # threading.Event set when the client has gone away
+        self.hints = hints
+        self.calls = []
+
+    def check(self):
+        """Raise RequestCancelled or DeadlineExceeded once the client has stopped waiting."""
+        if self.cancelled is not None and self.cancelled.is_set():
+            raise RequestCancelled("The client disconnected")
+        if self.deadline is not None and self.deadline <= time.monotonic():
+            metrics.deadline_rejections.inc(stage="dispatch")
+            raise DeadlineExceeded("The request's deadline passed before the AI model was called")
+
+    def metadata(self):
+        """Aggregate per-call metadata into the `metadata` block returned to clients."""
+        providers, models = [], []
+        for call in self.calls:
+            if call["provider"] not in providers:
+                providers.append(call["provider"])
+            if call["model"] not in models:
+                models.append(call["model"])
+        return {
+            "llm_calls": len(self.calls),
+            "providers": providers,
+            "models": models,
+            "estimated_input_tokens": sum(call["estimated_input_tokens"] for call in self.calls),
+            "max_output_tokens": sum(call["max_output_tokens"] for call in self.calls),
+            "truncated": any(call["truncated"] for call in self.calls),
+        }
+
+
+@contextmanager
+def invocation_context(tenant=None, deadline=None, cancelled=None, **hints):
+    """
+    Collect metadata for every invoke_prompt call made inside the block.
+    `tenant` (see logic.concurrency.tenant_for) decides how the calls are scheduled;
+    `deadline` and `cancelled` (see ai_services.deadlines) bound how long they may take.
+    """
+    context = InvocationContext(tenant, deadline, cancelled, **hints)
+    token = _current_context.set(context)
+    try:
+        yield context
+    finally:
+        _current_context.reset(token)
+
+
+def current_context():
+    return _current_context.get()
+
+
+def invoke_prompt(service, prompt, variables, temperature=0.0, truncate_field="text", model=None,
+                  expected_output_tokens=None):
+    """
+    Render prompt with variables, enforce the service's token budget and invoke the LLM
+    through the provider failover list. The model is chosen by the router unless one is
+    passed explicitly. `expected_output_tokens` (default: the service's output budget) is
+    how much output the caller asked for, so long generations are not mistaken for congestion.
+    Raises TokenBudgetExceeded before any upstream call when the input is over budget,
+    ServiceOverloaded when the adaptive concurrency limit sheds the call or the upstream pool
+    is held by abandoned calls, and
+    UpstreamTimeout when the model does not answer within the service's timeout.
+    Within a request that has a deadline, no call starts after it and the remaining time
+    caps the upstream timeout (DeadlineExceeded); RequestCancelled abandons the call when
+    the client disconnects.
+    """
+    context = _current_context.get()
+    if context is not None:
+        context.check()
+    budget = get_token_budget(service)
+    with phase("prompt"):
+        rendered, estimated, truncated = render_within_budget(service, prompt, variables, truncate_field)
+
+    hints = context.hints if context is not None else {}
+    if model is None:
+        model = choose_model(service, estimated, hints.get("quality"), hints.get("latency"))
+
+    timeout = get_timeout(service)
+    deadline = context.deadline if context is not None else None
+    cancelled = context.cancelled if context is not None else None
+
+    def call(provider, remaining):
+        # Failover attempts share the service's timeout
+        started = time.perf_counter()
+        attempt_timeout = timeout if remaining is None else min(timeout, remaining)
+        call_timeout = attempt_timeout
+        if deadline is not None:
+            call_timeout = min(call_timeout, deadline - time.monotonic())
+        if call_timeout < timeout:
+            # Whole seconds keep the number of cached provider clients small
+            call_timeout = max(1, math.ceil(call_timeout))
+        try:
+            result = call_upstream(
+                service,
+                f"{provider.name}:{model}",
+                lambda: provider.invoke(
+                    service, rendered, variables, model,
+                    temperature=temperature, max_output_tokens=budget["output"], timeout=call_timeout,
+                ),
+                temperature=temperature,
+                timeout=attempt_timeout,
+                deadline=deadline,
+                cancelled=cancelled,
+            )
+        except RequestAbandoned:
+            raise
+        except Exception:
+            metrics.llm_errors.inc(service=service, provider=provider.name)
+            raise
+        metrics.llm_duration.observe(
+            time.perf_counter() - started, service=service, provider=provider.name, model=model
+        )
+        return result
+
+    ensure_capacity(service)
+    tenant = context.tenant if context is not None else None
+    output_tokens = min(budget["output"], expected_output_tokens or budget["output"])
+    slot = get_limiter().slot(
+        service, tenant, cost=estimated + budget["output"], deadline=deadline, output_tokens=output_tokens,
+        model=model,
+    )
+    with slot, phase("llm"):
+        started = time.perf_counter()
+        provider, result = get_provider_pool().invoke(call, timeout=timeout)
+        seconds = time.perf_counter() - started
+
+    usage = getattr(result, "usage_metadata", None) or {}
+    if usage:
+        metrics.llm_tokens.inc(usage.get("input_tokens", 0), service=service, model=model, direction="input")
+        metrics.llm_tokens.inc(usage.get("output_tokens", 0), service=service, model=model, direction="output")
+
+    if context is not None:
+        context.calls.append({
+            "service": service,
+            "provider": provider.name,
+            "model": model,
+            "estimated_input_tokens": estimated,
+            "max_output_tokens": budget["output"],
+            "truncated": truncated,
+            "input_tokens": usage.get("input_tokens"),
+            "output_tokens": usage.get("output_tokens"),
+            "seconds": seconds,
+        })
+    return result
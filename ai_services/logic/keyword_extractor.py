@@ -1,12 +1,9 @@
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import CommaSeparatedListOutputParser
-from .langchain_init import get_initialized_llm
+from .invocation import invoke_prompt
 
 def extract_keywords(text, count=5):
     """Extract keywords from text using Google's Generative AI."""
-    # Use centralized LLM initialization
-    llm = get_initialized_llm(model="gemini-2.0-flash", temperature=0.2)
-    
     # Create output parser
     output_parser = CommaSeparatedListOutputParser()
     
@@ -24,13 +21,9 @@ def extract_keywords(text, count=5):
         output_parser=output_parser
     )
     
-    # Use modern LangChain pattern (RunnableSequence)
-    chain = prompt | llm
-    
-    # Use invoke instead of run
     try:
-        result = chain.invoke({"text": text, "count": count})
-        return {"keywords": result}
+        result = invoke_prompt("keywords", prompt, {"text": text, "count": count}, temperature=0.2)
+        return {"keywords": output_parser.parse(result.content)}
     except Exception as e:
         # Add more specific error handling
         error_message = str(e)
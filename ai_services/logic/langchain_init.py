@@ -19,15 +19,15 @@ except Exception as e:
     # Ignore rebuild errors in case they're already built
     pass
 
-def get_initialized_llm(model="gemini-2.0-flash", temperature=0.0, **kwargs):
+def get_initialized_llm(model="gemini-2.0-flash", temperature=0.0, api_key_env="GOOGLE_API_KEY", **kwargs):
     """
     Get a properly initialized ChatGoogleGenerativeAI instance.
     This function ensures the model is properly configured for production environments.
     """
     # Ensure API key is available
-    api_key = os.getenv("GOOGLE_API_KEY")
+    api_key = os.getenv(api_key_env)
     if not api_key:
-        raise ValueError("GOOGLE_API_KEY not found in environment variables")
+        raise ValueError(f"{api_key_env} not found in environment variables")
     
     # Create the LLM instance with proper initialization
     try:
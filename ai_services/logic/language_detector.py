@@ -1,5 +1,13 @@
 from langchain_core.prompts import PromptTemplate
-from .langchain_init import get_initialized_llm
+from ..exceptions import ServiceError
+from .batching import batched_answer
+from .invocation import invoke_prompt
+
+BATCH_INSTRUCTION = (
+    'Detect the language of each text. Each answer is the language name in English and its '
+    'ISO 639-1 code, formatted as "Language Name (ISO Code)", for example "English (en)". '
+    'If a text contains multiple languages, identify the dominant language.'
+)
 
 def detect_language(text):
     """Detect the language of the input text using AI."""
@@ -15,12 +23,11 @@ For example: "English (en)" or "Spanish (es)" or "French (fr)"
 If the text contains multiple languages, identify the dominant language."""
     )
     
-    llm = get_initialized_llm(model="gemini-2.0-flash", temperature=0.1)
-    chain = prompt | llm
-    
     try:
-        result = chain.invoke({"text": text})
-        response = result.content.strip()
+        response = batched_answer("detect_language", BATCH_INSTRUCTION, text, temperature=0.1)
+        if response is None:
+            response = invoke_prompt("detect_language", prompt, {"text": text}, temperature=0.1).content
+        response = response.strip()
         
         # Parse the response to extract language and code
         if "(" in response and ")" in response:
@@ -39,5 +46,7 @@ If the text contains multiple languages, identify the dominant language."""
                 "raw_response": response,
                 "confidence": "medium"
             }
+    except ServiceError:
+        raise
     except Exception as e:
         return {"error": f"Language detection failed: {str(e)}"}
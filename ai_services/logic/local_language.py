@@ -0,0 +1,210 @@
+"""
+Fast local language identification, used to skip LLM calls that would not change the text.
+Non-Latin scripts identify most languages on their own; Latin-script text is scored against
+short function-word profiles. It only has to be right when it is confident: callers treat a
+low confidence as "unknown" and fall back to the model.
+"""
+
+import re
+import unicodedata
+
+# Language code -> names a client may use for it (lowercase)
+LANGUAGE_NAMES = {
+    "en": ("english",),
+    "es": ("spanish", "español", "espanol", "castilian"),
+    "fr": ("french", "français", "francais"),
+    "de": ("german", "deutsch"),
+    "it": ("italian", "italiano"),
+    "pt": ("portuguese", "português", "portugues"),
+    "nl": ("dutch", "nederlands", "flemish"),
+    "ca": ("catalan", "català", "catala"),
+    "sv": ("swedish", "svenska"),
+    "da": ("danish", "dansk"),
+    "no": ("norwegian", "norsk", "bokmål", "bokmal"),
+    "pl": ("polish", "polski"),
+    "cs": ("czech", "čeština", "cestina"),
+    "ro": ("romanian", "română", "romana"),
+    "tr": ("turkish", "türkçe", "turkce"),
+    "id": ("indonesian", "bahasa indonesia"),
+    "fi": ("finnish", "suomi"),
+    "ru": ("russian", "русский"),
+    "uk": ("ukrainian", "українська"),
+    "be": ("belarusian", "беларуская"),
+    "bg": ("bulgarian", "български"),
+    "sr": ("serbian", "српски"),
+    "el": ("greek", "ελληνικά"),
+    "he": ("hebrew", "עברית"),
+    "ar": ("arabic", "العربية"),
+    "fa": ("persian", "farsi", "فارسی"),
+    "ur": ("urdu", "اردو"),
+    "hi": ("hindi", "हिन्दी", "हिंदी"),
+    "th": ("thai", "ไทย"),
+    "ko": ("korean", "한국어"),
+    "ja": ("japanese", "日本語"),
+    "zh": ("chinese", "mandarin", "中文"),
+}
+
+# Older or alternative codes
+CODE_ALIASES = {"iw": "he", "nb": "no", "nn": "no", "in": "id"}
+
+_NAME_TO_CODE = {name: code for code, names in LANGUAGE_NAMES.items() for name in names}
+
+# Frequent function words per Latin-script language
+STOPWORDS = {
+    "en": "the and of to is in that it was for on are with as this be at by have from not but "
+          "they you he she we what which their there been has were would will an or",
+    "es": "el la los las de que y en un una es por con para no se del al lo como más pero sus le "
+          "ya o este sí porque esta entre cuando muy sin sobre también hay está están tiene era fue",
+    "fr": "le la les de des et est un une du en que qui dans pour pas sur au ce il elle ne se "
+          "plus par sont avec nous vous mais ou été cette aux",
+    "de": "der die das und ist nicht ein eine zu den von mit sich des auf für im dem es auch "
+          "als an werden aus er hat dass sie nach wird bei einer um am sind noch wie",
+    "it": "il lo la i gli le di che e è un una per non in del della con si da sono anche come "
+          "più ma ha questo alla nel dei delle essere",
+    "pt": "o a os as de que e do da em um uma para é com não se na no por mais dos das como "
+          "mas foi ao ele ela isso está são também",
+    "nl": "de het een en van is dat in te op niet zijn met voor die er maar ook als aan om dan "
+          "was bij nog wel hij ze dit wordt",
+    "ca": "el la els les de del dels i que en un una és per amb no als al més però aquest "
+          "aquesta molt perquè seu seva són també",
+    "sv": "och att det som en på är av för med till den har de inte om ett men var jag han "
+          "från vi så kan när eller",
+    "da": "og i at det er en til på som de med for af ikke der var han har den et men fra vi "
+          "så kan når eller jeg",
+    "no": "og i det er som en til på at med for av ikke har de var den et men fra vi så kan når "
+          "eller jeg hun",
+    "pl": "i w na nie z się do to że jest o jak a co ale po tak za od przez są dla czy już tylko "
+          "jego jej",
+    "cs": "a je v se na to že s z do o jsou k ale jak by jako pro tak jeho které která také už "
+          "nebo není",
+    "ro": "și de la în a cu nu pe o un este că din ce se mai care sunt pentru lui fost au dar "
+          "acest această",
+    "tr": "ve bir bu da de için ile ne o çok daha gibi ama var mı değil olarak kadar sonra ben "
+          "sen onun olan",
+    "id": "dan yang di ini itu dengan untuk tidak dari dalam akan ada pada juga saya ke karena "
+          "bisa atau mereka sudah",
+    "fi": "ja on ei se että hän oli ovat mutta kun myös kuin tai jos niin sen ole mitä tämä "
+          "nyt vain",
+}
+_STOPWORD_SETS = {code: frozenset(words.split()) for code, words in STOPWORDS.items()}
+
+# Letters that only (or almost only) occur in one of the profiled languages
+MARKER_LETTERS = {
+    "es": "ñ¿¡", "de": "ß", "pt": "ãõ", "pl": "łąęśźż", "cs": "řůě", "ro": "ășț",
+    "tr": "ğış", "fr": "œ", "ca": "·",
+}
+
+# Cyrillic text without distinctive letters is taken as Russian only with one of these
+RUSSIAN_WORDS = frozenset("что это его только ещё еще меня было как он она они мы вы".split())
+
+_WORD_RE = re.compile(r"[^\W\d_]+(?:['’][^\W\d_]+)?")
+
+# Minimum letters before a script or profile decides anything
+MIN_LETTERS = 8
+MIN_WORDS = 3
+
+
+def language_code(language):
+    """ISO 639-1 code for a language name or code, or None when it is not recognised"""
+    value = language.strip().lower().replace("_", "-")
+    if not value:
+        return None
+    if value in _NAME_TO_CODE:
+        return _NAME_TO_CODE[value]
+    base, _, region = value.partition("-")
+    base = CODE_ALIASES.get(base, base)
+    if base not in LANGUAGE_NAMES:
+        return None
+    if base == "zh" and region:
+        # zh-TW / zh-Hans etc. ask for a specific script, which detection does not tell apart
+        return None
+    return base
+
+
+def _script(char):
+    name = unicodedata.name(char, "")
+    for script in ("LATIN", "CYRILLIC", "GREEK", "ARABIC", "HEBREW", "DEVANAGARI", "THAI",
+                   "HANGUL", "HIRAGANA", "KATAKANA", "CJK"):
+        if name.startswith(script) or (script == "CJK" and "CJK" in name):
+            return script
+    return None
+
+
+def _cyrillic_language(text):
+    lowered = text.lower()
+    if "ў" in lowered:
+        return "be", 0.95
+    if any(char in lowered for char in "їєґ"):
+        return "uk", 0.95
+    if any(char in lowered for char in "ђћџљњ"):
+        return "sr", 0.95
+    if "ы" in lowered or "э" in lowered:
+        return "ru", 0.9
+    if "ъ" in lowered:
+        return "bg", 0.8
+    if "і" in lowered:
+        return "uk", 0.85
+    if RUSSIAN_WORDS.intersection(_WORD_RE.findall(lowered)):
+        return "ru", 0.8
+    return "ru", 0.5
+
+
+def _arabic_language(text):
+    if any(char in text for char in "ٹڈڑےں"):
+        return "ur", 0.9
+    if any(char in text for char in "پچژگ"):
+        return "fa", 0.85
+    return "ar", 0.85
+
+
+def _latin_language(text):
+    words = [word.lower() for word in _WORD_RE.findall(text)]
+    if len(words) < MIN_WORDS:
+        return None, 0.0
+    scores = {code: sum(word in stopwords for word in words) for code, stopwords in _STOPWORD_SETS.items()}
+    lowered = text.lower()
+    for code, letters in MARKER_LETTERS.items():
+        if any(letter in lowered for letter in letters):
+            scores[code] += 2
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    (best, top), (_, second) = ranked[0], ranked[1]
+    if top < 2:
+        return None, 0.0
+    margin = (top - second) / top
+    # Fewer than ~4 function words is thin evidence however clear the margin
+    return best, round(margin * min(1.0, top / 4), 2)
+
+
+def detect_local(text):
+    """
+    (language code, confidence between 0 and 1) for text, or (None, 0.0) when it cannot be
+    told locally. Confidence is low for short or mixed-script text.
+    """
+    counts = {}
+    letters = 0
+    for char in text:
+        if char.isalpha():
+            letters += 1
+            script = _script(char)
+            counts[script] = counts.get(script, 0) + 1
+    if letters < MIN_LETTERS:
+        return None, 0.0
+
+    script, count = max(counts.items(), key=lambda item: item[1])
+    share = count / letters
+    if counts.get("HIRAGANA", 0) + counts.get("KATAKANA", 0) >= letters * 0.1:
+        code, confidence = "ja", 0.95
+        share = (counts.get("HIRAGANA", 0) + counts.get("KATAKANA", 0) + counts.get("CJK", 0)) / letters
+    elif script == "LATIN":
+        code, confidence = _latin_language(text)
+    elif script == "CYRILLIC":
+        code, confidence = _cyrillic_language(text)
+    elif script == "ARABIC":
+        code, confidence = _arabic_language(text)
+    else:
+        code, confidence = {
+            "GREEK": "el", "HEBREW": "he", "DEVANAGARI": "hi", "THAI": "th", "HANGUL": "ko", "CJK": "zh",
+        }.get(script), 0.9
+    if code is None:
+        return None, 0.0
+    return code, round(confidence * min(1.0, share / 0.9), 2)
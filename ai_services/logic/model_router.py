@@ -0,0 +1,32 @@
+"""
+Per-request model selection.
+Rules from settings.AI_MODEL_ROUTES are checked in order and the first match wins;
+requests matching no rule use settings.AI_DEFAULT_MODEL.
+"""
+
+from django.conf import settings
+
+QUALITY_HINTS = ["low", "standard", "high"]
+LATENCY_HINTS = ["low", "standard"]
+
+
+def _rule_matches(rule, service, input_tokens, quality, latency):
+    if "services" in rule and service not in rule["services"]:
+        return False
+    if "min_input_tokens" in rule and input_tokens < rule["min_input_tokens"]:
+        return False
+    if "max_input_tokens" in rule and input_tokens > rule["max_input_tokens"]:
+        return False
+    if "quality" in rule and quality != rule["quality"]:
+        return False
+    if "latency" in rule and latency != rule["latency"]:
+        return False
+    return True
+
+
+def choose_model(service, input_tokens, quality=None, latency=None):
+    """Return the model name that should serve this call."""
+    for rule in getattr(settings, "AI_MODEL_ROUTES", []):
+        if _rule_matches(rule, service, input_tokens, quality, latency):
+            return rule["model"]
+    return getattr(settings, "AI_DEFAULT_MODEL", "gemini-2.0-flash")
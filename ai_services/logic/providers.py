@@ -0,0 +1,383 @@
+"""
+LLM provider layer.
+invoke_prompt calls providers from an ordered failover list (settings.AI_PROVIDERS).
+Providers that keep failing are ejected for a cooldown period and then given a single
+half-open probe call before they take traffic again. Timeouts and errors caused by the
+request itself (4xx) do not count against a provider, and all failover attempts of a call
+share one timeout.
+"""
+
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from langchain_core.messages import AIMessage
+
+from .. import metrics
+from ..exceptions import ProvidersUnavailable, RequestAbandoned, UpstreamTimeout
+from .langchain_init import get_initialized_llm
+from .text_chunker import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class LLMProvider(ABC):
+    """Base class: turns a rendered prompt into an AIMessage"""
+    name = None
+
+    def __init__(self, name, **options):
+        self.name = name
+        self.options = options
+
+    @abstractmethod
+    def invoke(self, service, prompt, variables, model, temperature=0.0, max_output_tokens=None, timeout=None):
+        """Answer the rendered prompt with `model`, giving up after `timeout` seconds"""
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini through langchain_google_genai, one API key per provider entry"""
+
+    def __init__(self, name, api_key_env="GOOGLE_API_KEY", **options):
+        super().__init__(name, **options)
+        self.api_key_env = api_key_env
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def _client(self, model, temperature, max_output_tokens, timeout):
+        # Building a ChatGoogleGenerativeAI is not free, so clients are reused per configuration
+        key = (model, temperature, max_output_tokens, timeout)
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = get_initialized_llm(
+                        model=model,
+                        temperature=temperature,
+                        api_key_env=self.api_key_env,
+                        max_output_tokens=max_output_tokens,
+                        timeout=timeout,
+                    )
+                    self._clients[key] = client
+        return client
+
+    def invoke(self, service, prompt, variables, model, temperature=0.0, max_output_tokens=None, timeout=None):
+        return self._client(model, temperature, max_output_tokens, timeout).invoke(prompt)
+
+
+_WORD_RE = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)?", re.UNICODE)
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+_STOPWORDS = set("""
+a an and are as at be been but by for from has have he her his i if in into is it its me my not
+of on or our she so that the their them then there these they this to was we were what when which
+who will with you your
+""".split())
+_POSITIVE = set("good great excellent love loved like happy amazing awesome wonderful best fantastic nice".split())
+_NEGATIVE = set("bad terrible awful hate hated poor worst horrible sad angry disappointing broken".split())
+
+
+class LocalProvider(LLMProvider):
+    """
+    Deterministic, offline provider for tests and degraded mode.
+    Answers come from simple local heuristics on the prompt variables, never from a model.
+    """
+
+    def _words(self, text):
+        return [word.lower() for word in _WORD_RE.findall(text or "")]
+
+    def _lead(self, text, sentences=3):
+        return " ".join(_SENTENCE_RE.split((text or "").strip())[:sentences])
+
+    def respond(self, service, prompt, variables):
+        if service.endswith("_batch"):
+            # Micro-batched prompt: one answer per text, as the JSON array the batcher expects
+            base = service[:-len("_batch")]
+            return json.dumps([
+                {"id": number, "answer": self.respond(base, prompt, dict(variables, text=text))}
+                for number, text in enumerate(variables.get("texts", []), 1)
+            ])
+        text = variables.get("text", "")
+        if service == "sentiment":
+            words = self._words(text)
+            score = sum(w in _POSITIVE for w in words) - sum(w in _NEGATIVE for w in words)
+            return "positive" if score > 0 else "negative" if score < 0 else "neutral"
+        if service == "keywords":
+            words = [w for w in self._words(text) if w not in _STOPWORDS and len(w) > 2]
+            count = int(variables.get("count", 5))
+            return ", ".join(word for word, _ in Counter(words).most_common(count))
+        if service == "classify":
+            block = str(variables.get("categories", ""))
+            if block.startswith("- "):
+                # Category set block: "- Name: description (examples: ...)" per line
+                categories = [re.split(r":| \(", line[2:], maxsplit=1)[0].strip() for line in block.splitlines()]
+            else:
+                categories = [c.strip() for c in block.split(",") if c.strip()]
+            lowered = (text or "").lower()
+            for category in categories:
+                if category.lower() in lowered:
+                    return category
+            return categories[0] if categories else "Unknown"
+        if service == "detect_language":
+            return "Unknown (und)"
+        if service == "translate":
+            return text
+        if service == "answer":
+            return self._lead(variables.get("context"), 1) or "I cannot answer that right now."
+        if service == "generate":
+            return variables.get("prompt_text", "")
+        # summarize and anything else: extractive lead
+        return self._lead(text)
+
+    def invoke(self, service, prompt, variables, model, temperature=0.0, max_output_tokens=None, timeout=None):
+        return AIMessage(content=self.respond(service, prompt, variables))
+
+
+class SimulatedLLMError(RuntimeError):
+    """Injected failure of the simulated provider"""
+
+
+class SimulatedProvider(LocalProvider):
+    """
+    Stand-in for a remote LLM for load tests: local answers delivered after a lognormal
+    latency plus output-token generation time, with injected errors.
+    Configured by settings.AI_SIMULATED_LLM (read on every call, so it can be changed live).
+    """
+
+    def config(self):
+        config = {"latency_ms": 800, "latency_sigma": 0.5, "tokens_per_second": 80, "error_rate": 0.0}
+        config.update(getattr(settings, "AI_SIMULATED_LLM", {}))
+        config.update(self.options)
+        return config
+
+    def invoke(self, service, prompt, variables, model, temperature=0.0, max_output_tokens=None, timeout=None):
+        config = self.config()
+        content = self.respond(service, prompt, variables)
+        output_tokens = estimate_tokens(content)
+        if max_output_tokens:
+            output_tokens = min(output_tokens, max_output_tokens)
+
+        delay = config["latency_ms"] / 1000 * math.exp(random.gauss(0, config["latency_sigma"]))
+        if config["tokens_per_second"]:
+            delay += output_tokens / config["tokens_per_second"]
+        if timeout and delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Simulated LLM did not answer within {timeout}s")
+        time.sleep(delay)
+
+        if random.random() < config["error_rate"]:
+            raise SimulatedLLMError("Simulated upstream error (503 Service Unavailable)")
+        return AIMessage(
+            content=content,
+            usage_metadata={
+                "input_tokens": estimate_tokens(prompt),
+                "output_tokens": output_tokens,
+                "total_tokens": estimate_tokens(prompt) + output_tokens,
+            },
+        )
+
+
+PROVIDER_CLASSES = {
+    "gemini": GeminiProvider,
+    "local": LocalProvider,
+    "simulated": SimulatedProvider,
+}
+
+DEFAULT_PROVIDER_DEFINITIONS = {
+    "gemini": {"class": "gemini", "api_key_env": "GOOGLE_API_KEY"},
+    "gemini_backup": {"class": "gemini", "api_key_env": "GOOGLE_API_KEY_BACKUP"},
+    "local": {"class": "local"},
+    "simulated": {"class": "simulated"},
+}
+
+
+class ProviderHealth:
+    """Circuit breaker for one provider: closed -> open after repeated failures -> half-open probe"""
+
+    def __init__(self, failure_threshold, cooldown):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Return True if a call may be sent to the provider now."""
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+            if self.state == "half_open" and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self.probing = False
+
+    def release(self):
+        """The call was abandoned by the client; the provider's state stays as it was"""
+        with self.lock:
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.consecutive_failures += 1
+            self.probing = False
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def status(self):
+        with self.lock:
+            return {"state": self.state, "consecutive_failures": self.consecutive_failures}
+
+
+# 4xx statuses that still say something about the provider rather than the request
+PROVIDER_CLIENT_STATUSES = {408, 429}
+
+
+def _error_status(error):
+    """HTTP status carried by a provider error (google.api_core, httpx, ServiceError), if any"""
+    for value in (
+        getattr(error, "status_code", None),
+        getattr(error, "code", None),
+        getattr(getattr(error, "response", None), "status_code", None),
+    ):
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_timeout(error):
+    return isinstance(error, (UpstreamTimeout, TimeoutError)) or _error_status(error) in (408, 504)
+
+
+def is_request_error(error):
+    """The request itself was rejected (invalid argument, blocked prompt, ...)"""
+    status = _error_status(error)
+    return status is not None and 400 <= status < 500 and status not in PROVIDER_CLIENT_STATUSES
+
+
+class ProviderPool:
+    """Ordered failover list of providers with health-based ejection"""
+
+    def __init__(self, providers, failure_threshold=3, cooldown=30.0):
+        self.providers = providers
+        self.health = {p.name: ProviderHealth(failure_threshold, cooldown) for p in providers}
+
+    def invoke(self, call, timeout=None):
+        """
+        Try providers in order; call(provider, timeout) performs the request within `timeout`
+        seconds, what is left of the time all attempts share (None: no limit).
+        Returns (provider, result) from the first provider that succeeds.
+        """
+        expires = None if timeout is None else time.monotonic() + timeout
+        error = None
+        for provider in self.providers:
+            remaining = None
+            if expires is not None:
+                remaining = expires - time.monotonic()
+                if remaining <= 0:
+                    break
+            health = self.health[provider.name]
+            if not health.acquire():
+                continue
+            try:
+                result = call(provider, remaining)
+            except RequestAbandoned:
+                # Neither a failure of this provider nor a reason to try the next one
+                health.release()
+                raise
+            except Exception as e:
+                if is_request_error(e):
+                    # Another provider would reject the same request
+                    health.release()
+                    raise
+                if is_timeout(e):
+                    # Slow answers are the limiter's concern; only errors eject a provider
+                    health.release()
+                else:
+                    health.record_failure()
+                logger.warning(f"LLM provider {provider.name} failed: {str(e)}")
+                error = e
+                continue
+            health.record_success()
+            return provider, result
+
+        if error is not None:
+            raise error
+        raise ProvidersUnavailable("All AI providers are temporarily unavailable. Please try again later.")
+
+    def status(self):
+        return {p.name: self.health[p.name].status() for p in self.providers}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def build_provider(name):
+    definitions = dict(DEFAULT_PROVIDER_DEFINITIONS)
+    definitions.update(getattr(settings, "AI_PROVIDER_DEFINITIONS", {}))
+    definition = dict(definitions[name])
+    provider_class = PROVIDER_CLASSES[definition.pop("class")]
+    return provider_class(name, **definition)
+
+
+def get_provider_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                names = getattr(settings, "AI_PROVIDERS", ["gemini"])
+                _pool = ProviderPool(
+                    [build_provider(name) for name in names],
+                    failure_threshold=getattr(settings, "AI_PROVIDER_FAILURE_THRESHOLD", 3),
+                    cooldown=getattr(settings, "AI_PROVIDER_COOLDOWN_SECONDS", 30.0),
+                )
+    return _pool
+
+
+def reset_provider_pool():
+    """Drop the cached pool so it is rebuilt from settings on next use"""
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    if setting.startswith("AI_PROVIDER"):
+        reset_provider_pool()
+
+
+def provider_status():
+    return get_provider_pool().status()
+
+
+def _provider_metrics():
+    if _pool is None:
+        return []
+    samples = []
+    for name, status in _pool.status().items():
+        for state in ("closed", "half_open", "open"):
+            samples.append(({"provider": name, "state": state}, 1 if status["state"] == state else 0))
+    return [("ai_services_provider_state", "gauge", "LLM provider circuit breaker state", samples)]
+
+
+metrics.REGISTRY.register_collector(_provider_metrics)
@@ -1,5 +1,6 @@
 from langchain_core.prompts import PromptTemplate
-from .langchain_init import get_initialized_llm
+from ..exceptions import ServiceError
+from .invocation import invoke_prompt
 
 def answer_question(question, context=None):
     """Answer questions using AI, optionally with provided context."""
@@ -15,17 +16,19 @@ Question: {question}
 Answer:"""
         )
         
-        llm = get_initialized_llm(model="gemini-2.0-flash", temperature=0.2)
-        chain = prompt | llm
-        
         try:
-            result = chain.invoke({"context": context, "question": question})
+            result = invoke_prompt(
+                "answer", prompt, {"context": context, "question": question},
+                temperature=0.2, truncate_field="context"
+            )
             return {
                 "answer": result.content.strip(),
                 "question": question,
                 "has_context": True,
                 "context_provided": True
             }
+        except ServiceError:
+            raise
         except Exception as e:
             return {"error": f"Question answering failed: {str(e)}"}
     else:
@@ -38,16 +41,15 @@ Question: {question}
 Answer:"""
         )
         
-        llm = get_initialized_llm(model="gemini-2.0-flash", temperature=0.3)
-        chain = prompt | llm
-        
         try:
-            result = chain.invoke({"question": question})
+            result = invoke_prompt("answer", prompt, {"question": question}, temperature=0.3, truncate_field=None)
             return {
                 "answer": result.content.strip(),
                 "question": question,
                 "has_context": False,
                 "context_provided": False
             }
+        except ServiceError:
+            raise
         except Exception as e:
             return {"error": f"Question answering failed: {str(e)}"}
@@ -1,12 +1,15 @@
 from langchain_core.prompts import PromptTemplate
-from .langchain_init import get_initialized_llm
+from .batching import batched_answer
+from .invocation import invoke_prompt
+
+BATCH_INSTRUCTION = "Analyze the sentiment of each text. Each answer is only one of: 'positive', 'negative', or 'neutral'."
 
 def analyze_sentiment(text):
-    prompt = PromptTemplate(
-        input_variables=["text"],
-        template="Analyze the sentiment of the following text. Respond only with one of: 'positive', 'negative', or 'neutral'.\nText: {text}"
-    )
-    llm = get_initialized_llm(model="gemini-2.0-flash", temperature=0.0)
-    chain = prompt | llm
-    result = chain.invoke({"text": text})
-    return {"sentiment": result.content.strip()}
+    answer = batched_answer("sentiment", BATCH_INSTRUCTION, text, temperature=0.0)
+    if answer is None:
+        prompt = PromptTemplate(
+            input_variables=["text"],
+            template="Analyze the sentiment of the following text. Respond only with one of: 'positive', 'negative', or 'neutral'.\nText: {text}"
+        )
+        answer = invoke_prompt("sentiment", prompt, {"text": text}, temperature=0.0).content
+    return {"sentiment": answer.strip()}
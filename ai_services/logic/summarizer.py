@@ -1,20 +1,56 @@
 from langchain_core.prompts import PromptTemplate
-from .langchain_init import get_initialized_llm
+from .invocation import invoke_prompt
+from .text_chunker import chunk_text
 
-def summarize_text(text, method="stuff"):
-    # Initialize the LLM using the centralized function
-    llm = get_initialized_llm(model="gemini-2.0-flash", temperature=0.0)
-    
-    # Create a simple summarization prompt
-    prompt_template = """Please provide a concise summary of the following text:
+SUMMARY_TEMPLATE = """Please provide a concise summary of the following text:
 
 {text}
 
 Summary:"""
-    
-    prompt = PromptTemplate(template=prompt_template, input_variables=["text"])
-    
-    # Generate summary directly
-    response = llm.invoke(prompt.format(text=text))
-    
-    return response.content
+
+COMBINE_TEMPLATE = """The following are summaries of consecutive parts of one document:
+
+{text}
+
+Combine them into a single concise summary of the whole document.
+
+Summary:"""
+
+REFINE_TEMPLATE = """Here is an existing summary of the beginning of a document:
+
+{summary}
+
+Refine it using the next part of the document below. Keep it concise.
+
+{text}
+
+Refined summary:"""
+
+
+def summarize_text(text, method="stuff", chunks=None):
+    """
+    Summarize text. `map_reduce` and `refine` work over chunks of the text;
+    pass precomputed chunks (e.g. from a stored document) to skip re-chunking.
+    """
+    prompt = PromptTemplate(template=SUMMARY_TEMPLATE, input_variables=["text"])
+
+    if method != "stuff" and chunks is None:
+        chunks = chunk_text(text)
+
+    if method == "stuff" or len(chunks) <= 1:
+        # Generate summary directly
+        response = invoke_prompt("summarize", prompt, {"text": text})
+        return response.content
+
+    if method == "map_reduce":
+        partials = [invoke_prompt("summarize", prompt, {"text": chunk}).content.strip() for chunk in chunks]
+        combine_prompt = PromptTemplate(template=COMBINE_TEMPLATE, input_variables=["text"])
+        response = invoke_prompt("summarize", combine_prompt, {"text": "\n\n".join(partials)})
+        return response.content
+
+    # refine
+    refine_prompt = PromptTemplate(template=REFINE_TEMPLATE, input_variables=["summary", "text"])
+    summary = invoke_prompt("summarize", prompt, {"text": chunks[0]}).content.strip()
+    for chunk in chunks[1:]:
+        summary = invoke_prompt("summarize", refine_prompt, {"summary": summary, "text": chunk}).content.strip()
+    return summary
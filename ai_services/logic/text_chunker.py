@@ -0,0 +1,99 @@
+"""
+Local text chunking and token estimation.
+These helpers never call the LLM, so they are cheap enough to run on every request.
+"""
+
+import re
+
+# Gemini tokenizes English prose at roughly four characters per token
+CHARS_PER_TOKEN = 4
+
+# Preferred split points, strongest first: paragraph break, line break, sentence end, space
+_BOUNDARY_PATTERNS = [
+    re.compile(r"\n\s*\n"),
+    re.compile(r"\n"),
+    re.compile(r"(?<=[.!?])\s+"),
+    re.compile(r"\s+"),
+]
+
+
+def estimate_tokens(text):
+    """Estimate the number of tokens in text without calling a tokenizer."""
+    if not text:
+        return 0
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _find_split(text, start, limit):
+    """Return the best split offset in text[start:limit], falling back to a hard cut."""
+    window = text[start:limit]
+    for pattern in _BOUNDARY_PATTERNS:
+        matches = list(pattern.finditer(window))
+        # Ignore boundaries in the first half so chunks stay reasonably full
+        matches = [m for m in matches if m.end() > len(window) // 2]
+        if matches:
+            return start + matches[-1].end()
+    return limit
+
+
+def chunk_spans(text, max_tokens=1000):
+    """
+    Split text into chunks of at most max_tokens (estimated) each.
+    Returns a list of [start, end) character offsets so callers can store spans instead of copies.
+    """
+    if not text:
+        return []
+
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    spans = []
+    start = 0
+    length = len(text)
+    while start < length:
+        limit = start + max_chars
+        if limit >= length:
+            end = length
+        else:
+            end = _find_split(text, start, limit)
+        spans.append([start, end])
+        start = end
+    return spans
+
+
+def chunk_text(text, max_tokens=1000):
+    """Split text into a list of chunk strings of at most max_tokens (estimated) each."""
+    return [text[start:end] for start, end in chunk_spans(text, max_tokens)]
+
+
+class StreamingChunker:
+    """
+    Builds the same chunks as chunk_spans while the text arrives in pieces, so a large
+    upload is chunked as it is read instead of in a second pass over the full text.
+    """
+
+    def __init__(self, max_tokens=1000):
+        self.max_chars = max_tokens * CHARS_PER_TOKEN
+        self.chunks = []
+        self.spans = []
+        self.pending = ""
+        self.offset = 0
+
+    def feed(self, piece):
+        self.pending += piece
+        # Split only once more than a full chunk is buffered, exactly like chunk_spans
+        while len(self.pending) > self.max_chars:
+            end = _find_split(self.pending, 0, self.max_chars)
+            self._emit(end)
+
+    def _emit(self, end):
+        self.chunks.append(self.pending[:end])
+        self.spans.append([self.offset, self.offset + end])
+        self.offset += end
+        self.pending = self.pending[end:]
+
+    def close(self):
+        """Finish the text; returns (text, spans)"""
+        if self.pending:
+            self._emit(len(self.pending))
+        text = "".join(self.chunks)
+        self.chunks = []
+        return text, self.spans
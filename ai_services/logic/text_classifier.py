@@ -1,34 +1,256 @@
+import contextvars
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
 from langchain_core.prompts import PromptTemplate
-from .langchain_init import get_initialized_llm
+from ..exceptions import ServiceError
+from .batching import batched_answer
+from .invocation import invoke_prompt
 
-def classify_text(text, categories=None):
-    """Classify text into predefined categories using AI."""
-    if categories is None:
-        categories = ["Technology", "Business", "Sports", "Entertainment", "Politics", "Science", "Health", "Education", "Travel", "Food"]
-    
-    categories_str = ", ".join(categories)
-    
-    prompt = PromptTemplate(
-        input_variables=["text", "categories"],
-        template="""Classify the following text into one of these categories: {categories}
+DEFAULT_CATEGORIES = ["Technology", "Business", "Sports", "Entertainment", "Politics", "Science", "Health", "Education", "Travel", "Food"]
+
+DEFAULT_HIERARCHY = {
+    "beam_width": 2,  # branches kept per level; 1 follows only the best branch
+    "max_workers": 16,
+}
+
+# Subcategory names shown next to a category that has children
+SUBCATEGORY_HINTS = 5
+
+_SPACE_RE = re.compile(r"\s+")
+_LIST_MARKER_RE = re.compile(r"^\s*(?:[-*\u2022]|\d+[.)])\s*")
+
+LIST_PROMPT = PromptTemplate(
+    input_variables=["text", "categories"],
+    template="""Classify the following text into one of these categories: {categories}
 
 Text: {text}
 
 Respond with only the category name that best fits the text content. Choose the most appropriate category from the list provided."""
-    )
-    
-    llm = get_initialized_llm(model="gemini-2.0-flash", temperature=0.1)
-    chain = prompt | llm
+)
+
+# Registered category sets: {categories} is the set's precomputed block, one category per line
+SET_PROMPT = PromptTemplate(
+    input_variables=["text", "categories"],
+    template="""Classify the following text into one of these categories:
+{categories}
+
+Text: {text}
+
+Respond with only the category name that best fits the text content. Choose the most appropriate category from the list provided."""
+)
+
+# One level of a hierarchical category set; {position} names the branch already chosen
+LEVEL_PROMPT = PromptTemplate(
+    input_variables=["text", "categories", "position", "limit"],
+    template="""Classify the following text{position} into these categories:
+{categories}
+
+Text: {text}
+
+Respond with only the names of up to {limit} categories that fit the text, best first, one per line. Respond with None if no category fits."""
+)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_hierarchy_config():
+    config = dict(DEFAULT_HIERARCHY)
+    config.update(getattr(settings, "AI_HIERARCHICAL_CLASSIFICATION", {}))
+    return config
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=get_hierarchy_config()["max_workers"], thread_name_prefix="classify-level",
+                )
+    return _executor
+
+
+def normalize_label(label):
+    """Case-, quote- and whitespace-insensitive form of a category name for matching model answers"""
+    return _SPACE_RE.sub(" ", label.strip().strip("'\"`*.").strip()).casefold()
+
+
+def render_category_block(categories):
+    """
+    Render categories ({"name", "description", "examples"}) as the list placed in the
+    classification prompt, one category per line.
+    """
+    lines = []
+    for category in categories:
+        line = f"- {category['name']}"
+        if category.get("description"):
+            line += f": {category['description']}"
+        if category.get("examples"):
+            line += " (examples: " + "; ".join(f'"{example}"' for example in category["examples"]) + ")"
+        if category.get("children"):
+            names = [child["name"] for child in category["children"][:SUBCATEGORY_HINTS]]
+            more = ", ..." if len(category["children"]) > SUBCATEGORY_HINTS else ""
+            line += f" (includes: {', '.join(names)}{more})"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def build_lookup(names):
+    """Normalized label -> category name; the first of two names that normalize alike wins"""
+    lookup = {}
+    for name in names:
+        lookup.setdefault(normalize_label(name), name)
+    return lookup
+
+
+def match_labels(answer, lookup, limit):
+    """Known category names in a model answer listing one per line, in order, at most `limit`"""
+    names = []
+    for line in answer.splitlines():
+        line = _LIST_MARKER_RE.sub("", line)
+        match = lookup.get(normalize_label(line))
+        candidates = [match] if match is not None else [lookup.get(normalize_label(part)) for part in line.split(",")]
+        for name in candidates:
+            if name is not None and name not in names:
+                names.append(name)
+    return names[:limit]
+
+
+def _classify_level(text, node, path, limit):
+    position = f" (already classified as: {' > '.join(path)})" if path else ""
+    answer = invoke_prompt(
+        "classify",
+        LEVEL_PROMPT,
+        {"text": text, "categories": node["prompt_block"], "position": position, "limit": limit},
+        temperature=0.1,
+    ).content
+    return match_labels(answer, node["lookup"], limit)
+
+
+def _classify_branches(text, frontier, limit):
+    """Matched child names for every (rank, path, node) of a level, evaluated concurrently"""
+    if len(frontier) == 1:
+        _, path, node = frontier[0]
+        return [_classify_level(text, node, path, limit)]
+    executor = _get_executor()
+    # Each branch runs in a copy of this context so its calls are recorded on the request
+    futures = [
+        executor.submit(contextvars.copy_context().run, _classify_level, text, node, path, limit)
+        for _, path, node in frontier
+    ]
+    return [future.result() for future in futures]
+
+
+def classify_hierarchical(text, category_set):
+    """
+    Classify text down a nested category set one level at a time. Each level asks only
+    about the children of the branches still in play, so prompts stay small and the number
+    of sequential calls grows with the depth of the tree rather than its size. Up to
+    beam_width branches are kept per level, ranked by the order the model listed them in,
+    and their subtrees are classified concurrently.
+    """
+    beam_width = max(1, get_hierarchy_config()["beam_width"])
+    frontier = [((), [], category_set)]  # (rank, path, compiled node); lower ranks are better
+    finished = []  # (rank, path) of paths that reached a leaf
+    best_partial = None
+    levels = []
+    while frontier:
+        started = time.perf_counter()
+        answers = _classify_branches(text, frontier, beam_width)
+        candidates = sorted(
+            (rank + (position,), path + [name], node["subtrees"].get(name))
+            for (rank, path, node), names in zip(frontier, answers)
+            for position, name in enumerate(names)
+        )[:beam_width]
+        levels.append({
+            "level": len(levels) + 1,
+            "prompts": len(frontier),
+            "candidates": [" > ".join(path) for _, path, _ in candidates],
+            "ms": round((time.perf_counter() - started) * 1000),
+        })
+        if candidates:
+            best_partial = candidates[0][1]
+        frontier = []
+        for rank, path, subtree in candidates:
+            if subtree is None:
+                finished.append((rank, path))
+            else:
+                frontier.append((rank, path, subtree))
+        if finished:
+            # A branch ranked below a finished path cannot beat it
+            best = min(finished)[0]
+            frontier = [branch for branch in frontier if branch[0] < best]
+
+    if finished:
+        path, confidence = min(finished)[1], "high"
+    elif best_partial:
+        path, confidence = best_partial, "medium"
+    else:
+        path, confidence = [], "low"
+    return {
+        "category": path[-1] if path else None,
+        "path": path,
+        "confidence": confidence,
+        "category_set_id": category_set["id"],
+        "levels": levels,
+    }
+
+
+def classify_text(text, categories=None, category_set=None):
+    """
+    Classify text into predefined categories using AI.
+    `category_set` is a registered set's precomputed prompt block and lookup table
+    (CategorySet.compiled()); otherwise `categories` is a plain list of names.
+    A category set with subcategories is classified hierarchically.
+    """
+    if category_set is not None and category_set.get("subtrees"):
+        try:
+            return classify_hierarchical(text, category_set)
+        except ServiceError:
+            raise
+        except Exception as e:
+            return {"error": f"Classification failed: {str(e)}"}
+
+    if category_set is not None:
+        categories_str = category_set["prompt_block"]
+        lookup = category_set["lookup"]
+        prompt = SET_PROMPT
+    else:
+        if categories is None:
+            categories = DEFAULT_CATEGORIES
+        categories_str = ", ".join(categories)
+        lookup = build_lookup(categories)
+        prompt = LIST_PROMPT
     
     try:
-        result = chain.invoke({"text": text, "categories": categories_str})
-        category = result.content.strip()
-        
-        # Ensure the returned category is in our list (case-insensitive)
-        for cat in categories:
-            if cat.lower() == category.lower():
-                return {"category": cat, "confidence": "high", "available_categories": categories}
-        
-        return {"category": category, "confidence": "medium", "available_categories": categories}
+        category = batched_answer(
+            "classify",
+            f"Classify each text into one of these categories: {categories_str}. "
+            "Each answer is only the category name that best fits the text.",
+            text,
+            {"categories": categories_str},
+            temperature=0.1,
+        )
+        if category is None:
+            category = invoke_prompt("classify", prompt, {"text": text, "categories": categories_str}, temperature=0.1).content
+        category = category.strip()
+
+        if category_set is not None:
+            result = {"category_set_id": category_set["id"]}
+        else:
+            result = {"available_categories": categories}
+
+        # Map the answer onto a known category (case-, quote- and whitespace-insensitive)
+        match = lookup.get(normalize_label(category))
+        if match is not None:
+            return {"category": match, "confidence": "high", **result}
+        return {"category": category, "confidence": "medium", **result}
+    except ServiceError:
+        raise
     except Exception as e:
         return {"error": f"Classification failed: {str(e)}"}
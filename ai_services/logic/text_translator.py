@@ -1,32 +1,157 @@
+import re
+
+from django.conf import settings
 from langchain_core.prompts import PromptTemplate
-from .langchain_init import get_initialized_llm
+from .. import metrics
+from ..exceptions import ServiceError
+from .invocation import invoke_prompt
+from .local_language import detect_local, language_code
 
-def translate_text(text, target_language, source_language="auto"):
-    """Translate text from source language to target language using AI."""
-    if source_language == "auto":
-        prompt = PromptTemplate(
-            input_variables=["text", "target_language"],
-            template="""Translate the following text to {target_language}. Maintain the original meaning and tone.
+DEFAULT_SAME_LANGUAGE = {
+    "enabled": True,
+    "min_confidence": 0.6,
+    "max_runs": 3,  # more foreign stretches than this are translated in one call with the rest
+}
+
+# Sentence ends and line breaks; the captured separators are kept when the text is put back together
+_SEGMENT_RE = re.compile(r"((?<=[.!?。！？])\s+|\s*\n\s*)")
+_LETTER_RE = re.compile(r"[^\W\d_]")
+
+# Segments with fewer words ("OK.", "Thanks!", numbers) take the label of the segment before them
+SHORT_SEGMENT_WORDS = 3
+
+AUTO_PROMPT = PromptTemplate(
+    input_variables=["text", "target_language"],
+    template="""Translate the following text to {target_language}. Maintain the original meaning and tone.
 
 Text to translate: {text}
 
 Provide only the translation without any additional explanation."""
-        )
-        
-        llm = get_initialized_llm(model="gemini-2.0-flash", temperature=0.1)
-        result = prompt | llm
-        
+)
+
+
+def get_same_language_config():
+    config = dict(DEFAULT_SAME_LANGUAGE)
+    config.update(getattr(settings, "AI_TRANSLATION_SAME_LANGUAGE", {}))
+    return config
+
+
+def _skipped(text, target_language, source_language):
+    metrics.translation_shortcuts.inc(outcome="skipped")
+    return {
+        "translated_text": text,
+        "source_language": source_language,
+        "target_language": target_language,
+        "original_text": text,
+        "skipped": "same_language",
+    }
+
+
+def _segment_plan(text, target_code, min_confidence):
+    """
+    Split text into (segment, separator) pairs and decide per segment whether it is already
+    in the target language: True, False (including when detection is not confident), or
+    None for segments too short to judge.
+    """
+    parts = _SEGMENT_RE.split(text)
+    pairs = list(zip(parts[0::2], parts[1::2] + [""]))
+    labels = []
+    for segment, _ in pairs:
+        if not _LETTER_RE.search(segment) or len(segment.split()) < SHORT_SEGMENT_WORDS:
+            labels.append(None)
+            continue
+        code, confidence = detect_local(segment)
+        labels.append(code == target_code and confidence >= min_confidence)
+    return pairs, labels
+
+
+def _translate_mixed(text, target_language, target_code, config):
+    """
+    Translate only the parts of text that are not already in the target language, or return
+    None when the local check cannot tell and the whole text should go to the model.
+    """
+    pairs, labels = _segment_plan(text, target_code, config["min_confidence"])
+    if all(label is None for label in labels):
+        # Every segment is short; the text as a whole may still be clear
+        code, confidence = detect_local(text)
+        if code == target_code and confidence >= config["min_confidence"]:
+            return _skipped(text, target_language, target_code)
+        return None
+    if True not in labels:
+        return None
+    # Short segments go with the segment before them (the first decided one at the start)
+    first = next(label for label in labels if label is not None)
+    previous = first
+    for index, label in enumerate(labels):
+        if label is None:
+            labels[index] = previous
+        else:
+            previous = label
+    if all(labels):
+        return _skipped(text, target_language, target_code)
+
+    # Consecutive segments with the same label form one run: [keep, [(segment, separator), ...]]
+    runs = []
+    for pair, keep in zip(pairs, labels):
+        if runs and runs[-1][0] == keep:
+            runs[-1][1].append(pair)
+        else:
+            runs.append([keep, [pair]])
+    foreign = [run for run in runs if not run[0]]
+    if len(foreign) > config["max_runs"]:
+        return None
+
+    output = []
+    for keep, run_pairs in runs:
+        run_text = "".join(segment + separator for segment, separator in run_pairs[:-1]) + run_pairs[-1][0]
+        if not keep:
+            run_text = invoke_prompt(
+                "translate", AUTO_PROMPT, {"text": run_text, "target_language": target_language}, temperature=0.1
+            ).content.strip()
+        output.append(run_text + run_pairs[-1][1])
+    metrics.translation_shortcuts.inc(outcome="partial")
+    return {
+        "translated_text": "".join(output),
+        "source_language": "mixed",
+        "target_language": target_language,
+        "original_text": text,
+        "segments": {"total": len(pairs), "translated": sum(len(run[1]) for run in foreign)},
+    }
+
+
+def translate_text(text, target_language, source_language="auto"):
+    """
+    Translate text from source language to target language using AI.
+    With auto-detection, text a fast local check finds to be in the target language already
+    is returned unchanged (`skipped: same_language`), and in mixed text only the foreign
+    segments are sent to the model.
+    """
+    config = get_same_language_config()
+    target_code = language_code(target_language) if config["enabled"] else None
+
+    if source_language == "auto":
         try:
-            translation = result.invoke({"text": text, "target_language": target_language})
+            if target_code is not None:
+                result = _translate_mixed(text, target_language, target_code, config)
+                if result is not None:
+                    return result
+            translation = invoke_prompt(
+                "translate", AUTO_PROMPT, {"text": text, "target_language": target_language}, temperature=0.1
+            )
             return {
                 "translated_text": translation.content.strip(),
                 "source_language": "auto-detected",
                 "target_language": target_language,
                 "original_text": text
             }
+        except ServiceError:
+            raise
         except Exception as e:
             return {"error": f"Translation failed: {str(e)}"}
     else:
+        if target_code is not None and language_code(source_language) == target_code:
+            return _skipped(text, target_language, source_language)
+
         prompt = PromptTemplate(
             input_variables=["text", "source_language", "target_language"],
             template="""Translate the following text from {source_language} to {target_language}. Maintain the original meaning and tone.
@@ -35,21 +160,20 @@ Text to translate: {text}
 
 Provide only the translation without any additional explanation."""
         )
-        
-        llm = get_initialized_llm(model="gemini-2.0-flash", temperature=0.1)
-        result = prompt | llm
-        
+
         try:
-            translation = result.invoke({
-                "text": text, 
+            translation = invoke_prompt("translate", prompt, {
+                "text": text,
                 "source_language": source_language,
                 "target_language": target_language
-            })
+            }, temperature=0.1)
             return {
                 "translated_text": translation.content.strip(),
                 "source_language": source_language,
                 "target_language": target_language,
                 "original_text": text
             }
+        except ServiceError:
+            raise
         except Exception as e:
             return {"error": f"Translation failed: {str(e)}"}
@@ -0,0 +1,73 @@
+"""
+Per-service token budgets.
+Prompts are measured with the local estimator before they are sent upstream, so oversized
+requests are rejected (or truncated) without tying up a worker on the LLM call.
+"""
+
+from django.conf import settings
+
+from ..exceptions import TokenBudgetExceeded
+from .text_chunker import CHARS_PER_TOKEN, estimate_tokens
+
+# input: max estimated prompt tokens, output: max_output_tokens passed to the model,
+# overflow: "reject" raises TokenBudgetExceeded (413), "truncate" trims the text variable to fit
+DEFAULT_TOKEN_BUDGETS = {
+    "default": {"input": 30000, "output": 2048, "overflow": "reject"},
+    "summarize": {"input": 100000, "output": 1024, "overflow": "reject"},
+    "sentiment": {"input": 4000, "output": 16, "overflow": "truncate"},
+    "keywords": {"input": 30000, "output": 256, "overflow": "reject"},
+    "classify": {"input": 30000, "output": 64, "overflow": "reject"},
+    "detect_language": {"input": 2000, "output": 32, "overflow": "truncate"},
+    "translate": {"input": 30000, "output": 8192, "overflow": "reject"},
+    "answer": {"input": 100000, "output": 1024, "overflow": "reject"},
+    "generate": {"input": 4000, "output": 4096, "overflow": "reject"},
+    # Micro-batched calls (logic.batching); over budget the texts are sent individually
+    "sentiment_batch": {"input": 8000, "output": 1024, "overflow": "reject"},
+    "detect_language_batch": {"input": 8000, "output": 1024, "overflow": "reject"},
+    "classify_batch": {"input": 8000, "output": 1024, "overflow": "reject"},
+}
+
+
+def get_token_budget(service):
+    """Return the budget for a service, with settings.AI_SERVICE_TOKEN_BUDGETS taking precedence."""
+    overrides = getattr(settings, "AI_SERVICE_TOKEN_BUDGETS", {})
+    budget = dict(DEFAULT_TOKEN_BUDGETS["default"])
+    budget.update(DEFAULT_TOKEN_BUDGETS.get(service, {}))
+    budget.update(overrides.get("default", {}))
+    budget.update(overrides.get(service, {}))
+    return budget
+
+
+def render_within_budget(service, prompt, variables, truncate_field="text"):
+    """
+    Render the prompt and enforce the service's input budget.
+    Returns (rendered_prompt, estimated_tokens, truncated).
+    """
+    budget = get_token_budget(service)
+    rendered = prompt.format(**variables)
+    estimated = estimate_tokens(rendered)
+    limit = budget["input"]
+
+    if estimated <= limit:
+        return rendered, estimated, False
+
+    field_text = variables.get(truncate_field) if truncate_field else None
+    if budget["overflow"] != "truncate" or not field_text:
+        raise TokenBudgetExceeded(
+            f"Input is estimated at {estimated} tokens; the {service} limit is {limit}",
+            estimated_input_tokens=estimated,
+            input_token_limit=limit,
+        )
+
+    # Keep as much of the text as fits next to the fixed part of the prompt
+    overhead = estimated - estimate_tokens(field_text)
+    keep_chars = max(0, (limit - overhead) * CHARS_PER_TOKEN)
+    if keep_chars == 0:
+        raise TokenBudgetExceeded(
+            f"The {service} prompt alone exceeds the {limit} token limit",
+            estimated_input_tokens=estimated,
+            input_token_limit=limit,
+        )
+    variables = dict(variables, **{truncate_field: field_text[:keep_chars]})
+    rendered = prompt.format(**variables)
+    return rendered, estimate_tokens(rendered), True
@@ -0,0 +1,322 @@
+"""
+Timeouts and hedging for upstream LLM calls.
+Calls run on a shared thread pool so the caller can stop waiting at the service's timeout.
+For idempotent low-temperature services a second (hedge) call is fired when the first one
+is slower than the observed p95, and whichever answers first wins.
+A client deadline shortens the wait, and a client disconnect ends it; attempts still running
+then are left to finish on their own and their time is counted as wasted.
+Attempts nobody waits for any more (timed out, abandoned, or losing hedges) still hold a pool
+worker until the provider answers; once AI_UPSTREAM_MAX_ORPHANS of them are running, new calls
+are rejected instead of queueing behind them.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+from .. import metrics
+from ..exceptions import DeadlineExceeded, RequestCancelled, ServiceOverloaded, UpstreamTimeout
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUTS = {
+    "default": 30.0,
+    "sentiment": 10.0,
+    "detect_language": 10.0,
+    "classify": 15.0,
+    "keywords": 20.0,
+    "generate": 60.0,
+    "summarize": 60.0,
+    "sentiment_batch": 15.0,
+    "detect_language_batch": 15.0,
+    "classify_batch": 20.0,
+}
+
+DEFAULT_HEDGING = {
+    "enabled": False,
+    "services": ["sentiment", "detect_language", "classify", "keywords"],
+    "max_temperature": 0.2,
+    "percentile": 95,
+    "min_samples": 20,
+    "budget_ratio": 0.05,  # at most ~5% of calls may be hedged
+    "budget_burst": 5,
+}
+
+# Seconds between checks for a client disconnect while waiting for an answer
+CANCEL_POLL_SECONDS = 0.1
+
+# Reasons for wasted upstream work
+DEADLINE = "deadline"
+DISCONNECT = "disconnect"
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, "AI_UPSTREAM_MAX_WORKERS", 32),
+                    thread_name_prefix="llm-upstream",
+                )
+    return _executor
+
+
+def get_timeout(service):
+    timeouts = dict(DEFAULT_TIMEOUTS)
+    timeouts.update(getattr(settings, "AI_SERVICE_TIMEOUTS", {}))
+    return float(timeouts.get(service, timeouts["default"]))
+
+
+def get_hedging_config():
+    config = dict(DEFAULT_HEDGING)
+    config.update(getattr(settings, "AI_HEDGING", {}))
+    return config
+
+
+class LatencyWindow:
+    """Rolling window of recent successful call latencies"""
+
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, q, min_samples=1):
+        with self.lock:
+            if len(self.samples) < min_samples:
+                return None
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * q / 100))
+        return ordered[index]
+
+
+class HedgeBudget:
+    """Token bucket: every call earns `ratio` tokens, every hedge spends one."""
+
+    def __init__(self, ratio, burst):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+        self.lock = threading.Lock()
+
+    def earn(self):
+        with self.lock:
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def spend(self):
+        with self.lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+_windows = {}
+_stats = {}
+_state_lock = threading.Lock()
+_budget = None
+_orphans = 0  # attempts still running that nobody waits for
+
+
+def _window(service, model):
+    with _state_lock:
+        return _windows.setdefault((service, model), LatencyWindow())
+
+
+def _count(service, name, amount=1):
+    with _state_lock:
+        counters = _stats.setdefault(service, {
+            "calls": 0, "errors": 0, "timeouts": 0, "hedges": 0, "hedge_wins": 0, "hedges_denied": 0,
+            "deadline_exceeded": 0, "cancelled": 0, "orphaned": 0, "rejected_orphans_full": 0,
+        })
+        counters[name] += amount
+    metrics.upstream_events.inc(amount, service=service, event=name)
+
+
+def _hedge_budget(config):
+    global _budget
+    if _budget is None:
+        with _state_lock:
+            if _budget is None:
+                _budget = HedgeBudget(config["budget_ratio"], config["budget_burst"])
+    return _budget
+
+
+def _hedge_delay(service, model, temperature):
+    """Seconds to wait before hedging, or None if this call must not be hedged."""
+    config = get_hedging_config()
+    if not config["enabled"] or service not in config["services"]:
+        return None
+    if temperature > config["max_temperature"]:
+        return None
+    return _window(service, model).percentile(config["percentile"], config["min_samples"])
+
+
+def record_wasted(service, seconds, reason):
+    """Count upstream time spent on an answer nobody will read"""
+    metrics.upstream_wasted.inc(seconds, service=service, reason=reason)
+
+
+def _max_orphans():
+    workers = getattr(settings, "AI_UPSTREAM_MAX_WORKERS", 32)
+    return getattr(settings, "AI_UPSTREAM_MAX_ORPHANS", workers // 2)
+
+
+def _orphan(service, future, on_done=None):
+    """Leave an attempt to finish on its own, counting it until it does"""
+    global _orphans
+    if future.done() or future.cancel():
+        return
+    with _state_lock:
+        _orphans += 1
+    _count(service, "orphaned")
+    metrics.upstream_orphans.inc()
+
+    def finished(_):
+        global _orphans
+        with _state_lock:
+            _orphans -= 1
+        metrics.upstream_orphans.dec()
+        if on_done is not None:
+            on_done()
+
+    future.add_done_callback(finished)
+
+
+def _abandon(service, attempts, reason):
+    for future, started in attempts.items():
+        # The provider call cannot be interrupted; its time is counted once it ends
+        _orphan(service, future, lambda started=started: record_wasted(service, time.monotonic() - started, reason))
+
+
+def ensure_capacity(service):
+    """Raise ServiceOverloaded while the pool is held by too many orphaned attempts"""
+    limit = _max_orphans()
+    with _state_lock:
+        full = _orphans >= limit
+    if full:
+        _count(service, "rejected_orphans_full")
+        logger.warning(f"Rejected {service} call: {limit} abandoned upstream calls are still running")
+        raise ServiceOverloaded(
+            "The AI model is busy finishing abandoned calls. Please try again shortly.",
+            retry_after=1,
+        )
+
+
+def call_upstream(service, model, func, temperature=0.0, timeout=None, deadline=None, cancelled=None):
+    """
+    Run func() (the upstream call) with the service's timeout, hedging when allowed.
+    Raises UpstreamTimeout if no attempt answers in time; otherwise returns the first
+    successful result or re-raises the last attempt's error.
+    `deadline` (time.monotonic()) is when the client stops waiting: DeadlineExceeded if it
+    comes before an answer. Setting the `cancelled` event raises RequestCancelled.
+    """
+    timeout = get_timeout(service) if timeout is None else timeout
+    executor = _get_executor()
+    started = time.monotonic()
+    expires = started + timeout
+    client_deadline = deadline is not None and deadline < expires
+    if client_deadline:
+        expires = deadline
+        timeout = max(0.0, deadline - started)
+    if cancelled is not None and cancelled.is_set():
+        raise RequestCancelled("The client disconnected")
+    if timeout <= 0:
+        metrics.deadline_rejections.inc(stage="dispatch")
+        raise DeadlineExceeded("The request's deadline passed before the AI model was called")
+
+    _count(service, "calls")
+    hedge_delay = _hedge_delay(service, model, temperature)
+    if hedge_delay is not None:
+        _hedge_budget(get_hedging_config()).earn()
+
+    primary = executor.submit(func)
+    pending = {primary}
+    attempts = {primary: started}
+
+    if hedge_delay is not None and hedge_delay < timeout:
+        # Wait for the hedge point in steps, like the main wait below, so a disconnect ends
+        # the wait and never fires a hedge; the timeout already stops at the client deadline
+        hedge_at = started + hedge_delay
+        done = set()
+        while not done and not (cancelled is not None and cancelled.is_set()):
+            remaining = min(hedge_at, expires) - time.monotonic()
+            if remaining <= 0:
+                break
+            if cancelled is not None:
+                remaining = min(remaining, CANCEL_POLL_SECONDS)
+            done, _ = wait(pending, timeout=remaining)
+        if not done and not (cancelled is not None and cancelled.is_set()) and time.monotonic() < expires:
+            if _hedge_budget(get_hedging_config()).spend():
+                _count(service, "hedges")
+                hedge = executor.submit(func)
+                pending.add(hedge)
+                attempts[hedge] = time.monotonic()
+            else:
+                _count(service, "hedges_denied")
+
+    error = None
+    while pending and not (cancelled is not None and cancelled.is_set()):
+        remaining = expires - time.monotonic()
+        if remaining <= 0:
+            break
+        if cancelled is not None:
+            remaining = min(remaining, CANCEL_POLL_SECONDS)
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                _window(service, model).record(time.monotonic() - started)
+                if future is not primary:
+                    _count(service, "hedge_wins")
+                for other in pending:
+                    _orphan(service, other)
+                return future.result()
+            error = future.exception()
+
+    if pending and cancelled is not None and cancelled.is_set():
+        _abandon(service, attempts, DISCONNECT)
+        _count(service, "cancelled")
+        raise RequestCancelled("The client disconnected")
+    if pending and client_deadline:
+        _abandon(service, attempts, DEADLINE)
+        _count(service, "deadline_exceeded")
+        raise DeadlineExceeded(
+            f"The AI model did not respond within the request's deadline ({timeout:.1f} seconds left)",
+        )
+    if pending:
+        for future in pending:
+            _orphan(service, future)
+        _count(service, "timeouts")
+        logger.warning(f"Upstream call for {service} ({model}) timed out after {timeout:.1f}s")
+        raise UpstreamTimeout(
+            f"The AI model did not respond within {timeout:g} seconds",
+            timeout_seconds=timeout,
+        )
+    _count(service, "errors")
+    raise error
+
+
+def upstream_stats():
+    """Counters and observed latency percentiles, keyed by service"""
+    with _state_lock:
+        stats = {service: dict(counters) for service, counters in _stats.items()}
+        windows = list(_windows.items())
+    for (service, model), window in windows:
+        latency = stats.setdefault(service, {}).setdefault("latency", {})
+        latency[model] = {
+            "p50": window.percentile(50),
+            "p95": window.percentile(95),
+            "samples": len(window.samples),
+        }
+    return stats
@@ -0,0 +1,53 @@
+import fnmatch
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from ai_services.benchmarks import SUITE, run_suite
+
+
+class Command(BaseCommand):
+    help = "Run the in-process microbenchmarks against a throwaway test database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('patterns', nargs='*',
+                            help='Only run benchmarks matching these glob patterns, e.g. "serializer.*"')
+        parser.add_argument('--output', '-o', help='Write the results as JSON to this file')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per benchmark')
+        parser.add_argument('--min-time', type=float, default=0.05,
+                            help='Minimum seconds per timed run (sets the loop count)')
+        parser.add_argument('--list', action='store_true', help='List the benchmarks and exit')
+
+    def handle(self, *args, **options):
+        names = list(SUITE.benchmarks)
+        if options['patterns']:
+            names = [n for n in names if any(fnmatch.fnmatch(n, p) for p in options['patterns'])]
+            if not names:
+                raise CommandError("No benchmarks match the given patterns")
+        if options['list']:
+            self.stdout.write("\n".join(names))
+            return
+
+        def progress(name, result):
+            self.stdout.write(
+                f"{name:<45} {result['median_us']:>12.1f} us  "
+                f"(min {result['min_us']:.1f}, ±{result['stdev_us']:.1f}, {result['loops']} loops)"
+            )
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            # The offline provider stands in for the LLM; hedging would only add noise
+            with override_settings(AI_PROVIDERS=['local'], AI_HEDGING={'enabled': False}):
+                results = run_suite(names, repeat=options['repeat'], min_time=options['min_time'],
+                                    progress=progress)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {len(results['results'])} results to {options['output']}"))
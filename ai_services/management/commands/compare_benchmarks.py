@@ -0,0 +1,44 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_services.benchmarks import compare_results
+
+
+class Command(BaseCommand):
+    help = "Compare two benchmark result files and fail if anything got slower than the threshold"
+
+    def add_arguments(self, parser):
+        parser.add_argument('baseline', help='Results JSON of the reference run')
+        parser.add_argument('current', help='Results JSON of the run to check')
+        parser.add_argument('--threshold', type=float, default=10.0,
+                            help='Allowed slowdown in percent of the median time per call')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            with open(options['current']) as f:
+                current = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read benchmark results: {e}")
+
+        rows, regressions = compare_results(baseline, current, options['threshold'] / 100)
+        for name, before, after, change in rows:
+            line = f"{name:<45} {before:>12.1f} us -> {after:>12.1f} us  {change * 100:+7.1f}%"
+            if name in regressions:
+                line = self.style.ERROR(line)
+            elif change < -options['threshold'] / 100:
+                line = self.style.SUCCESS(line)
+            self.stdout.write(line)
+
+        missing = set(baseline['results']) - set(current['results'])
+        if missing:
+            self.stdout.write(f"{len(missing)} baseline benchmarks are not in the current run")
+
+        if regressions:
+            raise CommandError(
+                f"{len(regressions)} benchmark(s) regressed by more than {options['threshold']:g}%: "
+                + ", ".join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS(f"No regressions over {options['threshold']:g}% in {len(rows)} benchmarks"))
@@ -0,0 +1,178 @@
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_services.benchmarks import sample_payload
+
+ENDPOINTS = {
+    "summarize": "summarize/",
+    "sentiment": "sentiment/",
+    "keywords": "keywords/",
+    "classify": "classify/",
+    "detect_language": "detect-language/",
+    "translate": "translate/",
+    "answer": "answer/",
+    "generate": "generate/",
+}
+
+# Request mix weighted towards the cheap, high-volume services
+DEFAULT_MIX = "sentiment=30,classify=15,detect_language=15,keywords=10,translate=10,summarize=10,answer=5,generate=5"
+
+# Input sizes (characters) drawn uniformly for each request
+DEFAULT_SIZES = "200,1000,4000"
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return None
+    rank = max(0, min(len(values) - 1, int(round(pct / 100 * len(values))) - 1))
+    return values[rank]
+
+
+def parse_pairs(value, convert):
+    pairs = []
+    for item in value.split(","):
+        name, _, amount = item.partition("=" if "=" in item else ":")
+        pairs.append((name.strip(), convert(amount)))
+    return pairs
+
+
+class Command(BaseCommand):
+    help = "Drive the eight service endpoints of a running server with a request mix and concurrency ramp"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000/api/services/',
+                            help='Base URL the endpoint paths are appended to')
+        parser.add_argument('--api-key', required=True, help='API key sent in X-API-Key')
+        parser.add_argument('--stages', default='5:30,20:30,50:30',
+                            help='Concurrency ramp as concurrency:seconds pairs, run in order')
+        parser.add_argument('--mix', default=DEFAULT_MIX,
+                            help='Endpoint weights as service=weight pairs')
+        parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                            help='Comma-separated input sizes in characters')
+        parser.add_argument('--timeout', type=float, default=120.0, help='Client timeout per request')
+        parser.add_argument('--output', '-o', help='Write per-stage and per-endpoint results as JSON')
+
+    def handle(self, *args, **options):
+        try:
+            stages = parse_pairs(options['stages'], float)
+            mix = parse_pairs(options['mix'], float)
+            sizes = [int(size) for size in options['sizes'].split(",")]
+        except ValueError as e:
+            raise CommandError(f"Invalid --stages, --mix or --sizes: {e}")
+        unknown = [name for name, _ in mix if name not in ENDPOINTS]
+        if unknown:
+            raise CommandError(f"Unknown services in --mix: {', '.join(unknown)}")
+
+        self.base_url = options['url'].rstrip('/') + '/'
+        self.api_key = options['api_key']
+        self.timeout = options['timeout']
+        self.services = [name for name, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.sizes = sizes
+
+        report = {"stages": [], "endpoints": {}}
+        all_samples = []
+        for concurrency, duration in stages:
+            samples = self.run_stage(int(concurrency), duration)
+            all_samples.extend(samples)
+            summary = self.summarize(samples, duration)
+            summary["concurrency"] = int(concurrency)
+            report["stages"].append(summary)
+            self.stdout.write(
+                f"concurrency {int(concurrency):>4}: {summary['requests']:>6} requests, "
+                f"{summary['rps']:>7.1f} req/s, errors {summary['error_rate'] * 100:5.1f}%, "
+                f"p50 {self.ms(summary['p50'])}, p95 {self.ms(summary['p95'])}, p99 {self.ms(summary['p99'])}"
+            )
+
+        total_duration = sum(duration for _, duration in stages)
+        by_endpoint = defaultdict(list)
+        for sample in all_samples:
+            by_endpoint[sample[0]].append(sample)
+        self.stdout.write("")
+        self.stdout.write(f"{'endpoint':<16} {'requests':>8} {'req/s':>7} {'errors':>7} "
+                          f"{'p50':>9} {'p90':>9} {'p95':>9} {'p99':>9} {'max':>9}  statuses")
+        for service in self.services:
+            samples = by_endpoint.get(service, [])
+            summary = self.summarize(samples, total_duration)
+            report["endpoints"][service] = summary
+            statuses = ", ".join(f"{code}: {count}" for code, count in sorted(summary["statuses"].items()))
+            self.stdout.write(
+                f"{service:<16} {summary['requests']:>8} {summary['rps']:>7.1f} "
+                f"{summary['error_rate'] * 100:>6.1f}% {self.ms(summary['p50'])} {self.ms(summary['p90'])} "
+                f"{self.ms(summary['p95'])} {self.ms(summary['p99'])} {self.ms(summary['max'])}  {statuses}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote results to {options['output']}"))
+
+    def run_stage(self, concurrency, duration):
+        """Run `concurrency` closed-loop clients for `duration` seconds"""
+        deadline = time.monotonic() + duration
+        samples = []
+        lock = threading.Lock()
+
+        def client():
+            rng = random.Random()
+            while time.monotonic() < deadline:
+                service = rng.choices(self.services, self.weights)[0]
+                sample = self.send(service, sample_payload(service, rng.choice(self.sizes)))
+                with lock:
+                    samples.append(sample)
+
+        threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return samples
+
+    def send(self, service, payload):
+        """POST one request; returns (service, status, seconds) with status 0 for connection errors"""
+        request = urllib.request.Request(
+            self.base_url + ENDPOINTS[service],
+            data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json', 'X-API-Key': self.api_key},
+            method='POST',
+        )
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            status = e.code
+        except (urllib.error.URLError, OSError):
+            status = 0
+        return service, status, time.perf_counter() - started
+
+    def summarize(self, samples, duration):
+        latencies = sorted(seconds for _, status, seconds in samples if 200 <= status < 300)
+        statuses = defaultdict(int)
+        for _, status, _ in samples:
+            statuses[status] += 1
+        errors = sum(count for status, count in statuses.items() if not 200 <= status < 300)
+        return {
+            "requests": len(samples),
+            "rps": len(samples) / duration if duration else 0.0,
+            "error_rate": errors / len(samples) if samples else 0.0,
+            "p50": percentile(latencies, 50),
+            "p90": percentile(latencies, 90),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1] if latencies else None,
+            "statuses": dict(statuses),
+        }
+
+    def ms(self, seconds):
+        return f"{seconds * 1000:>7.0f}ms" if seconds is not None else f"{'-':>9}"
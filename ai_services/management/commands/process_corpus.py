@@ -0,0 +1,209 @@
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from ai_services.corpus import Checkpoint, RateLimiter, RecordError, prepare_record, read_records
+from ai_services.exceptions import ServiceError
+from ai_services.logic.concurrency import ANONYMOUS, BULK, tenant_for
+from ai_services.logic.model_router import LATENCY_HINTS, QUALITY_HINTS
+from ai_services.models import APIKey
+from ai_services.services import SERVICES, run_service
+
+
+class Command(BaseCommand):
+    help = "Run a service over a JSONL or CSV corpus and write the results to JSONL, resuming interrupted runs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('service', choices=sorted(SERVICES), help='Service to run on every record')
+        parser.add_argument('input', help='JSONL or CSV file with one request body per record')
+        parser.add_argument('--output', '-o', required=True, help='JSONL file the results are written to')
+        parser.add_argument('--format', choices=['jsonl', 'csv'],
+                            help='Input format (default: from the file extension)')
+        parser.add_argument('--threads', type=int, default=16,
+                            help='Records run at once; each holds a thread while it waits for the model')
+        parser.add_argument('--processes', type=int, default=0,
+                            help='Worker processes that validate and prepare records (0: prepare in the threads)')
+        parser.add_argument('--rate', type=float, help='Maximum records started per second')
+        parser.add_argument('--checkpoint', help='Checkpoint file (default: <output>.checkpoint)')
+        parser.add_argument('--checkpoint-interval', type=float, default=10.0,
+                            help='Seconds between checkpoints')
+        parser.add_argument('--progress-interval', type=float, default=10.0,
+                            help='Seconds between progress reports')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore an existing checkpoint and overwrite the output')
+        parser.add_argument('--id-field', default='id', help='Record field copied to the output as "id"')
+        parser.add_argument('--api-key', help='API key whose documents and category sets the records may reference')
+        parser.add_argument('--quality', choices=QUALITY_HINTS, help='Routing hint for every record')
+        parser.add_argument('--latency', choices=LATENCY_HINTS, help='Routing hint for every record')
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['input']):
+            raise CommandError(f"Input file {options['input']} does not exist")
+        if options['threads'] < 1 or options['processes'] < 0:
+            raise CommandError("--threads must be at least 1 and --processes at least 0")
+        if options['rate'] is not None and options['rate'] <= 0:
+            raise CommandError("--rate must be positive")
+
+        self.service = options['service']
+        self.id_field = options['id_field']
+        self.api_key = None
+        if options['api_key']:
+            try:
+                self.api_key = APIKey.objects.get(key=options['api_key'], is_active=True)
+            except APIKey.DoesNotExist:
+                raise CommandError("Unknown or inactive API key")
+        self.tenant = tenant_for(self.api_key, BULK) if self.api_key else ANONYMOUS._replace(priority_class=BULK)
+        self.hints = {name: options[name] for name in ('quality', 'latency') if options[name]}
+        self.limiter = RateLimiter(options['rate']) if options['rate'] else None
+
+        checkpoint = self.open_checkpoint(options)
+        if checkpoint is None:
+            return
+        output = open(options['output'], 'ab')
+
+        self.process_pool = None
+        if options['processes']:
+            # Forked workers must not share the parent's database connections
+            connections.close_all()
+            self.process_pool = ProcessPoolExecutor(max_workers=options['processes'], initializer=django.setup)
+        executor = ThreadPoolExecutor(max_workers=options['threads'], thread_name_prefix='corpus')
+        window = options['threads'] * 2
+
+        self.stats = {'succeeded': 0, 'failed': 0, 'skipped': 0}
+        self.started = time.monotonic()
+        last_checkpoint = last_progress = self.started
+        running = {}
+        self.stdout.write(
+            f"Running {self.service} over {options['input']} "
+            f"({options['threads']} threads, {options['processes']} processes)"
+        )
+        try:
+            records = read_records(options['input'], options['format'])
+            for index, record in records:
+                if checkpoint.is_done(index):
+                    self.stats['skipped'] += 1
+                    continue
+                while len(running) >= window:
+                    self.record(running, wait(running, return_when=FIRST_COMPLETED).done, output, checkpoint)
+                running[executor.submit(self.run_record, index, record)] = index
+
+                now = time.monotonic()
+                if now - last_checkpoint >= options['checkpoint_interval']:
+                    self.save(output, checkpoint)
+                    last_checkpoint = now
+                if now - last_progress >= options['progress_interval']:
+                    self.progress(len(running))
+                    last_progress = now
+
+            while running:
+                done, _ = wait(running, timeout=options['progress_interval'], return_when=FIRST_COMPLETED)
+                self.record(running, done, output, checkpoint)
+                now = time.monotonic()
+                if now - last_checkpoint >= options['checkpoint_interval']:
+                    self.save(output, checkpoint)
+                    last_checkpoint = now
+                if now - last_progress >= options['progress_interval']:
+                    self.progress(len(running))
+                    last_progress = now
+            self.save(output, checkpoint, complete=True)
+            self.stdout.write(self.style.SUCCESS(f"Finished: {self.summary()}; results in {options['output']}"))
+        except KeyboardInterrupt:
+            pending = [future for future in running if future.cancel()]
+            for future in pending:
+                running.pop(future)
+            self.stdout.write(f"Interrupted, finishing {len(running)} running records")
+            self.record(running, wait(running).done, output, checkpoint)
+            self.save(output, checkpoint)
+            self.stdout.write(f"Stopped: {self.summary()}; run the same command again to resume")
+        finally:
+            executor.shutdown(wait=True)
+            if self.process_pool is not None:
+                self.process_pool.shutdown(wait=True)
+            output.close()
+
+    def open_checkpoint(self, options):
+        """The checkpoint to resume from (output truncated to match), a fresh one, or None when done"""
+        path = options['checkpoint'] or f"{options['output']}.checkpoint"
+        checkpoint = None
+        if options['restart']:
+            if os.path.exists(path):
+                os.remove(path)
+        else:
+            try:
+                checkpoint = Checkpoint.load(path, options['input'], self.service)
+            except (ValueError, KeyError) as e:
+                raise CommandError(f"Cannot resume: {e}. Pass --restart to start over")
+
+        if checkpoint is None:
+            if not options['restart'] and os.path.exists(options['output']) and os.path.getsize(options['output']):
+                raise CommandError(f"{options['output']} already exists; pass --restart to overwrite it")
+            open(options['output'], 'wb').close()
+            return Checkpoint(path, options['input'], self.service)
+
+        if checkpoint.complete:
+            self.stdout.write(f"{options['input']} was already processed into {options['output']}")
+            return None
+        # Results written after the last checkpoint are not recorded as done; they are run again
+        with open(options['output'], 'r+b') as f:
+            f.truncate(checkpoint.output_bytes)
+        self.stdout.write(f"Resuming from checkpoint: records before {checkpoint.next_index} are done")
+        return checkpoint
+
+    def run_record(self, index, record):
+        """Prepare and run one record; returns (encoded output line, failed)"""
+        record_id = None
+        try:
+            if isinstance(record, RecordError):
+                raise record
+            record_id = record.pop(self.id_field, None)
+            if self.process_pool is not None:
+                arguments = self.process_pool.submit(prepare_record, self.service, record, self.api_key).result()
+            else:
+                arguments = prepare_record(self.service, record, self.api_key)
+            if self.limiter is not None:
+                self.limiter.acquire()
+            result = run_service(self.service, arguments, self.tenant, **self.hints)
+            if isinstance(result, dict) and 'error' in result:
+                raise RecordError(result)
+            output = {'result': result}
+        except RecordError as e:
+            output = {'error': e.error}
+        except ServiceError as e:
+            output = {'error': e.to_dict()}
+        except Exception as e:
+            output = {'error': {'error': 'Processing failed', 'message': str(e)}}
+        if record_id is not None:
+            output = {'id': record_id, **output}
+        output = {'index': index, **output}
+        return json.dumps(output, ensure_ascii=False, default=str).encode('utf-8') + b'\n', 'error' in output
+
+    def record(self, running, done, output, checkpoint):
+        for future in done:
+            index = running.pop(future)
+            line, failed = future.result()
+            output.write(line)
+            checkpoint.mark(index)
+            self.stats['failed' if failed else 'succeeded'] += 1
+
+    def save(self, output, checkpoint, complete=False):
+        output.flush()
+        os.fsync(output.fileno())
+        checkpoint.save(output.tell(), complete=complete)
+
+    def summary(self):
+        processed = self.stats['succeeded'] + self.stats['failed']
+        elapsed = time.monotonic() - self.started
+        throughput = processed / elapsed if elapsed else 0.0
+        text = (f"{processed} records ({self.stats['failed']} failed) in {elapsed:.1f}s, "
+                f"{throughput:.1f} records/s")
+        if self.stats['skipped']:
+            text += f", {self.stats['skipped']} already done"
+        return text
+
+    def progress(self, in_flight):
+        self.stdout.write(f"{self.summary()}, {in_flight} in flight")
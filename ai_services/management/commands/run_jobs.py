@@ -0,0 +1,88 @@
+import os
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from ai_services.jobs import (
+    JobFailed, claim_jobs, complete_job, execute_job, fail_job, heartbeat_jobs, job_tenant, prepare_job,
+    purge_expired_jobs, requeue_stale_jobs
+)
+
+
+class Command(BaseCommand):
+    help = "Run queued service jobs from the database-backed job queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.JOB_WORKER_CONCURRENCY,
+                            help='Number of jobs to run at once')
+        parser.add_argument('--pool', choices=['thread', 'process'], default=settings.JOB_WORKER_POOL,
+                            help='Run jobs in a thread pool or a process pool')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is drained instead of polling forever')
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+        if options['pool'] == 'process':
+            # Forked workers must not share the parent's database connections
+            connections.close_all()
+            executor = ProcessPoolExecutor(max_workers=concurrency)
+        else:
+            executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='job')
+
+        self.stdout.write(f"Job worker {worker_id} started ({options['pool']} pool, concurrency {concurrency})")
+        running = {}
+        last_maintenance = 0
+        last_heartbeat = time.monotonic()
+        try:
+            while True:
+                if time.monotonic() - last_heartbeat > settings.JOB_HEARTBEAT_SECONDS:
+                    heartbeat_jobs(running.values())
+                    last_heartbeat = time.monotonic()
+                if time.monotonic() - last_maintenance > 60:
+                    requeue_stale_jobs()
+                    purge_expired_jobs()
+                    last_maintenance = time.monotonic()
+
+                free = concurrency - len(running)
+                jobs = claim_jobs(worker_id, free) if free else []
+                for job in jobs:
+                    try:
+                        arguments, hints = prepare_job(job)
+                    except JobFailed as e:
+                        fail_job(job, e, retryable=False)
+                        continue
+                    running[executor.submit(execute_job, job.service, arguments, hints, job_tenant(job))] = job
+
+                if not running:
+                    if options['once']:
+                        break
+                    close_old_connections()
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                done, _ = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                self.record(running, done)
+        except KeyboardInterrupt:
+            self.stdout.write(f"Stopping job worker, finishing {len(running)} running jobs")
+            self.record(running, wait(running).done)
+        finally:
+            executor.shutdown(wait=True)
+
+    def record(self, running, done):
+        for future in done:
+            job = running.pop(future)
+            try:
+                complete_job(job, future.result())
+                self.stdout.write(f"Job {job.id} ({job.service}) succeeded")
+            except JobFailed as e:
+                fail_job(job, e, retryable=False)
+            except Exception as e:
+                fail_job(job, e)
@@ -0,0 +1,427 @@
+"""
+In-process metrics with Prometheus text exposition.
+
+Writers never take a lock: each thread updates its own shard of every metric, and shards
+are only summed when /metrics is scraped. Under multi-process servers (gunicorn) set
+METRICS_MULTIPROC_DIR; every process then periodically writes a snapshot there and the
+scraped process merges them (counters and histograms of exited processes are kept,
+gauges only count live processes). Snapshots of exited processes are folded into one
+archive file, by gunicorn's child_exit hook or at the next scrape.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Metric:
+    """A labelled metric whose values are sharded per thread"""
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = {}
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def _values(self):
+        values = getattr(self._local, 'values', None)
+        if values is None:
+            values = {}
+            with self._lock:
+                self._shards[threading.current_thread()] = values
+            self._local.values = values
+        return values
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _merge(self, target, key, value):
+        target[key] = target.get(key, 0) + value
+
+    def collect(self):
+        """Sum all shards into {label tuple: value}, folding shards of exited threads"""
+        with self._lock:
+            for thread in [t for t in self._shards if not t.is_alive()]:
+                for key, value in self._shards.pop(thread).items():
+                    self._merge(self._retired, key, value)
+            shards = [values.copy() for values in self._shards.values()]
+            total = {}
+            for key, value in self._retired.items():
+                self._merge(total, key, value)
+        for values in shards:
+            for key, value in values.items():
+                self._merge(total, key, value)
+        return total
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        values = self._values()
+        key = self._key(labels)
+        values[key] = values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Gauge built from increments, e.g. in-flight requests"""
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        values = self._values()
+        key = self._key(labels)
+        values[key] = values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        values = self._values()
+        key = self._key(labels)
+        state = values.get(key)
+        if state is None:
+            # one counter per bucket, then +Inf count and sum
+            state = values[key] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[i] += 1
+                break
+        else:
+            state[len(self.buckets)] += 1
+        state[-1] += value
+
+    def _merge(self, target, key, value):
+        current = target.get(key)
+        if current is None:
+            target[key] = list(value)
+        else:
+            target[key] = [a + b for a, b in zip(current, value)]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        """collector() returns [(name, kind, documentation, [(labels dict, value), ...]), ...]"""
+        self.collectors.append(collector)
+
+    def snapshot(self):
+        """Plain-data view of every metric in this process"""
+        families = {}
+        for metric in self.metrics:
+            families[metric.name] = {
+                'kind': metric.kind,
+                'documentation': metric.documentation,
+                'labelnames': list(metric.labelnames),
+                'buckets': list(getattr(metric, 'buckets', ())),
+                'samples': [[list(key), value] for key, value in metric.collect().items()],
+            }
+        for collector in self.collectors:
+            try:
+                collected = collector()
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {str(e)}")
+                continue
+            for name, kind, documentation, samples in collected:
+                labelnames = sorted({label for labels, _ in samples for label in labels})
+                families[name] = {
+                    'kind': kind,
+                    'documentation': documentation,
+                    'labelnames': labelnames,
+                    'buckets': [],
+                    'samples': [
+                        [[str(labels.get(label, '')) for label in labelnames], value]
+                        for labels, value in samples
+                    ],
+                }
+        return families
+
+
+REGISTRY = Registry()
+
+http_requests = REGISTRY.register(Counter(
+    'ai_services_http_requests_total', 'HTTP requests by endpoint, method and status',
+    ['endpoint', 'method', 'status'],
+))
+http_duration = REGISTRY.register(Histogram(
+    'ai_services_http_request_duration_seconds', 'HTTP request latency by endpoint', ['endpoint'],
+))
+http_in_flight = REGISTRY.register(Gauge(
+    'ai_services_http_requests_in_flight', 'HTTP requests currently being processed',
+))
+db_duration = REGISTRY.register(Histogram(
+    'ai_services_db_duration_seconds', 'Database time spent per HTTP request', ['endpoint'],
+))
+auth_duration = REGISTRY.register(Histogram(
+    'ai_services_auth_duration_seconds', 'API key authentication time (including the key lookup)',
+))
+llm_duration = REGISTRY.register(Histogram(
+    'ai_services_llm_request_duration_seconds', 'Upstream LLM call latency', ['service', 'provider', 'model'],
+))
+llm_tokens = REGISTRY.register(Counter(
+    'ai_services_llm_tokens_total', 'LLM tokens reported in response usage metadata',
+    ['service', 'model', 'direction'],
+))
+llm_errors = REGISTRY.register(Counter(
+    'ai_services_llm_errors_total', 'Failed upstream LLM calls', ['service', 'provider'],
+))
+upstream_events = REGISTRY.register(Counter(
+    'ai_services_upstream_events_total', 'Upstream call events (timeouts, hedges, hedge wins)',
+    ['service', 'event'],
+))
+llm_queue_wait = REGISTRY.register(Histogram(
+    'ai_services_llm_queue_wait_seconds', 'Time LLM calls waited for a concurrency slot', ['priority_class'],
+))
+llm_batched_items = REGISTRY.register(Counter(
+    'ai_services_llm_batched_items_total', 'Requests eligible for micro-batching, by how they were answered',
+    ['service', 'outcome'],
+))
+bulk_lines = REGISTRY.register(Counter(
+    'ai_services_bulk_lines_total', 'Lines processed by the NDJSON bulk endpoint', ['service', 'outcome'],
+))
+translation_shortcuts = REGISTRY.register(Counter(
+    'ai_services_translation_shortcuts_total',
+    'Translations answered without translating the whole text (skipped or only foreign segments)',
+    ['outcome'],
+))
+llm_shed = REGISTRY.register(Counter(
+    'ai_services_llm_shed_total', 'LLM calls rejected by the adaptive concurrency limit', ['service'],
+))
+deadline_rejections = REGISTRY.register(Counter(
+    'ai_services_deadline_rejections_total',
+    'Requests and LLM calls rejected because the client deadline had passed, by where it was noticed',
+    ['stage'],
+))
+upstream_orphans = REGISTRY.register(Gauge(
+    'ai_services_upstream_orphaned_calls',
+    'Upstream calls still running that nobody waits for (timed out, abandoned or losing hedges)',
+))
+upstream_wasted = REGISTRY.register(Counter(
+    'ai_services_upstream_wasted_seconds_total',
+    'Upstream call time spent on answers the client no longer wanted (deadline passed or disconnected)',
+    ['service', 'reason'],
+))
+
+
+def _multiproc_dir():
+    return getattr(settings, 'METRICS_MULTIPROC_DIR', None)
+
+
+ARCHIVE_FILENAME = 'metrics_archive.json'
+LOCK_FILENAME = 'metrics.lock'
+
+_last_flush = 0.0
+_flush_lock = threading.Lock()
+_snapshot_file = (None, None)
+
+
+def _snapshot_filename():
+    """
+    This process's snapshot file. The start time is part of the name, so a process that
+    gets the pid of an exited one writes a new file instead of overwriting the old totals.
+    """
+    global _snapshot_file
+    pid, filename = _snapshot_file
+    if pid != os.getpid():
+        pid = os.getpid()
+        filename = f'metrics_{pid}_{time.time_ns()}.json'
+        _snapshot_file = (pid, filename)
+    return filename
+
+
+@contextmanager
+def _directory_lock(directory, exclusive=False):
+    """Lock between processes so a scrape never sees a snapshot both archived and unarchived"""
+    import fcntl
+
+    with open(os.path.join(directory, LOCK_FILENAME), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _write_json(path, data):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def flush(force=False):
+    """Write this process's snapshot to METRICS_MULTIPROC_DIR (throttled unless forced)"""
+    global _last_flush
+    directory = _multiproc_dir()
+    if not directory:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0):
+        return
+    if not _flush_lock.acquire(blocking=False):
+        return
+    try:
+        _last_flush = now
+        path = os.path.join(directory, _snapshot_filename())
+        _write_json(path, {'pid': os.getpid(), 'families': REGISTRY.snapshot()})
+    except OSError as e:
+        logger.warning(f"Failed to write metrics snapshot: {str(e)}")
+    finally:
+        _flush_lock.release()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge_families(snapshots):
+    merged = {}
+    for snapshot, alive in snapshots:
+        for name, family in snapshot.items():
+            if family['kind'] == 'gauge' and not alive:
+                continue
+            target = merged.setdefault(name, dict(family, samples={}))
+            for key, value in family['samples']:
+                key = tuple(key)
+                current = target['samples'].get(key)
+                if current is None:
+                    target['samples'][key] = value
+                elif isinstance(value, list):
+                    target['samples'][key] = [a + b for a, b in zip(current, value)]
+                else:
+                    target['samples'][key] = current + value
+    return merged
+
+
+def _read_snapshots(directory):
+    """[(filename, data)] for every process snapshot in the directory"""
+    snapshots = []
+    for filename in os.listdir(directory):
+        if filename == ARCHIVE_FILENAME or not (filename.startswith('metrics_') and filename.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as f:
+                snapshots.append((filename, json.load(f)))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def _read_archive(directory):
+    try:
+        with open(os.path.join(directory, ARCHIVE_FILENAME)) as f:
+            return json.load(f)['families']
+    except FileNotFoundError:
+        return {}
+
+
+def archive_exited(directory=None, pid=None):
+    """
+    Fold the snapshots of exited processes into the archive file and delete them, so the
+    directory does not grow with every recycled worker. With `pid` (gunicorn's child_exit
+    hook) every snapshot of that pid is archived; otherwise those whose process is gone.
+    Counters and histograms keep their totals; gauges of exited processes are dropped.
+    """
+    directory = directory or _multiproc_dir()
+    if not directory:
+        return
+    try:
+        with _directory_lock(directory, exclusive=True):
+            exited = [
+                (filename, data) for filename, data in _read_snapshots(directory)
+                if (data['pid'] == pid if pid is not None else not _pid_alive(data['pid']))
+            ]
+            if not exited:
+                return
+            merged = _merge_families(
+                [(_read_archive(directory), False)] + [(data['families'], False) for _, data in exited]
+            )
+            for family in merged.values():
+                family['samples'] = [[list(key), value] for key, value in family['samples'].items()]
+            _write_json(os.path.join(directory, ARCHIVE_FILENAME), {'families': merged})
+            for filename, _ in exited:
+                os.remove(os.path.join(directory, filename))
+    except (OSError, ValueError) as e:
+        logger.warning(f"Failed to archive metrics snapshots: {str(e)}")
+
+
+def collect_families():
+    """All metric families, merged across processes when running multi-process"""
+    directory = _multiproc_dir()
+    if not directory:
+        return _merge_families([(REGISTRY.snapshot(), True)])
+
+    flush(force=True)
+    archive_exited(directory)
+    with _directory_lock(directory):
+        snapshots = [(_read_archive(directory), False)]
+        for _, data in _read_snapshots(directory):
+            snapshots.append((data['families'], _pid_alive(data['pid'])))
+    return _merge_families(snapshots)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def render_prometheus():
+    """Render every metric family in the Prometheus text format (version 0.0.4)"""
+    lines = []
+    for name, family in sorted(collect_families().items()):
+        lines.append(f"# HELP {name} {family['documentation']}")
+        lines.append(f"# TYPE {name} {family['kind']}")
+        names = family['labelnames']
+        for key, value in sorted(family['samples'].items()):
+            if family['kind'] != 'histogram':
+                lines.append(f'{name}{_labels(names, key)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip(family['buckets'], value):
+                cumulative += count
+                bucket_labels = _labels(names, key, 'le="%s"' % bound)
+                lines.append(f'{name}_bucket{bucket_labels} {cumulative}')
+            cumulative += value[len(family['buckets'])]
+            bucket_labels = _labels(names, key, 'le="+Inf"')
+            lines.append(f'{name}_bucket{bucket_labels} {cumulative}')
+            lines.append(f'{name}_sum{_labels(names, key)} {value[-1]}')
+            lines.append(f'{name}_count{_labels(names, key)} {cumulative}')
+    return '\n'.join(lines) + '\n'
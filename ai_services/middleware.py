@@ -1,10 +1,24 @@
+from django.conf import settings
 from django.http import JsonResponse
+from django.db import connection
+from django.utils.cache import patch_vary_headers
 from django.utils.deprecation import MiddlewareMixin
 from .models import APIKey
+from . import compression, metrics
+from .deadlines import request_deadline
+from .exceptions import DeadlineExceeded, ServiceError
+from .parsers import request_stream
+from .timing import current_timer, phase, request_timer
+import asyncio
+import io
 import json
+import logging
+import time
 import warnings
 import os
 
+logger = logging.getLogger(__name__)
+
 # Suppress the specific static files warning
 warnings.filterwarnings('ignore', message='No directory at: /var/task/staticfiles_build/static/')
 
@@ -35,6 +49,10 @@ class APIKeyAuthenticationMiddleware(MiddlewareMixin):
             '/translate/',
             '/answer/',
             '/generate/',
+            '/documents/',
+            '/category-sets/',
+            '/jobs/',
+            '/bulk/',
             # Also handle API routes with prefix
             '/api/services/summarize/',
             '/api/services/sentiment/',
@@ -43,43 +61,248 @@ class APIKeyAuthenticationMiddleware(MiddlewareMixin):
             '/api/services/detect-language/',
             '/api/services/translate/',
             '/api/services/answer/',
-            '/api/services/generate/'
+            '/api/services/generate/',
+            '/api/services/documents/',
+            '/api/services/category-sets/',
+            '/api/services/jobs/',
+            '/api/services/bulk/'
         ]
         
         # Check if the request is for an API endpoint
         if any(request.path.startswith(endpoint) for endpoint in api_endpoints):
-            # Get API key from header
-            api_key = request.META.get('HTTP_X_API_KEY')
-            
-            if not api_key:
-                # Try to get from request body if it's a POST request
-                if request.method == 'POST':
-                    try:
-                        body = json.loads(request.body.decode('utf-8'))
-                        api_key = body.get('api_key')
-                    except (json.JSONDecodeError, UnicodeDecodeError):
-                        pass
-            
-            if not api_key:
-                return JsonResponse({
-                    'error': 'API key required',
-                    'message': 'Please provide a valid API key in the X-API-Key header or request body'
-                }, status=401)
-            
-            # Validate API key
+            started = time.perf_counter()
             try:
-                api_key_obj = APIKey.objects.get(key=api_key, is_active=True)
-                # Increment usage count
-                api_key_obj.usage_count += 1
-                api_key_obj.save()
-                
-                # Add user to request for use in views
-                request.api_user = api_key_obj.user
-                
-            except APIKey.DoesNotExist:
-                return JsonResponse({
-                    'error': 'Invalid API key',
-                    'message': 'The provided API key is not valid or has been deactivated'
-                }, status=401)
+                with phase('auth'):
+                    return self.authenticate(request)
+            finally:
+                metrics.auth_duration.observe(time.perf_counter() - started)
+
+        return None
+
+    def authenticate(self, request):
+        """Resolve the request's API key; returns an error response or None"""
+        # Get API key from header
+        api_key = request.META.get('HTTP_X_API_KEY')
         
+        if not api_key:
+            # Try to get from request body if it's a JSON POST request; other bodies
+            # (text/plain, multipart uploads) are streamed by the view and must not be read here
+            if request.method == 'POST' and request.content_type == 'application/json':
+                try:
+                    body = json.loads(request.body.decode('utf-8'))
+                    api_key = body.get('api_key')
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    pass
+        
+        if not api_key:
+            return JsonResponse({
+                'error': 'API key required',
+                'message': 'Please provide a valid API key in the X-API-Key header or request body'
+            }, status=401)
+        
+        # Validate API key
+        try:
+            api_key_obj = APIKey.objects.get(key=api_key, is_active=True)
+            # Increment usage count
+            api_key_obj.usage_count += 1
+            api_key_obj.save()
+            
+            # Add user to request for use in views
+            request.api_user = api_key_obj.user
+            request.api_key = api_key_obj
+            
+        except APIKey.DoesNotExist:
+            return JsonResponse({
+                'error': 'Invalid API key',
+                'message': 'The provided API key is not valid or has been deactivated'
+            }, status=401)
+
         return None
+
+
+class MetricsMiddleware:
+    """
+    Records request counts, latency, in-flight requests and database time for /metrics.
+    Should be first in MIDDLEWARE so the whole middleware chain is measured.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path.startswith('/static/'):
+            return self.get_response(request)
+
+        db_time = [0.0]
+
+        def time_queries(execute, sql, params, many, context):
+            query_started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                db_time[0] += time.perf_counter() - query_started
+
+        started = time.perf_counter()
+        metrics.http_in_flight.inc()
+        status = 500
+        try:
+            with connection.execute_wrapper(time_queries):
+                response = self.get_response(request)
+            status = response.status_code
+            return response
+        except asyncio.CancelledError:
+            # Under ASGI, Django cancels the request when the client disconnects
+            status = 499
+            raise
+        finally:
+            metrics.http_in_flight.dec()
+            match = getattr(request, 'resolver_match', None)
+            endpoint = match.url_name if match and match.url_name else 'unmatched'
+            metrics.http_requests.inc(endpoint=endpoint, method=request.method, status=status)
+            metrics.http_duration.observe(time.perf_counter() - started, endpoint=endpoint)
+            metrics.db_duration.observe(db_time[0], endpoint=endpoint)
+            metrics.flush()
+
+
+class ServerTimingMiddleware:
+    """
+    Times request phases and database queries and reports them in a Server-Timing header.
+    The header is added when SERVER_TIMING_ENABLED is set, and always for staff users;
+    SERVER_TIMING_LOG also logs the breakdown for every request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path.startswith('/static/'):
+            return self.get_response(request)
+
+        with request_timer() as timer:
+            def count_queries(execute, sql, params, many, context):
+                query_started = time.perf_counter()
+                try:
+                    return execute(sql, params, many, context)
+                finally:
+                    timer.add_query(time.perf_counter() - query_started)
+
+            with connection.execute_wrapper(count_queries):
+                response = self.get_response(request)
+
+            header = timer.header()
+
+        if settings.SERVER_TIMING_ENABLED or self.is_staff(request):
+            response['Server-Timing'] = header
+        if settings.SERVER_TIMING_LOG:
+            logger.info(f"{request.method} {request.path} {response.status_code} {header}")
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns; time that separately
+        timer = current_timer()
+        if timer is not None:
+            started = time.perf_counter()
+            response.add_post_render_callback(lambda r: timer.add('render', time.perf_counter() - started))
+        return response
+
+    def is_staff(self, request):
+        user = getattr(request, 'api_user', None) or getattr(request, 'user', None)
+        return bool(user is not None and user.is_staff)
+
+
+class DeadlineMiddleware:
+    """
+    Reads the client's deadline (X-Request-Timeout / X-Request-Deadline) into
+    request.deadline and answers requests that are already past it with 504 before any
+    work is done for them. Goes before the compression and authentication middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            request.deadline = request_deadline(request)
+            if request.deadline is not None and request.deadline <= time.monotonic():
+                metrics.deadline_rejections.inc(stage='arrival')
+                raise DeadlineExceeded("The request's deadline passed before it could be processed")
+        except ServiceError as e:
+            return JsonResponse(e.to_dict(), status=e.status_code, headers=e.headers())
+        return self.get_response(request)
+
+
+class CompressionMiddleware:
+    """
+    Decompresses request bodies sent with a Content-Encoding and compresses responses
+    (JSON, NDJSON and plain text above RESPONSE_COMPRESSION_MIN_BYTES) for clients that
+    accept gzip or br. Goes before the authentication middleware, which may read the body.
+    text/plain, multipart and NDJSON bodies stay streamed; other bodies are decompressed here.
+    NDJSON streams have no overall size limit, since the bulk endpoint limits each line.
+    """
+    streamed_types = ('text/plain', 'multipart/form-data', 'application/x-ndjson')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.META.get('HTTP_CONTENT_ENCODING'):
+            try:
+                self.decompress_request(request)
+            except ServiceError as e:
+                return JsonResponse(e.to_dict(), status=e.status_code, headers=e.headers())
+
+        response = self.get_response(request)
+        if settings.RESPONSE_COMPRESSION_ENABLED:
+            self.compress_response(request, response)
+        return response
+
+    def decompress_request(self, request):
+        encoding = request.META['HTTP_CONTENT_ENCODING'].strip().lower()
+        if encoding == 'identity':
+            del request.META['HTTP_CONTENT_ENCODING']
+            return
+        unbounded = request.content_type == 'application/x-ndjson'
+        stream = compression.DecompressingStream(
+            request_stream(request), encoding, None if unbounded else settings.REQUEST_DECOMPRESSED_MAX_BYTES,
+        )
+        del request.META['HTTP_CONTENT_ENCODING']
+        if request.content_type in self.streamed_types:
+            # Decompressed size is unknown until read; the parsers only need a non-zero length
+            request._stream = stream
+            return
+        with phase('decompress'):
+            body = stream.read()
+        request._stream = io.BytesIO(body)
+        request.META['CONTENT_LENGTH'] = str(len(body))
+
+    def compress_response(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        if content_type not in compression.COMPRESSIBLE_TYPES:
+            return
+        if not response.streaming and len(response.content) < settings.RESPONSE_COMPRESSION_MIN_BYTES:
+            return
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = compression.negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = compression.acompress_chunks(response.streaming_content, encoding)
+            else:
+                response.streaming_content = compression.compress_chunks(response.streaming_content, encoding)
+            del response.headers['Content-Length']
+        else:
+            with phase('compress'):
+                compressed = compression.compress_bytes(response.content, encoding)
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # The representation changed, so a strong ETag no longer matches it byte for byte
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-19 13:49
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_services', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Document',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('content', models.BinaryField()),
+                ('content_hash', models.CharField(max_length=64)),
+                ('size_bytes', models.IntegerField()),
+                ('stored_bytes', models.IntegerField()),
+                ('token_count', models.IntegerField()),
+                ('chunks', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('api_key', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='documents', to='ai_services.apikey')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('api_key', 'content_hash'), name='unique_document_per_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.1 on 2026-10-19 14:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_services', '0003_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsageEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(max_length=32)),
+                ('model', models.CharField(blank=True, max_length=64)),
+                ('input_tokens', models.IntegerField(default=0)),
+                ('output_tokens', models.IntegerField(default=0)),
+                ('latency_ms', models.IntegerField()),
+                ('status_code', models.SmallIntegerField()),
+                ('created_at', models.DateTimeField(db_index=True)),
+                ('api_key', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage_events', to='ai_services.apikey')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField()),
+                ('endpoint', models.CharField(max_length=32)),
+                ('model', models.CharField(blank=True, max_length=64)),
+                ('requests', models.IntegerField(default=0)),
+                ('errors', models.IntegerField(default=0)),
+                ('input_tokens', models.BigIntegerField(default=0)),
+                ('output_tokens', models.BigIntegerField(default=0)),
+                ('total_latency_ms', models.BigIntegerField(default=0)),
+                ('api_key', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ai_services.apikey')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily usage',
+                'constraints': [models.UniqueConstraint(fields=('api_key', 'bucket_start', 'endpoint', 'model'), name='daily_usage_bucket_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlyUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField()),
+                ('endpoint', models.CharField(max_length=32)),
+                ('model', models.CharField(blank=True, max_length=64)),
+                ('requests', models.IntegerField(default=0)),
+                ('errors', models.IntegerField(default=0)),
+                ('input_tokens', models.BigIntegerField(default=0)),
+                ('output_tokens', models.BigIntegerField(default=0)),
+                ('total_latency_ms', models.BigIntegerField(default=0)),
+                ('api_key', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ai_services.apikey')),
+            ],
+            options={
+                'verbose_name_plural': 'Hourly usage',
+                'constraints': [models.UniqueConstraint(fields=('api_key', 'bucket_start', 'endpoint', 'model'), name='hourly_usage_bucket_unique')],
+            },
+        ),
+    ]
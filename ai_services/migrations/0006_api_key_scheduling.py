@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-19 14:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_services', '0005_idempotency'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apikey',
+            name='priority_class',
+            field=models.CharField(choices=[('interactive', 'Interactive'), ('bulk', 'Bulk')], default='interactive', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='apikey',
+            name='weight',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-19 14:27
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_services', '0006_api_key_scheduling'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategorySet',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100)),
+                ('categories', models.JSONField()),
+                ('prompt_block', models.TextField()),
+                ('lookup', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('api_key', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_sets', to='ai_services.apikey')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('api_key', 'name'), name='unique_category_set_name_per_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-19 14:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_services', '0007_category_set'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categoryset',
+            name='subtrees',
+            field=models.JSONField(default=dict),
+        ),
+    ]
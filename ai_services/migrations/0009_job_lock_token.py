@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-19 15:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_services', '0008_category_set_subtrees'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='lock_token',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+    ]
@@ -2,13 +2,25 @@ from django.db import models
 from django.contrib.auth.models import User
 import secrets
 import string
+import uuid
+import zlib
 
 class APIKey(models.Model):
+    INTERACTIVE = 'interactive'
+    BULK = 'bulk'
+    PRIORITY_CLASS_CHOICES = [
+        (INTERACTIVE, 'Interactive'),
+        (BULK, 'Bulk'),
+    ]
+
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='api_key')
     key = models.CharField(max_length=64, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
     usage_count = models.IntegerField(default=0)
+    # Share of upstream capacity when LLM calls queue (see ai_services.logic.concurrency)
+    weight = models.PositiveSmallIntegerField(default=1)
+    priority_class = models.CharField(max_length=16, choices=PRIORITY_CLASS_CHOICES, default=INTERACTIVE)
     
     def save(self, *args, **kwargs):
         if not self.key:
@@ -27,3 +39,188 @@ class APIKey(models.Model):
     class Meta:
         verbose_name = "API Key"
         verbose_name_plural = "API Keys"
+
+
+class Document(models.Model):
+    """Text uploaded once per API key and referenced by ID from the service endpoints."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    api_key = models.ForeignKey(APIKey, on_delete=models.CASCADE, related_name='documents')
+    content = models.BinaryField()  # zlib-compressed UTF-8 text
+    content_hash = models.CharField(max_length=64)
+    size_bytes = models.IntegerField()
+    stored_bytes = models.IntegerField()
+    token_count = models.IntegerField()
+    chunks = models.JSONField(default=list)  # [start, end) character offsets
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    @property
+    def text(self):
+        """Decompressed document text (cached on the instance)"""
+        if not hasattr(self, '_text'):
+            self._text = zlib.decompress(bytes(self.content)).decode('utf-8')
+        return self._text
+
+    def get_chunks(self):
+        """Return the precomputed chunks as strings"""
+        text = self.text
+        return [text[start:end] for start, end in self.chunks]
+
+    def __str__(self):
+        return f"Document {self.id} ({self.api_key.user.username})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['api_key', 'content_hash'], name='unique_document_per_key'),
+        ]
+
+
+class Job(models.Model):
+    """A service request queued to run outside the HTTP request/response cycle."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    api_key = models.ForeignKey(APIKey, on_delete=models.CASCADE, related_name='jobs')
+    service = models.CharField(max_length=32)
+    payload = models.JSONField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    run_after = models.DateTimeField()
+    locked_by = models.CharField(max_length=128, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)  # claim time, refreshed by the worker's heartbeat
+    lock_token = models.UUIDField(null=True, blank=True)  # new for every claim of the job
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    def __str__(self):
+        return f"Job {self.id} ({self.service}, {self.status})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_claim_idx'),
+        ]
+
+
+class UsageEvent(models.Model):
+    """One service request, appended in batches by ai_services.usage; never updated."""
+    api_key = models.ForeignKey(APIKey, on_delete=models.CASCADE, related_name='usage_events')
+    endpoint = models.CharField(max_length=32)
+    model = models.CharField(max_length=64, blank=True)
+    input_tokens = models.IntegerField(default=0)
+    output_tokens = models.IntegerField(default=0)
+    latency_ms = models.IntegerField()
+    status_code = models.SmallIntegerField()
+    created_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.endpoint} {self.status_code} at {self.created_at}"
+
+
+class UsageRollup(models.Model):
+    """Usage totals per API key, endpoint and model for one time bucket."""
+    api_key = models.ForeignKey(APIKey, on_delete=models.CASCADE, related_name='+')
+    bucket_start = models.DateTimeField()
+    endpoint = models.CharField(max_length=32)
+    model = models.CharField(max_length=64, blank=True)
+    requests = models.IntegerField(default=0)
+    errors = models.IntegerField(default=0)
+    input_tokens = models.BigIntegerField(default=0)
+    output_tokens = models.BigIntegerField(default=0)
+    total_latency_ms = models.BigIntegerField(default=0)
+
+    @property
+    def average_latency_ms(self):
+        return self.total_latency_ms / self.requests if self.requests else 0
+
+    class Meta:
+        abstract = True
+
+
+class HourlyUsage(UsageRollup):
+    class Meta:
+        verbose_name_plural = "Hourly usage"
+        constraints = [
+            models.UniqueConstraint(fields=['api_key', 'bucket_start', 'endpoint', 'model'],
+                                    name='hourly_usage_bucket_unique'),
+        ]
+
+
+class DailyUsage(UsageRollup):
+    class Meta:
+        verbose_name_plural = "Daily usage"
+        constraints = [
+            models.UniqueConstraint(fields=['api_key', 'bucket_start', 'endpoint', 'model'],
+                                    name='daily_usage_bucket_unique'),
+        ]
+
+
+class IdempotencyRecord(models.Model):
+    """The stored outcome of a service request sent with an Idempotency-Key header."""
+    IN_PROGRESS = 'in_progress'
+    COMPLETED = 'completed'
+    STATUS_CHOICES = [
+        (IN_PROGRESS, 'In progress'),
+        (COMPLETED, 'Completed'),
+    ]
+
+    api_key = models.ForeignKey(APIKey, on_delete=models.CASCADE, related_name='idempotency_records')
+    key = models.CharField(max_length=255)
+    endpoint = models.CharField(max_length=32)
+    request_hash = models.CharField(max_length=64)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=IN_PROGRESS)
+    response_status = models.SmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True)
+    locked_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Idempotency key {self.key} ({self.endpoint}, {self.status})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['api_key', 'key'], name='unique_idempotency_key_per_api_key'),
+        ]
+
+
+class CategorySet(models.Model):
+    """A named list of classification categories registered once per API key."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    api_key = models.ForeignKey(APIKey, on_delete=models.CASCADE, related_name='category_sets')
+    name = models.CharField(max_length=100)
+    categories = models.JSONField()  # [{"name", "description", "examples", "children"}]
+    prompt_block = models.TextField()  # categories as rendered into the classification prompt
+    lookup = models.JSONField()  # normalized label -> category name
+    subtrees = models.JSONField(default=dict)  # category name -> compiled children, for nested sets
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def compiled(self):
+        """The precomputed parts classify_text needs, as plain data"""
+        return {
+            'id': str(self.id),
+            'prompt_block': self.prompt_block,
+            'lookup': self.lookup,
+            'subtrees': self.subtrees,
+        }
+
+    def __str__(self):
+        return f"Category set {self.name} ({self.api_key.user.username})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['api_key', 'name'], name='unique_category_set_name_per_key'),
+        ]
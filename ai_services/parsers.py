@@ -0,0 +1,165 @@
+"""
+Request parsers that stream large text bodies instead of buffering them.
+`text/plain` bodies and multipart file uploads are decoded and chunked as they are read,
+with the size limit (UPLOAD_MAX_BYTES) enforced before and while reading. Other request
+fields come from the query string (text/plain) or the multipart form fields.
+"""
+import codecs
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler
+from django.core.handlers.wsgi import LimitedStream
+from django.http.multipartparser import MultiPartParser as DjangoMultiPartParser, MultiPartParserError
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from .exceptions import RequestBodyTooLarge
+from .logic.text_chunker import StreamingChunker
+
+READ_SIZE = 64 * 1024
+
+
+class StreamedText(dict):
+    """Parsed request data whose text field was streamed; carries the chunk spans of that text"""
+
+    def __init__(self, data, chunk_spans):
+        super().__init__(data)
+        self.chunk_spans = chunk_spans
+
+
+class TextStream:
+    """Incremental UTF-8 decoding and chunking with a byte limit"""
+
+    def __init__(self, encoding="utf-8"):
+        self.max_bytes = settings.UPLOAD_MAX_BYTES
+        self.size = 0
+        try:
+            self.decoder = codecs.getincrementaldecoder(encoding)()
+        except LookupError:
+            raise ParseError(f"Unsupported charset: {encoding}")
+        self.chunker = StreamingChunker(settings.DOCUMENT_CHUNK_TOKENS)
+
+    def feed(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise RequestBodyTooLarge(
+                f"Request body exceeds the {self.max_bytes} byte limit", max_bytes=self.max_bytes,
+            )
+        try:
+            self.chunker.feed(self.decoder.decode(data))
+        except UnicodeDecodeError:
+            raise ParseError("Request body is not valid UTF-8 text")
+
+    def close(self):
+        """Returns (text, chunk spans)"""
+        try:
+            self.chunker.feed(self.decoder.decode(b"", final=True))
+        except UnicodeDecodeError:
+            raise ParseError("Request body is not valid UTF-8 text")
+        return self.chunker.close()
+
+
+def request_stream(request):
+    """
+    The request body as a file-like object. Django limits the body to CONTENT_LENGTH, which
+    a chunked (Transfer-Encoding) upload does not have; servers that terminate the input
+    stream themselves (wsgi.input_terminated) let it be read to the end instead.
+    """
+    stream = request._stream
+    if (isinstance(stream, LimitedStream) and not request.META.get("CONTENT_LENGTH")
+            and request.META.get("wsgi.input_terminated") and "wsgi.input" in request.META):
+        return request.META["wsgi.input"]
+    return stream
+
+
+def _check_content_length(request):
+    try:
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        length = 0
+    if length > settings.UPLOAD_MAX_BYTES:
+        raise RequestBodyTooLarge(
+            f"Request body exceeds the {settings.UPLOAD_MAX_BYTES} byte limit",
+            max_bytes=settings.UPLOAD_MAX_BYTES,
+        )
+
+
+def _text_field(parser_context):
+    return getattr(parser_context.get("view"), "streamed_text_field", "text")
+
+
+class PlainTextParser(BaseParser):
+    """`text/plain` body as the view's text field; the other fields come from the query string"""
+    media_type = "text/plain"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        request = parser_context["request"]
+        _check_content_length(request)
+
+        text_stream = TextStream(parser_context.get("encoding") or settings.DEFAULT_CHARSET)
+        if stream is not None:
+            while True:
+                data = stream.read(READ_SIZE)
+                if not data:
+                    break
+                text_stream.feed(data)
+        text, spans = text_stream.close()
+
+        data = {key: request.query_params.get(key) for key in request.query_params}
+        data[_text_field(parser_context)] = text
+        return StreamedText(data, spans)
+
+
+class ChunkingUploadHandler(FileUploadHandler):
+    """Decodes and chunks the uploaded file as it arrives instead of storing it"""
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.text_stream = None
+        self.result = None
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        if self.result is not None or self.text_stream is not None:
+            raise ParseError("Upload a single text file per request")
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.text_stream = TextStream(charset or "utf-8")
+
+    def receive_data_chunk(self, raw_data, start):
+        self.text_stream.feed(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        self.result = self.text_stream.close()
+        self.text_stream = None
+        return None
+
+
+class StreamingMultiPartParser(BaseParser):
+    """
+    multipart/form-data with one text file (any field name) as the view's text field;
+    the other form fields are passed through.
+    """
+    media_type = "multipart/form-data"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        request = parser_context["request"]
+        _check_content_length(request)
+
+        meta = request.META.copy()
+        meta["CONTENT_TYPE"] = media_type
+        handler = ChunkingUploadHandler(request)
+        encoding = parser_context.get("encoding") or settings.DEFAULT_CHARSET
+        try:
+            fields, _ = DjangoMultiPartParser(meta, stream, [handler], encoding).parse()
+        except MultiPartParserError as e:
+            raise ParseError(f"Multipart form parse error - {str(e)}")
+
+        data = {key: fields.get(key) for key in fields}
+        if handler.result is None:
+            # No file part: plain form fields, e.g. a small text field
+            return data
+        text, spans = handler.result
+        data[_text_field(parser_context)] = text
+        return StreamedText(data, spans)
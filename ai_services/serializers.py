@@ -1,36 +1,213 @@
+from django.conf import settings
 from rest_framework import serializers
 
+from .category_sets import get_category_set
+from .documents import get_document
+from .logic.model_router import QUALITY_HINTS, LATENCY_HINTS
+from .logic.text_classifier import normalize_label
 
-class SummarizationSerializer(serializers.Serializer):
-    text = serializers.CharField()
+
+def _context_api_key(serializer):
+    return serializer.context.get("api_key", getattr(serializer.context.get("request"), "api_key", None))
+
+
+class DocumentTextMixin:
+    """
+    Lets a serializer accept `doc_id` in place of its text field.
+    The referenced document's text is substituted and the document itself is
+    returned under `document` so views can reuse its precomputed chunks.
+    """
+    document_text_field = "text"
+    document_text_required = True
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        field = self.document_text_field
+        doc_id = attrs.pop("doc_id", None)
+
+        if doc_id is None:
+            if self.document_text_required and not attrs.get(field):
+                raise serializers.ValidationError({field: f"Provide either '{field}' or 'doc_id'."})
+            attrs["document"] = None
+            return attrs
+
+        if attrs.get(field):
+            raise serializers.ValidationError({"doc_id": f"Provide either '{field}' or 'doc_id', not both."})
+
+        document = get_document(_context_api_key(self), doc_id)
+        if document is None:
+            raise serializers.ValidationError({"doc_id": "Document not found or expired."})
+
+        attrs[field] = document.text
+        attrs["document"] = document
+        return attrs
+
+
+class RoutingHintsSerializer(serializers.Serializer):
+    """Optional client hints used to pick the model for a request"""
+    quality = serializers.ChoiceField(choices=QUALITY_HINTS, required=False)
+    latency = serializers.ChoiceField(choices=LATENCY_HINTS, required=False)
+
+
+class BulkOptionsSerializer(RoutingHintsSerializer):
+    """Query parameters of the NDJSON bulk endpoint"""
+    order = serializers.ChoiceField(choices=["input", "completion"], default="input")
+    window = serializers.IntegerField(min_value=1, required=False)
+
+    def validate_window(self, value):
+        if value > settings.BULK_MAX_WINDOW:
+            raise serializers.ValidationError(f"Ensure this value is less than or equal to {settings.BULK_MAX_WINDOW}.")
+        return value
+
+
+class DocumentUploadSerializer(serializers.Serializer):
+    text = serializers.CharField(trim_whitespace=False)
+    ttl_seconds = serializers.IntegerField(required=False, min_value=60)
+
+
+class JobSubmitSerializer(serializers.Serializer):
+    service = serializers.ChoiceField(choices=[
+        "summarize", "sentiment", "keywords", "classify", "detect_language", "translate", "answer", "generate"
+    ])
+    payload = serializers.DictField()
+
+
+class SummarizationSerializer(DocumentTextMixin, serializers.Serializer):
+    text = serializers.CharField(required=False)
+    doc_id = serializers.UUIDField(required=False)
     method = serializers.ChoiceField(choices=["stuff", "map_reduce", "refine"], default="stuff")
 
 class SentimentRequestSerializer(serializers.Serializer):
     text = serializers.CharField()
-    
-class KeywordRequestSerializer(serializers.Serializer):
-    text = serializers.CharField()
+
+class KeywordRequestSerializer(DocumentTextMixin, serializers.Serializer):
+    text = serializers.CharField(required=False)
+    doc_id = serializers.UUIDField(required=False)
     count = serializers.IntegerField(required=False, default=5)
 
-class TextClassificationSerializer(serializers.Serializer):
-    text = serializers.CharField()
+# Nesting levels allowed below the top level of a category set
+MAX_CATEGORY_DEPTH = 8
+
+
+def _category_depth(categories):
+    """Nesting depth of raw category data, without recursion"""
+    depth, level = 0, categories
+    while level:
+        depth += 1
+        level = [
+            child for category in level if isinstance(category, dict)
+            for child in (category.get("children") if isinstance(category.get("children"), list) else [])
+        ]
+    return depth
+
+
+def _clean_category(category):
+    cleaned = {field: value for field, value in category.items() if value and field != "children"}
+    if category.get("children"):
+        cleaned["children"] = [_clean_category(child) for child in category["children"]]
+    return cleaned
+
+
+class CategorySerializer(serializers.Serializer):
+    """One category of a category set; a plain string is taken as the name"""
+    name = serializers.CharField(max_length=200)
+    description = serializers.CharField(max_length=1000, required=False, allow_blank=True)
+    examples = serializers.ListField(child=serializers.CharField(max_length=500), required=False, max_length=5)
+
+    def __init__(self, *args, depth=0, **kwargs):
+        self.depth = depth
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        # Subcategories, for hierarchical classification; CategorySetSerializer rejects
+        # anything nested deeper, so the field tree ends at MAX_CATEGORY_DEPTH
+        fields = super().get_fields()
+        if self.depth < MAX_CATEGORY_DEPTH:
+            fields["children"] = CategorySerializer(many=True, required=False, depth=self.depth + 1)
+        return fields
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = {"name": data}
+        return super().to_internal_value(data)
+
+
+class CategorySetSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=100)
+    categories = CategorySerializer(many=True, allow_empty=False)
+
+    def to_internal_value(self, data):
+        categories = data.get("categories") if hasattr(data, "get") else None
+        if isinstance(categories, list) and _category_depth(categories) > MAX_CATEGORY_DEPTH + 1:
+            raise serializers.ValidationError(
+                {"categories": [f"Categories can be nested at most {MAX_CATEGORY_DEPTH} levels deep."]}
+            )
+        return super().to_internal_value(data)
+
+    def validate_categories(self, categories):
+        count = 0
+        siblings = [categories]
+        while siblings:
+            group = siblings.pop()
+            count += len(group)
+            seen = set()
+            for category in group:
+                normalized = normalize_label(category["name"])
+                if normalized in seen:
+                    raise serializers.ValidationError(f"Duplicate category name: {category['name']}")
+                seen.add(normalized)
+                if category.get("children"):
+                    siblings.append(category["children"])
+        if count > settings.CATEGORY_SET_MAX_CATEGORIES:
+            raise serializers.ValidationError(
+                f"A category set can have at most {settings.CATEGORY_SET_MAX_CATEGORIES} categories."
+            )
+        return [_clean_category(category) for category in categories]
+
+
+class TextClassificationSerializer(DocumentTextMixin, serializers.Serializer):
+    text = serializers.CharField(required=False)
+    doc_id = serializers.UUIDField(required=False)
     categories = serializers.ListField(
         child=serializers.CharField(),
         required=False,
         allow_empty=True
     )
+    category_set_id = serializers.UUIDField(required=False)
+
+    def validate(self, attrs):
+        """Resolves category_set_id to the registered set, returned under `category_set`"""
+        attrs = super().validate(attrs)
+        category_set_id = attrs.pop("category_set_id", None)
+        attrs["category_set"] = None
+        if category_set_id is None:
+            return attrs
+        if attrs.get("categories"):
+            raise serializers.ValidationError(
+                {"category_set_id": "Provide either 'categories' or 'category_set_id', not both."}
+            )
+        category_set = get_category_set(_context_api_key(self), category_set_id)
+        if category_set is None:
+            raise serializers.ValidationError({"category_set_id": "Category set not found."})
+        attrs["category_set"] = category_set
+        return attrs
 
 class LanguageDetectionSerializer(serializers.Serializer):
     text = serializers.CharField()
 
-class TextTranslationSerializer(serializers.Serializer):
-    text = serializers.CharField()
+class TextTranslationSerializer(DocumentTextMixin, serializers.Serializer):
+    text = serializers.CharField(required=False)
+    doc_id = serializers.UUIDField(required=False)
     target_language = serializers.CharField()
     source_language = serializers.CharField(required=False, default="auto")
 
-class QuestionAnsweringSerializer(serializers.Serializer):
+class QuestionAnsweringSerializer(DocumentTextMixin, serializers.Serializer):
+    document_text_field = "context"
+    document_text_required = False
+
     question = serializers.CharField()
     context = serializers.CharField(required=False, allow_blank=True)
+    doc_id = serializers.UUIDField(required=False)
 
 class ContentGenerationSerializer(serializers.Serializer):
     prompt_text = serializers.CharField()
@@ -38,4 +215,4 @@ class ContentGenerationSerializer(serializers.Serializer):
         choices=["email", "story", "blog", "social_media", "product_description", "general"],
         default="general"
     )
-    max_length = serializers.IntegerField(required=False, default=500, min_value=50, max_value=2000)
\ No newline at end of file
+    max_length = serializers.IntegerField(required=False, default=500, min_value=50, max_value=2000)
@@ -0,0 +1,95 @@
+"""
+Registry of the AI services by name.
+Used wherever a service is run outside its HTTP view (job queue, bulk processing):
+the request is validated with the service's serializer and then executed with run_service.
+"""
+from .logic.content_generator import generate_content
+from .logic.invocation import invocation_context
+from .logic.keyword_extractor import extract_keywords
+from .logic.language_detector import detect_language
+from .logic.question_answerer import answer_question
+from .logic.sentiment_analyzer import analyze_sentiment
+from .logic.summarizer import summarize_text
+from .logic.text_classifier import classify_text
+from .logic.text_translator import translate_text
+from .serializers import (
+    KeywordRequestSerializer, SentimentRequestSerializer, SummarizationSerializer,
+    TextClassificationSerializer, LanguageDetectionSerializer, TextTranslationSerializer,
+    QuestionAnsweringSerializer, ContentGenerationSerializer
+)
+
+
+def _summarize(data):
+    return {"summary": summarize_text(data["text"], data["method"], chunks=data.get("chunks"))}
+
+
+def _sentiment(data):
+    return analyze_sentiment(data["text"])
+
+
+def _keywords(data):
+    return extract_keywords(data["text"], data["count"])
+
+
+def _classify(data):
+    return classify_text(data["text"], data.get("categories"), data.get("category_set"))
+
+
+def _detect_language(data):
+    return detect_language(data["text"])
+
+
+def _translate(data):
+    return translate_text(data["text"], data["target_language"], data.get("source_language", "auto"))
+
+
+def _answer(data):
+    return answer_question(data["question"], data.get("context"))
+
+
+def _generate(data):
+    return generate_content(data["prompt_text"], data.get("content_type", "general"), data.get("max_length", 500))
+
+
+# service name -> (request serializer, runner taking plain validated data)
+SERVICES = {
+    "summarize": (SummarizationSerializer, _summarize),
+    "sentiment": (SentimentRequestSerializer, _sentiment),
+    "keywords": (KeywordRequestSerializer, _keywords),
+    "classify": (TextClassificationSerializer, _classify),
+    "detect_language": (LanguageDetectionSerializer, _detect_language),
+    "translate": (TextTranslationSerializer, _translate),
+    "answer": (QuestionAnsweringSerializer, _answer),
+    "generate": (ContentGenerationSerializer, _generate),
+}
+
+
+def get_serializer(service, data, api_key=None):
+    """Build the service's request serializer; api_key scopes doc_id lookups"""
+    serializer_class, _ = SERVICES[service]
+    return serializer_class(data=data, context={"api_key": api_key})
+
+
+def plain_arguments(validated_data):
+    """
+    Replace the resolved `document` with its precomputed chunks (and a resolved
+    `category_set` with its compiled form) so the arguments are plain data that can
+    be sent to a worker process.
+    """
+    data = {k: v for k, v in validated_data.items() if k != "document"}
+    document = validated_data.get("document")
+    if document is not None:
+        data["chunks"] = document.get_chunks()
+    if validated_data.get("category_set") is not None:
+        data["category_set"] = validated_data["category_set"].compiled()
+    return data
+
+
+def run_service(service, data, tenant=None, **hints):
+    """Run a service on plain validated data and return its result with call metadata"""
+    _, runner = SERVICES[service]
+    with invocation_context(tenant, **hints) as context:
+        result = runner(data)
+    if context.calls and isinstance(result, dict):
+        result["metadata"] = context.metadata()
+    return result
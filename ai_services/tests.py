@@ -1,3 +1,363 @@
-from django.test import TestCase
+import gzip
+import io
+import threading
+import time
+import unittest
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.response import Response
+
+from . import compression, jobs
+from .exceptions import (
+    DeadlineExceeded, IdempotencyKeyInProgress, ProvidersUnavailable, RequestBodyTooLarge, RequestCancelled,
+    ServiceOverloaded,
+)
+from .idempotency import begin_request, finish_request, request_hash
+from .logic.concurrency import BULK, INTERACTIVE, AdaptiveLimiter, Tenant
+from .models import APIKey, IdempotencyRecord, Job
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Condition not reached in time")
+        time.sleep(0.005)
+
+
+class AdaptiveLimiterSchedulingTests(SimpleTestCase):
+    """Fair queueing, priority classes, queue limits and shedding of the adaptive limiter"""
+
+    def setUp(self):
+        self.granted = []
+        self.errors = []
+        self.threads = []
+
+    def tearDown(self):
+        for thread in self.threads:
+            thread.join(timeout=2)
+
+    def limiter(self, **options):
+        options = {"initial_limit": 1, "queue_timeout": 2.0, "bulk_queue_timeout": 2.0, **options}
+        # A fixed limit, so the order of grants is all that is tested
+        options.setdefault("min_limit", options["initial_limit"])
+        options.setdefault("max_limit", options["initial_limit"])
+        return AdaptiveLimiter(**options)
+
+    def queue(self, limiter, tenant, cost=1, **kwargs):
+        """Start a call that waits for a slot; returns once it is queued"""
+        waiting = limiter.waiting[tenant.priority_class]
+
+        def run():
+            try:
+                limiter.acquire("sentiment", tenant, cost, **kwargs)
+                self.granted.append(tenant.id)
+            except Exception as e:
+                self.errors.append(e)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+        wait_for(lambda: limiter.waiting[tenant.priority_class] > waiting or self.errors)
+
+    def release(self, limiter, tenant):
+        """Free one slot and return the tenant that got it"""
+        count = len(self.granted)
+        limiter.release("sentiment", 0.01, False, tenant)
+        wait_for(lambda: len(self.granted) > count)
+        return self.granted[-1]
+
+    def test_backlog_of_one_tenant_does_not_starve_another(self):
+        limiter = self.limiter()
+        a, b = Tenant("a", 1, INTERACTIVE), Tenant("b", 1, INTERACTIVE)
+        limiter.acquire("sentiment", a)
+        for _ in range(3):
+            self.queue(limiter, a)
+        self.queue(limiter, b)
+
+        order = [self.release(limiter, a) for _ in range(4)]
+        self.assertEqual(order, ["a", "b", "a", "a"])
+
+    def test_weight_sets_the_share_of_slots(self):
+        limiter = self.limiter()
+        light, heavy = Tenant("light", 1, INTERACTIVE), Tenant("heavy", 3, INTERACTIVE)
+        limiter.acquire("sentiment", light)
+        for _ in range(2):
+            self.queue(limiter, light)
+        for _ in range(3):
+            self.queue(limiter, heavy)
+
+        order = [self.release(limiter, light) for _ in range(5)]
+        self.assertEqual(order[:2], ["heavy", "heavy"])
+        self.assertEqual(order.count("heavy"), 3)
+
+    def test_interactive_calls_are_dispatched_before_bulk(self):
+        limiter = self.limiter()
+        bulk, interactive = Tenant("bulk", 1, BULK), Tenant("user", 1, INTERACTIVE)
+        limiter.acquire("sentiment", interactive)
+        self.queue(limiter, bulk)
+        self.queue(limiter, interactive)
+
+        self.assertEqual(self.release(limiter, interactive), "user")
+        self.assertEqual(self.release(limiter, interactive), "bulk")
+
+    def test_bulk_calls_keep_to_their_share_of_the_limit(self):
+        limiter = self.limiter(initial_limit=4, bulk_max_share=0.5)
+        bulk, interactive = Tenant("bulk", 1, BULK), Tenant("user", 1, INTERACTIVE)
+        self.assertEqual(limiter.acquire("sentiment", bulk), 0.0)
+        self.assertEqual(limiter.acquire("sentiment", bulk), 0.0)
+        self.queue(limiter, bulk)
+        self.assertEqual(limiter.class_in_flight[BULK], 2)
+
+        # Slots above the bulk share are still free for interactive calls
+        self.assertEqual(limiter.acquire("sentiment", interactive), 0.0)
+        self.assertEqual(limiter.acquire("sentiment", interactive), 0.0)
+        self.assertEqual(self.release(limiter, bulk), "bulk")
+
+    def test_bulk_backlog_does_not_shed_interactive_calls(self):
+        limiter = self.limiter(max_queue=1, bulk_max_queue=2)
+        bulk, interactive = Tenant("bulk", 1, BULK), Tenant("user", 1, INTERACTIVE)
+        limiter.acquire("sentiment", bulk)
+        self.queue(limiter, bulk)
+        self.queue(limiter, bulk)
+        with self.assertRaises(ServiceOverloaded):
+            limiter.acquire("sentiment", bulk)
+
+        self.queue(limiter, interactive)
+        self.assertEqual(self.errors, [])
+        with self.assertRaises(ServiceOverloaded):
+            limiter.acquire("sentiment", interactive)
+        self.assertEqual(self.release(limiter, bulk), "user")
+        for _ in range(2):
+            self.release(limiter, bulk)
+        self.assertEqual(limiter.shed, 2)
+
+    def test_calls_waiting_longer_than_the_queue_timeout_are_shed(self):
+        limiter = self.limiter(queue_timeout=0.05)
+        tenant = Tenant("a", 1, INTERACTIVE)
+        limiter.acquire("sentiment", tenant)
+        started = time.monotonic()
+        with self.assertRaises(ServiceOverloaded) as raised:
+            limiter.acquire("sentiment", tenant)
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+        self.assertEqual(raised.exception.status_code, 503)
+        self.assertEqual(limiter.shed, 1)
+        self.assertEqual(limiter.waiting[INTERACTIVE], 0)
+        self.assertEqual(limiter.tenants["a"]["shed"], 1)
+
+    def test_client_deadline_ends_the_wait_without_shedding(self):
+        limiter = self.limiter()
+        tenant = Tenant("a", 1, INTERACTIVE)
+        limiter.acquire("sentiment", tenant)
+        with self.assertRaises(DeadlineExceeded):
+            limiter.acquire("sentiment", tenant, deadline=time.monotonic() + 0.05)
+        self.assertEqual(limiter.shed, 0)
+        self.assertEqual(limiter.waiting[INTERACTIVE], 0)
+
+
+class AdaptiveLimiterLimitTests(SimpleTestCase):
+    """How call outcomes move the limit"""
+
+    def test_burst_of_failures_backs_off_once(self):
+        limiter = AdaptiveLimiter(initial_limit=20)
+        for _ in range(20):
+            limiter.acquire("sentiment")
+        time.sleep(0.02)
+        for _ in range(20):
+            limiter.release("sentiment", 0.02, True)
+        self.assertEqual(limiter.limit, 18)
+
+        # Calls started after the decrease belong to the next window
+        limiter.acquire("sentiment")
+        time.sleep(0.01)
+        limiter.release("sentiment", 0.01, True)
+        self.assertAlmostEqual(limiter.limit, 16.2)
+
+    def test_long_generations_are_not_counted_as_slow(self):
+        limiter = AdaptiveLimiter(initial_limit=20)
+        for _ in range(20):
+            limiter.acquire("generate")
+            limiter.release("generate", 1.0, False, output_tokens=100)
+        limiter.acquire("generate")
+        limiter.release("generate", 5.0, False, output_tokens=2000)
+        self.assertEqual(limiter.limit, 20)
+
+        limiter.acquire("generate")
+        limiter.release("generate", 5.0, False, output_tokens=100)
+        self.assertEqual(limiter.limit, 18)
+
+    def test_slower_models_are_judged_against_their_own_latency(self):
+        limiter = AdaptiveLimiter(initial_limit=20)
+        for _ in range(20):
+            limiter.acquire("classify")
+            limiter.release("classify", 0.5, False, model="gemini-2.0-flash-lite")
+        for _ in range(20):
+            limiter.acquire("classify")
+            limiter.release("classify", 4.0, False, model="gemini-2.5-pro")
+        self.assertEqual(limiter.limit, 20)
+
+        limiter.acquire("classify")
+        limiter.release("classify", 4.0, False, model="gemini-2.0-flash-lite")
+        self.assertEqual(limiter.limit, 18)
+
+
+class IdempotencyTests(TestCase):
+    """Idempotency-Key handling of the service endpoints"""
+
+    def setUp(self):
+        user = User.objects.create_user("client", "client@example.com", "password")
+        self.api_key = APIKey.objects.create(user=user)
+
+    def post(self, key="key-1", text="A good day"):
+        return self.client.post(
+            "/sentiment/", {"text": text}, content_type="application/json",
+            HTTP_X_API_KEY=self.api_key.key, HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_completed_response_is_replayed(self):
+        with mock.patch("ai_services.views.analyze_sentiment", return_value={"sentiment": "positive"}) as analyze:
+            first = self.post()
+            second = self.post()
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(second.json()["sentiment"], "positive")
+        self.assertEqual(analyze.call_count, 1)
+
+    def test_same_key_for_a_different_request_is_rejected(self):
+        with mock.patch("ai_services.views.analyze_sentiment", return_value={"sentiment": "positive"}):
+            self.post()
+            response = self.post(text="Another text")
+        self.assertEqual(response.status_code, 422)
+
+    def test_retryable_failures_release_the_key(self):
+        failures = [
+            ProvidersUnavailable("down"),
+            IdempotencyKeyInProgress("busy"),
+            ServiceOverloaded("overloaded"),
+            DeadlineExceeded("too late"),
+            RequestCancelled("gone"),
+        ]
+        for error in failures:
+            with self.subTest(status=error.status_code):
+                with mock.patch("ai_services.views.analyze_sentiment", side_effect=error):
+                    self.assertEqual(self.post(key=f"key-{error.status_code}").status_code, error.status_code)
+                self.assertFalse(IdempotencyRecord.objects.exists())
+
+    def test_duplicate_waits_for_the_original_and_gets_its_response(self):
+        endpoint = "sentiment"
+        original = begin_request(
+            self.api_key, "key-1", endpoint, request_hash(endpoint, {"text": "A good day"}, QueryDict()),
+        )
+
+        def original_finishes(delay):
+            finish_request(original, Response({"sentiment": "positive"}, status=200))
+
+        with mock.patch("ai_services.idempotency.time.sleep", side_effect=original_finishes) as sleep, \
+                mock.patch("ai_services.views.analyze_sentiment") as analyze:
+            response = self.post()
+        self.assertTrue(sleep.called)
+        self.assertFalse(analyze.called)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(response.json(), {"sentiment": "positive"})
+
+    def test_disconnected_request_can_be_retried(self):
+        answers = [RequestCancelled("The client disconnected"), {"sentiment": "positive"}]
+        with mock.patch("ai_services.views.analyze_sentiment", side_effect=answers) as analyze:
+            self.assertEqual(self.post().status_code, 499)
+            self.assertFalse(IdempotencyRecord.objects.exists())
+
+            response = self.post()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Idempotent-Replayed", response.headers)
+        self.assertEqual(analyze.call_count, 2)
+
+
+class DecompressionLimitTests(TestCase):
+    """Compressed request bodies that expand past REQUEST_DECOMPRESSED_MAX_BYTES"""
+
+    def setUp(self):
+        user = User.objects.create_user("client", "client@example.com", "password")
+        self.api_key = APIKey.objects.create(user=user)
+
+    def test_oversized_gzip_body_is_rejected(self):
+        body = gzip.compress(b'{"text": "' + b"a" * 100000 + b'"}')
+        with override_settings(REQUEST_DECOMPRESSED_MAX_BYTES=10000), \
+                mock.patch("ai_services.views.analyze_sentiment") as analyze:
+            response = self.client.post(
+                "/sentiment/", body, content_type="application/json",
+                HTTP_CONTENT_ENCODING="gzip", HTTP_X_API_KEY=self.api_key.key,
+            )
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(analyze.called)
+
+    def test_gzip_body_within_the_limit_is_accepted(self):
+        body = gzip.compress(b'{"text": "A good day"}')
+        with mock.patch("ai_services.views.analyze_sentiment", return_value={"sentiment": "positive"}):
+            response = self.client.post(
+                "/sentiment/", body, content_type="application/json",
+                HTTP_CONTENT_ENCODING="gzip", HTTP_X_API_KEY=self.api_key.key,
+            )
+        self.assertEqual(response.status_code, 200)
+
+    @unittest.skipUnless(compression.BROTLI_BOUNDED, "needs brotli 1.2 or later")
+    def test_brotli_bomb_is_stopped_at_the_limit(self):
+        bomb = compression.brotli.compress(b"\0" * (64 * 1024 * 1024))
+        stream = compression.DecompressingStream(io.BytesIO(bomb), "br", 1024 * 1024)
+        with self.assertRaises(RequestBodyTooLarge):
+            stream.read()
+        # Output is bounded per call, so the limit is noticed long before the bomb expands
+        self.assertLess(stream.size, 2 * 1024 * 1024)
+
+
+class JobClaimTests(TestCase):
+    """Claiming, heartbeats and re-queueing of jobs"""
+
+    def setUp(self):
+        user = User.objects.create_user("client", "client@example.com", "password")
+        self.api_key = APIKey.objects.create(user=user)
+        self.job = jobs.submit_job(self.api_key, "sentiment", {"text": "A good day"})
+
+    def make_stale(self):
+        Job.objects.filter(id=self.job.id).update(locked_at=timezone.now() - timedelta(hours=1))
+
+    def test_a_job_is_claimed_once(self):
+        self.assertEqual(len(jobs.claim_jobs("worker-a", 5)), 1)
+        self.assertEqual(jobs.claim_jobs("worker-b", 5), [])
+
+    def test_stale_job_is_requeued_and_the_old_run_cannot_write(self):
+        first, = jobs.claim_jobs("worker-a", 1)
+        self.make_stale()
+        self.assertEqual(jobs.requeue_stale_jobs(), 1)
+        # The same worker claims it again, so only the claim token tells the runs apart
+        second, = jobs.claim_jobs("worker-a", 1)
+
+        jobs.complete_job(first, {"sentiment": "stale"})
+        self.assertEqual(Job.objects.get(id=self.job.id).status, Job.RUNNING)
+        jobs.fail_job(first, "late failure")
+        self.assertEqual(Job.objects.get(id=self.job.id).status, Job.RUNNING)
+
+        jobs.complete_job(second, {"sentiment": "positive"})
+        job = Job.objects.get(id=self.job.id)
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result, {"sentiment": "positive"})
+        self.assertEqual(job.attempts, 2)
+
+    def test_heartbeat_keeps_a_long_job_from_being_requeued(self):
+        claimed = jobs.claim_jobs("worker-a", 1)
+        self.make_stale()
+        self.assertEqual(jobs.heartbeat_jobs(claimed), 1)
+        self.assertEqual(jobs.requeue_stale_jobs(), 0)
+
+    def test_stale_job_without_attempts_left_fails(self):
+        Job.objects.filter(id=self.job.id).update(max_attempts=1)
+        jobs.claim_jobs("worker-a", 1)
+        self.make_stale()
+        self.assertEqual(jobs.requeue_stale_jobs(), 0)
+        self.assertEqual(Job.objects.get(id=self.job.id).status, Job.FAILED)
@@ -0,0 +1,75 @@
+"""
+Per-request phase timing reported through the Server-Timing header.
+ServerTimingMiddleware starts a timer for each request; code on the request path wraps
+its work in `phase(name)` (auth, parse, validate, prompt, llm, render). Outside a timed
+request `phase` does nothing, so logic modules can use it unconditionally.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Timer of the request currently being handled (None outside a timed request)
+_current_timer = contextvars.ContextVar("ai_services_request_timer", default=None)
+
+
+class RequestTimer:
+    """Accumulated duration and count per phase, plus database query totals"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.db_queries = 0
+        self.db_time = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            total, count = self.phases.get(name, (0.0, 0))
+            self.phases[name] = (total + seconds, count + 1)
+
+    def add_query(self, seconds):
+        with self._lock:
+            self.db_queries += 1
+            self.db_time += seconds
+
+    def header(self):
+        """Server-Timing header value, durations in milliseconds"""
+        entries = []
+        for name, (total, count) in self.phases.items():
+            entry = f"{name};dur={total * 1000:.1f}"
+            if count > 1:
+                entry += f';desc="{count} calls"'
+            entries.append(entry)
+        entries.append(f'db;dur={self.db_time * 1000:.1f};desc="{self.db_queries} queries"')
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+
+@contextmanager
+def request_timer():
+    """Time every phase run inside the block"""
+    timer = RequestTimer()
+    token = _current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(token)
+
+
+def current_timer():
+    return _current_timer.get()
+
+
+@contextmanager
+def phase(name):
+    """Add the block's duration to the current request's `name` phase"""
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - started)
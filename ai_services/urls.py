@@ -2,7 +2,9 @@ from django.urls import path
 from .views import (
     SummarizationView, SentimentAnalysisView, KeywordExtractionView, HomeView,
     TextClassificationView, LanguageDetectionView, TextTranslationView,
-    QuestionAnsweringView, ContentGenerationView, health_check, db_info
+    QuestionAnsweringView, ContentGenerationView, DocumentListView, DocumentDetailView,
+    CategorySetListView, CategorySetDetailView, JobListView, JobDetailView, BulkView,
+    health_check, db_info, metrics_view
 )
 from .auth_views import (
     login_view, signup_view, logout_view, regenerate_api_key
@@ -13,6 +15,7 @@ urlpatterns = [
     path("dashboard/", HomeView.as_view(), name="dashboard"),
     path("health/", health_check, name="health_check"),
     path("db-info/", db_info, name="db_info"),
+    path("metrics", metrics_view, name="metrics"),
     
     # Authentication URLs
     path("login/", login_view, name="login"),
@@ -29,4 +32,11 @@ urlpatterns = [
     path("translate/", TextTranslationView.as_view(), name="translate"),
     path("answer/", QuestionAnsweringView.as_view(), name="answer"),
     path("generate/", ContentGenerationView.as_view(), name="generate"),
+    path("documents/", DocumentListView.as_view(), name="documents"),
+    path("documents/<uuid:doc_id>/", DocumentDetailView.as_view(), name="document_detail"),
+    path("category-sets/", CategorySetListView.as_view(), name="category_sets"),
+    path("category-sets/<uuid:category_set_id>/", CategorySetDetailView.as_view(), name="category_set_detail"),
+    path("jobs/", JobListView.as_view(), name="jobs"),
+    path("jobs/<uuid:job_id>/", JobDetailView.as_view(), name="job_detail"),
+    path("bulk/<str:service>/", BulkView.as_view(), name="bulk"),
 ]
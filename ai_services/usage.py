@@ -0,0 +1,192 @@
+"""
+Usage accounting.
+Requests hand their usage event to a buffered recorder; a background thread writes the
+buffer with bulk_create every USAGE_FLUSH_INTERVAL seconds (or as soon as
+USAGE_BATCH_SIZE events are waiting) and folds each batch into the hourly and daily
+rollups. Nothing touches the database on the request path.
+"""
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import DailyUsage, HourlyUsage, UsageEvent
+
+logger = logging.getLogger(__name__)
+
+
+def _hour(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _day(moment):
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def rollup_events(events):
+    """Add a batch of events to the hourly and daily rollups"""
+    for rollup_model, truncate in ((HourlyUsage, _hour), (DailyUsage, _day)):
+        totals = defaultdict(lambda: {
+            "requests": 0, "errors": 0, "input_tokens": 0, "output_tokens": 0, "total_latency_ms": 0,
+        })
+        for event in events:
+            key = (event.api_key_id, truncate(event.created_at), event.endpoint, event.model)
+            bucket = totals[key]
+            bucket["requests"] += 1
+            bucket["errors"] += event.status_code >= 400
+            bucket["input_tokens"] += event.input_tokens
+            bucket["output_tokens"] += event.output_tokens
+            bucket["total_latency_ms"] += event.latency_ms
+
+        for (api_key_id, bucket_start, endpoint, model), values in totals.items():
+            lookup = {"api_key_id": api_key_id, "bucket_start": bucket_start, "endpoint": endpoint, "model": model}
+            increments = {name: F(name) + value for name, value in values.items()}
+            if rollup_model.objects.filter(**lookup).update(**increments):
+                continue
+            try:
+                with transaction.atomic():
+                    rollup_model.objects.create(**lookup, **values)
+            except IntegrityError:
+                # Another writer created the bucket first
+                rollup_model.objects.filter(**lookup).update(**increments)
+
+
+class UsageRecorder:
+    """Buffers usage events in memory and writes them in batches from a background thread"""
+
+    def __init__(self, batch_size=200, flush_interval=5.0, max_buffer=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.buffer = []
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def record(self, **fields):
+        """Queue one event (UsageEvent fields); never blocks on the database"""
+        fields.setdefault("created_at", timezone.now())
+        with self._lock:
+            if len(self.buffer) >= self.max_buffer:
+                self.dropped += 1
+                return
+            self.buffer.append(UsageEvent(**fields))
+            full = len(self.buffer) >= self.batch_size
+        self._ensure_thread()
+        if full:
+            self._wakeup.set()
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="usage-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Failed to write usage events: {str(e)}")
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """Write everything buffered so far; returns the number of events written"""
+        with self._flush_lock:
+            with self._lock:
+                events, self.buffer = self.buffer, []
+                dropped, self.dropped = self.dropped, 0
+            if dropped:
+                logger.warning(f"Usage buffer full, dropped {dropped} events")
+            if not events:
+                return 0
+            try:
+                with transaction.atomic():
+                    UsageEvent.objects.bulk_create(events, batch_size=self.batch_size)
+                    rollup_events(events)
+            except Exception:
+                # Keep the batch for the next attempt, as far as the buffer limit allows
+                with self._lock:
+                    self.buffer = (events + self.buffer)[:self.max_buffer]
+                raise
+            return len(events)
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def get_recorder():
+    global _recorder
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                _recorder = UsageRecorder(
+                    batch_size=settings.USAGE_BATCH_SIZE,
+                    flush_interval=settings.USAGE_FLUSH_INTERVAL,
+                    max_buffer=settings.USAGE_MAX_BUFFER,
+                )
+                atexit.register(_flush_at_exit)
+    return _recorder
+
+
+def _flush_at_exit():
+    try:
+        _recorder.flush()
+    except Exception as e:
+        logger.error(f"Failed to write usage events at exit: {str(e)}")
+
+
+def record_usage(api_key, endpoint, status_code, latency_ms, calls=()):
+    """Record one service request from the per-call metadata collected by invoke_prompt"""
+    if not settings.USAGE_TRACKING_ENABLED or api_key is None:
+        return
+    models = [call["model"] for call in calls]
+    get_recorder().record(
+        api_key_id=api_key.pk,
+        endpoint=endpoint,
+        model=max(set(models), key=models.count) if models else "",
+        input_tokens=sum(call.get("input_tokens") or call["estimated_input_tokens"] for call in calls),
+        output_tokens=sum(call.get("output_tokens") or 0 for call in calls),
+        latency_ms=int(latency_ms),
+        status_code=status_code,
+    )
+
+
+def usage_summary(api_key, days=30):
+    """Per-endpoint totals for the last `days` days, read from the daily rollups"""
+    since = _day(timezone.now()) - timedelta(days=days - 1)
+    rows = (
+        DailyUsage.objects.filter(api_key=api_key, bucket_start__gte=since)
+        .values("endpoint")
+        .annotate(
+            requests=Sum("requests"), errors=Sum("errors"), input_tokens=Sum("input_tokens"),
+            output_tokens=Sum("output_tokens"), total_latency_ms=Sum("total_latency_ms"),
+        )
+        .order_by("-requests")
+    )
+    endpoints = []
+    for row in rows:
+        row["average_latency_ms"] = round(row.pop("total_latency_ms") / row["requests"]) if row["requests"] else 0
+        endpoints.append(row)
+    return {
+        "days": days,
+        "requests": sum(row["requests"] for row in endpoints),
+        "input_tokens": sum(row["input_tokens"] for row in endpoints),
+        "output_tokens": sum(row["output_tokens"] for row in endpoints),
+        "endpoints": endpoints,
+    }
@@ -1,17 +1,34 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.parsers import JSONParser, FormParser
 from django.shortcuts import render
 from django.views import View
 from django.middleware.csrf import get_token
 from django.contrib import messages
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.conf import settings
 from django.db import connection
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
+import hmac
 import logging
+import time
 from .db_utils import check_database_health
+from .metrics import render_prometheus
+from .parsers import PlainTextParser, StreamingMultiPartParser, request_stream
+from .timing import phase
+from .usage import record_usage, usage_summary
+from .idempotency import Replay, begin_request, finish_request, release_request, request_hash
+from .bulk import BULK_SERVICES, BulkStream
+from .deadlines import cancellation_event
+from .category_sets import describe_category_set, get_category_set, store_category_set
+from .documents import store_document, active_documents, get_document, describe_document
+from .jobs import submit_job, describe_job
+from .services import get_serializer
+from .exceptions import RequestAbandoned, ServiceError
 
 from ai_services.logic.keyword_extractor import extract_keywords
 from ai_services.logic.text_classifier import classify_text
@@ -19,14 +36,18 @@ from ai_services.logic.language_detector import detect_language
 from ai_services.logic.text_translator import translate_text
 from ai_services.logic.question_answerer import answer_question
 from ai_services.logic.content_generator import generate_content
-from .models import APIKey
+from .models import APIKey, CategorySet, Job
 from .serializers import (
-    KeywordRequestSerializer, SentimentRequestSerializer, SummarizationSerializer,
+    BulkOptionsSerializer, CategorySetSerializer, DocumentUploadSerializer, JobSubmitSerializer, KeywordRequestSerializer, SentimentRequestSerializer, SummarizationSerializer,
     TextClassificationSerializer, LanguageDetectionSerializer, TextTranslationSerializer,
-    QuestionAnsweringSerializer, ContentGenerationSerializer
+    QuestionAnsweringSerializer, ContentGenerationSerializer, RoutingHintsSerializer
 )
 from .logic.summarizer import summarize_text
 from .logic.sentiment_analyzer import analyze_sentiment
+from .logic.invocation import invocation_context
+from .logic.concurrency import BULK, limiter_status, tenant_for
+from .logic.upstream import DISCONNECT, record_wasted, upstream_stats
+from .logic.providers import provider_status
 
 logger = logging.getLogger(__name__)
 
@@ -34,17 +55,40 @@ logger = logging.getLogger(__name__)
 @require_http_methods(["GET"])
 def health_check(request):
     """
-    Health check endpoint for monitoring
+    Health check endpoint for monitoring; upstream and per-key concurrency statistics
+    are only included for staff users
     """
     health = check_database_health()
     
     status_code = 200 if health['connected'] else 503
     
-    return JsonResponse({
+    data = {
         'status': 'healthy' if health['connected'] else 'unhealthy',
         'database': health,
+        'providers': provider_status(),
         'timestamp': timezone.now().isoformat()
-    }, status=status_code)
+    }
+    if request.user.is_staff:
+        data['upstream'] = upstream_stats()
+        data['concurrency'] = limiter_status()
+    return JsonResponse(data, status=status_code)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def metrics_view(request):
+    """
+    Prometheus metrics, for `Authorization: Bearer <METRICS_TOKEN>` or a staff user;
+    public only when METRICS_PUBLIC is set, since series are labelled by API key
+    """
+    token = settings.METRICS_TOKEN
+    authorized = (
+        settings.METRICS_PUBLIC
+        or request.user.is_staff
+        or (token and hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'))
+    )
+    if not authorized:
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 @require_http_methods(["GET"])
 def db_info(request):
@@ -101,38 +145,297 @@ class HomeView(View):
         return render(request, 'ai_services/dashboard.html', {
             'csrf_token': csrf_token,
             'api_key': api_key,
+            'usage': usage_summary(api_key) if api_key else None,
             'user': request.user
         })
 
-class SummarizationView(APIView):
+class ServiceAPIView(APIView):
+    """
+    Base view for the AI service endpoints.
+    Applies the client's routing hints, deadline and Idempotency-Key, maps ServiceError to
+    its HTTP response and adds LLM call metadata to successful responses.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        started = time.perf_counter()
+        self.idempotency = None
+        self.abandoned = False
+        try:
+            with invocation_context(
+                tenant_for(getattr(request, "api_key", None)),
+                deadline=getattr(request, "deadline", None),
+                cancelled=cancellation_event(request),
+            ) as context:
+                self.invocation = context
+                response = super().dispatch(request, *args, **kwargs)
+        except BaseException:
+            if self.idempotency is not None:
+                release_request(self.idempotency)
+            raise
+        if context.cancelled is not None and context.cancelled.is_set():
+            # The client left after these calls were answered; nobody will read the response
+            for call in context.calls:
+                record_wasted(call["service"], call["seconds"], DISCONNECT)
+        if context.calls and response.status_code < 400 and isinstance(getattr(response, "data", None), dict):
+            response.data["metadata"] = context.metadata()
+        if self.idempotency is not None:
+            finish_request(self.idempotency, response, abandoned=self.abandoned)
+        record_usage(
+            getattr(request, "api_key", None),
+            request.resolver_match.url_name,
+            response.status_code,
+            (time.perf_counter() - started) * 1000,
+            context.calls,
+        )
+        return response
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Routing hints may come in the JSON body or the query string
+        with phase("parse"):
+            data = request.data if hasattr(request.data, "get") else {}
+        hints = RoutingHintsSerializer(data={
+            name: data.get(name, request.query_params.get(name))
+            for name in ("quality", "latency")
+            if data.get(name, request.query_params.get(name)) is not None
+        })
+        hints.is_valid(raise_exception=True)
+        self.invocation.hints.update(hints.validated_data)
+
+        key = request.headers.get("Idempotency-Key")
+        if key is not None:
+            endpoint = request.resolver_match.url_name
+            with phase("idempotency"):
+                self.idempotency = begin_request(
+                    request.api_key, key.strip(), endpoint, request_hash(endpoint, data, request.query_params),
+                )
+
+    def validate(self, serializer):
+        """serializer.is_valid(), timed as the request's `validate` phase"""
+        with phase("validate"):
+            return serializer.is_valid()
+
+    def handle_exception(self, exc):
+        if isinstance(exc, Replay):
+            return exc.response()
+        if isinstance(exc, RequestAbandoned):
+            self.abandoned = True
+        if isinstance(exc, ServiceError):
+            return Response(exc.to_dict(), status=exc.status_code, headers=exc.headers())
+        return super().handle_exception(exc)
+
+
+class StreamedTextMixin:
+    """
+    Lets a service view take its text field as a `text/plain` body or a multipart file
+    upload, streamed and chunked while it is read, besides the usual JSON body.
+    """
+    parser_classes = [JSONParser, PlainTextParser, StreamingMultiPartParser, FormParser]
+    streamed_text_field = "text"
+
+    def streamed_chunks(self):
+        """Chunks computed while a streamed upload was read, or None for JSON requests"""
+        spans = getattr(self.request.data, "chunk_spans", None)
+        if spans is None:
+            return None
+        text = self.request.data[self.streamed_text_field]
+        return [text[start:end] for start, end in spans]
+
+
+class DocumentListView(APIView):
+    def get(self, request):
+        documents = active_documents(request.api_key).order_by("-created_at")
+        return Response({"documents": [describe_document(d) for d in documents]}, status=status.HTTP_200_OK)
+
+    def post(self, request):
+        serializer = DocumentUploadSerializer(data=request.data)
+        if serializer.is_valid():
+            try:
+                document, created = store_document(
+                    request.api_key,
+                    serializer.validated_data["text"],
+                    serializer.validated_data.get("ttl_seconds"),
+                )
+            except ServiceError as e:
+                return Response(e.to_dict(), status=e.status_code, headers=e.headers())
+            return Response(
+                describe_document(document),
+                status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+            )
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class DocumentDetailView(APIView):
+    def get(self, request, doc_id):
+        document = get_document(request.api_key, doc_id)
+        if document is None:
+            return Response({"error": "Document not found or expired"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(describe_document(document), status=status.HTTP_200_OK)
+
+    def delete(self, request, doc_id):
+        document = get_document(request.api_key, doc_id)
+        if document is None:
+            return Response({"error": "Document not found or expired"}, status=status.HTTP_404_NOT_FOUND)
+        document.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class CategorySetListView(APIView):
+    def get(self, request):
+        category_sets = CategorySet.objects.filter(api_key=request.api_key).order_by("name")
+        return Response(
+            {"category_sets": [describe_category_set(c) for c in category_sets]}, status=status.HTTP_200_OK
+        )
+
     def post(self, request):
-        serializer = SummarizationSerializer(data=request.data)
+        serializer = CategorySetSerializer(data=request.data)
         if serializer.is_valid():
+            try:
+                category_set, created = store_category_set(
+                    request.api_key,
+                    serializer.validated_data["name"],
+                    serializer.validated_data["categories"],
+                )
+            except ServiceError as e:
+                return Response(e.to_dict(), status=e.status_code, headers=e.headers())
+            return Response(
+                describe_category_set(category_set),
+                status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+            )
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class CategorySetDetailView(APIView):
+    def get(self, request, category_set_id):
+        category_set = get_category_set(request.api_key, category_set_id)
+        if category_set is None:
+            return Response({"error": "Category set not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(describe_category_set(category_set, include_categories=True), status=status.HTTP_200_OK)
+
+    def delete(self, request, category_set_id):
+        category_set = get_category_set(request.api_key, category_set_id)
+        if category_set is None:
+            return Response({"error": "Category set not found"}, status=status.HTTP_404_NOT_FOUND)
+        category_set.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class BulkView(APIView):
+    """
+    Runs a service over an `application/x-ndjson` body, one request body per line, and
+    streams one NDJSON result per line back while the body is still being read.
+    Query parameters: `order` (input or completion), `window` (lines in flight) and the
+    routing hints.
+    """
+
+    def post(self, request, service):
+        service = service.replace("-", "_")
+        if service not in BULK_SERVICES:
+            return Response(
+                {"error": "Unsupported service", "supported": list(BULK_SERVICES)}, status=status.HTTP_404_NOT_FOUND
+            )
+        if request.content_type.split(";")[0].strip() != "application/x-ndjson":
+            return Response(
+                {"error": "Unsupported media type", "message": "Send the records as application/x-ndjson"},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            )
+        options = BulkOptionsSerializer(data=request.query_params.dict())
+        if not options.is_valid():
+            return Response(options.errors, status=status.HTTP_400_BAD_REQUEST)
+        hints = {name: options.validated_data[name] for name in ("quality", "latency") if name in options.validated_data}
+
+        stream = BulkStream(
+            service,
+            request_stream(request._request),
+            request.api_key,
+            tenant_for(request.api_key, BULK),
+            hints,
+            window=options.validated_data.get("window", settings.BULK_DEFAULT_WINDOW),
+            order=options.validated_data["order"],
+        )
+        if isinstance(request._request, ASGIRequest):
+            response = StreamingHttpResponse(stream.iterate_async(), content_type="application/x-ndjson")
+        else:
+            response = StreamingHttpResponse(stream, content_type="application/x-ndjson")
+        # Proxies must pass each line on as it is written
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+class JobListView(APIView):
+    def get(self, request):
+        jobs = Job.objects.filter(api_key=request.api_key).order_by("-created_at")[:100]
+        return Response({"jobs": [describe_job(job) for job in jobs]}, status=status.HTTP_200_OK)
+
+    def post(self, request):
+        serializer = JobSubmitSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        service = serializer.validated_data["service"]
+        payload = serializer.validated_data["payload"]
+
+        # Validate now so bad requests fail immediately instead of in the worker
+        service_serializer = get_serializer(service, payload, api_key=request.api_key)
+        hints = RoutingHintsSerializer(data={k: payload[k] for k in ("quality", "latency") if k in payload})
+        if not service_serializer.is_valid():
+            return Response({"payload": service_serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        if not hints.is_valid():
+            return Response({"payload": hints.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        job = submit_job(request.api_key, service, payload)
+        return Response(describe_job(job), status=status.HTTP_202_ACCEPTED)
+
+
+class JobDetailView(APIView):
+    def get(self, request, job_id):
+        job = Job.objects.filter(api_key=request.api_key, id=job_id).first()
+        if job is None:
+            return Response({"error": "Job not found or expired"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(describe_job(job), status=status.HTTP_200_OK)
+
+    def delete(self, request, job_id):
+        # Only jobs that have not started yet can be cancelled
+        deleted, _ = Job.objects.filter(api_key=request.api_key, id=job_id, status=Job.QUEUED).delete()
+        if not deleted:
+            return Response({"error": "Job not found or already started"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class SummarizationView(StreamedTextMixin, ServiceAPIView):
+    def post(self, request):
+        serializer = SummarizationSerializer(data=request.data, context={"request": request})
+        if self.validate(serializer):
             text = serializer.validated_data["text"]
             method = serializer.validated_data["method"]
+            document = serializer.validated_data["document"]
             try:
-                summary = summarize_text(text, method)
+                chunks = document.get_chunks() if document else self.streamed_chunks()
+                summary = summarize_text(text, method, chunks=chunks)
                 return Response({"summary": summary}, status=status.HTTP_200_OK)
+            except ServiceError:
+                raise
             except Exception as e:
                 return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
-class SentimentAnalysisView(APIView):
+class SentimentAnalysisView(ServiceAPIView):
     def post(self, request):
         serializer = SentimentRequestSerializer(data=request.data)
-        if serializer.is_valid():
+        if self.validate(serializer):
             result = analyze_sentiment(serializer.validated_data["text"])
             return Response(result, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     
-class KeywordExtractionView(APIView):
+class KeywordExtractionView(StreamedTextMixin, ServiceAPIView):
     def post(self, request):
-        serializer = KeywordRequestSerializer(data=request.data)
-        if serializer.is_valid():
+        serializer = KeywordRequestSerializer(data=request.data, context={"request": request})
+        if self.validate(serializer):
             try:
                 result = extract_keywords(serializer.validated_data["text"], serializer.validated_data["count"])
                 return Response(result, status=status.HTTP_200_OK)
+            except ServiceError:
+                raise
             except ValueError as e:
                 return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
             except Exception as e:
@@ -143,15 +446,18 @@ class KeywordExtractionView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class TextClassificationView(APIView):
+class TextClassificationView(ServiceAPIView):
     def post(self, request):
-        serializer = TextClassificationSerializer(data=request.data)
-        if serializer.is_valid():
+        serializer = TextClassificationSerializer(data=request.data, context={"request": request})
+        if self.validate(serializer):
             try:
                 text = serializer.validated_data["text"]
                 categories = serializer.validated_data.get("categories", None)
-                result = classify_text(text, categories)
+                category_set = serializer.validated_data["category_set"]
+                result = classify_text(text, categories, category_set.compiled() if category_set else None)
                 return Response(result, status=status.HTTP_200_OK)
+            except ServiceError:
+                raise
             except Exception as e:
                 return Response(
                     {"error": "An unexpected error occurred during text classification"}, 
@@ -160,13 +466,15 @@ class TextClassificationView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class LanguageDetectionView(APIView):
+class LanguageDetectionView(ServiceAPIView):
     def post(self, request):
         serializer = LanguageDetectionSerializer(data=request.data)
-        if serializer.is_valid():
+        if self.validate(serializer):
             try:
                 result = detect_language(serializer.validated_data["text"])
                 return Response(result, status=status.HTTP_200_OK)
+            except ServiceError:
+                raise
             except Exception as e:
                 return Response(
                     {"error": "An unexpected error occurred during language detection"}, 
@@ -175,16 +483,18 @@ class LanguageDetectionView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class TextTranslationView(APIView):
+class TextTranslationView(StreamedTextMixin, ServiceAPIView):
     def post(self, request):
-        serializer = TextTranslationSerializer(data=request.data)
-        if serializer.is_valid():
+        serializer = TextTranslationSerializer(data=request.data, context={"request": request})
+        if self.validate(serializer):
             try:
                 text = serializer.validated_data["text"]
                 target_language = serializer.validated_data["target_language"]
                 source_language = serializer.validated_data.get("source_language", "auto")
                 result = translate_text(text, target_language, source_language)
                 return Response(result, status=status.HTTP_200_OK)
+            except ServiceError:
+                raise
             except Exception as e:
                 return Response(
                     {"error": "An unexpected error occurred during translation"}, 
@@ -193,15 +503,19 @@ class TextTranslationView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class QuestionAnsweringView(APIView):
+class QuestionAnsweringView(StreamedTextMixin, ServiceAPIView):
+    streamed_text_field = "context"
+
     def post(self, request):
-        serializer = QuestionAnsweringSerializer(data=request.data)
-        if serializer.is_valid():
+        serializer = QuestionAnsweringSerializer(data=request.data, context={"request": request})
+        if self.validate(serializer):
             try:
                 question = serializer.validated_data["question"]
                 context = serializer.validated_data.get("context", None)
                 result = answer_question(question, context)
                 return Response(result, status=status.HTTP_200_OK)
+            except ServiceError:
+                raise
             except Exception as e:
                 return Response(
                     {"error": "An unexpected error occurred during question answering"}, 
@@ -210,16 +524,18 @@ class QuestionAnsweringView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ContentGenerationView(APIView):
+class ContentGenerationView(ServiceAPIView):
     def post(self, request):
         serializer = ContentGenerationSerializer(data=request.data)
-        if serializer.is_valid():
+        if self.validate(serializer):
             try:
                 prompt_text = serializer.validated_data["prompt_text"]
                 content_type = serializer.validated_data.get("content_type", "general")
                 max_length = serializer.validated_data.get("max_length", 500)
                 result = generate_content(prompt_text, content_type, max_length)
                 return Response(result, status=status.HTTP_200_OK)
+            except ServiceError:
+                raise
             except Exception as e:
                 return Response(
                     {"error": "An unexpected error occurred during content generation"}, 
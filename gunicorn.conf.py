@@ -0,0 +1,102 @@
+"""
+Gunicorn configuration for AI Service Hub (loaded automatically by `gunicorn` from the
+project root).
+
+Requests spend almost all of their time waiting on the LLM, so concurrency has to come
+from threads (or an event loop), not from CPU-bound worker processes. Sizing follows
+Little's law: in-flight requests = target throughput x upstream latency.
+
+Environment:
+    GUNICORN_WORKER_MODE       gthread (default) or uvicorn
+    GUNICORN_UPSTREAM_LATENCY  expected seconds per request, mostly the LLM call (default 2)
+    GUNICORN_TARGET_RPS        requests per second the instance should absorb (default 25)
+    WEB_CONCURRENCY            worker processes (default: CPU count, at least 2)
+    GUNICORN_THREADS           threads per gthread worker (default: from the two values above)
+    GUNICORN_PRELOAD           load the app before forking workers (default true)
+    GUNICORN_MAX_REQUESTS      recycle a worker after this many requests (default 2000, 0 = never)
+    GUNICORN_KEEPALIVE         seconds to keep idle client connections open (default 75)
+    PORT                       listen port (default 8000)
+"""
+import importlib.util
+import math
+import multiprocessing
+import os
+
+worker_mode = os.getenv('GUNICORN_WORKER_MODE', 'gthread')
+upstream_latency = float(os.getenv('GUNICORN_UPSTREAM_LATENCY', 2.0))
+target_rps = float(os.getenv('GUNICORN_TARGET_RPS', 25))
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', max(2, multiprocessing.cpu_count())))
+
+# Requests that must be in flight at once to sustain target_rps, spread over the workers
+in_flight = math.ceil(target_rps * upstream_latency)
+
+if worker_mode == 'uvicorn':
+    # Django runs the (synchronous) service views in a thread pool under ASGI; this mode is
+    # for async/streaming endpoints and client-disconnect handling, not for more throughput.
+    if importlib.util.find_spec('uvicorn') is None:
+        raise RuntimeError("GUNICORN_WORKER_MODE=uvicorn requires uvicorn (pip install -r requirements.txt)")
+    wsgi_app = 'service_hub.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'service_hub.wsgi:application'
+    worker_class = 'gthread'
+    threads = int(os.getenv('GUNICORN_THREADS', min(64, max(4, math.ceil(in_flight / workers)))))
+
+    # Every request thread blocks on one upstream call (two while hedging)
+    os.environ.setdefault('AI_UPSTREAM_MAX_WORKERS', str(threads * 2))
+
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True').lower() == 'true'
+
+# Recycle workers to bound memory growth; jitter keeps them from restarting together
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+
+# A worker is killed only if it stops heartbeating this long; must exceed the slowest
+# upstream timeout (AI_SERVICE_TIMEOUTS) so long summaries are not cut off
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 150))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 60))
+
+# Longer than the load balancer's idle timeout (60s on most) so it never reuses a
+# connection gunicorn has just closed
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 75))
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    # Connections and clients opened while preloading must not be shared across processes
+    if not server.cfg.preload_app:
+        return
+    from django.db import connections
+    from ai_services.logic.providers import reset_provider_pool
+
+    connections.close_all()
+    reset_provider_pool()
+
+
+def worker_exit(server, worker):
+    # Final metrics snapshot, so increments since the last periodic flush are not lost
+    from ai_services import metrics
+
+    metrics.flush(force=True)
+
+
+def child_exit(server, worker):
+    # Runs in the master: fold the exited worker's metrics snapshot into the archive file
+    directory = os.getenv('METRICS_MULTIPROC_DIR')
+    if directory:
+        from ai_services.metrics import archive_exited
+
+        archive_exited(directory, pid=worker.pid)
+
+
+def when_ready(server):
+    server.log.info(
+        f"Serving with {workers} {worker_class} workers"
+        + (f" x {threads} threads" if worker_class == 'gthread' else '')
+        + f" (sized for {target_rps:g} req/s at {upstream_latency:g}s upstream latency)"
+    )
@@ -11,6 +11,11 @@ import os
 
 from django.core.asgi import get_asgi_application
 
+from ai_services.deadlines import DisconnectWatcher
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'service_hub.settings')
 
 application = get_asgi_application()
+
+# Lets views find out when a client disconnects mid-request
+application = DisconnectWatcher(application)
@@ -117,7 +117,7 @@ def get_supabase_database_config():
 
 # Set the database configuration
 DATABASES = {
-    'default': get_supabase_database_config()
+    'default': configure_connection_pool(get_supabase_database_config())
 }
 
 # Static files configuration for production
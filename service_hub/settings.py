@@ -44,6 +44,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'ai_services.middleware.MetricsMiddleware',
+    'ai_services.middleware.ServerTimingMiddleware',
+    'ai_services.middleware.DeadlineMiddleware',
+    'ai_services.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -105,6 +109,46 @@ else:
         }
     }
 
+# In-process connection pool (psycopg 3, `pip install "psycopg[binary,pool]"`).
+# Opt-in; applies to PostgreSQL only. The pool is per worker process, so
+# workers x DB_POOL_MAX_SIZE must stay below the server/pooler connection limit.
+DB_POOL_ENABLED = os.getenv('DB_POOL_ENABLED', 'False').lower() == 'true'
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 2))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 10))
+DB_POOL_MAX_IDLE = float(os.getenv('DB_POOL_MAX_IDLE', 300))  # close idle connections above min size
+DB_POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', 1800))  # recycle connections
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))  # wait for a free connection
+
+
+def configure_connection_pool(database):
+    """Switch a PostgreSQL DATABASES entry to the psycopg pool when DB_POOL_ENABLED is set"""
+    if not DB_POOL_ENABLED or database.get('ENGINE') != 'django.db.backends.postgresql':
+        return database
+    database = dict(database)
+    # Connections go back to the pool after each request instead of persisting
+    database['CONN_MAX_AGE'] = 0
+    # Makes the pool check a connection before handing it out
+    database['CONN_HEALTH_CHECKS'] = True
+    # Transaction poolers (Supabase port 6543, PgBouncer) can hand every transaction a
+    # different server connection: no prepared statements, no server-side cursors
+    database['DISABLE_SERVER_SIDE_CURSORS'] = True
+    database['OPTIONS'] = {
+        **database.get('OPTIONS', {}),
+        'prepare_threshold': None,
+        'server_side_binding': False,
+        'pool': {
+            'min_size': DB_POOL_MIN_SIZE,
+            'max_size': DB_POOL_MAX_SIZE,
+            'max_idle': DB_POOL_MAX_IDLE,
+            'max_lifetime': DB_POOL_MAX_LIFETIME,
+            'timeout': DB_POOL_TIMEOUT,
+        },
+    }
+    return database
+
+
+DATABASES['default'] = configure_connection_pool(DATABASES['default'])
+
 
 
 # Password validation
@@ -151,3 +195,187 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Document store
+# Large texts are uploaded once per API key and referenced by doc_id
+
+DOCUMENT_MAX_BYTES = int(os.getenv('DOCUMENT_MAX_BYTES', 5 * 1024 * 1024))
+DOCUMENT_QUOTA_BYTES = int(os.getenv('DOCUMENT_QUOTA_BYTES', 25 * 1024 * 1024))  # compressed, per API key
+DOCUMENT_MAX_COUNT = int(os.getenv('DOCUMENT_MAX_COUNT', 100))
+DOCUMENT_DEFAULT_TTL_SECONDS = int(os.getenv('DOCUMENT_DEFAULT_TTL_SECONDS', 24 * 60 * 60))
+DOCUMENT_MAX_TTL_SECONDS = int(os.getenv('DOCUMENT_MAX_TTL_SECONDS', 7 * 24 * 60 * 60))
+DOCUMENT_CHUNK_TOKENS = int(os.getenv('DOCUMENT_CHUNK_TOKENS', 1000))
+DOCUMENT_COMPRESSION_LEVEL = 6
+
+# text/plain and multipart uploads to /summarize/, /keywords/, /translate/ and /answer/
+# are streamed and chunked while reading; larger bodies are rejected with 413
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', DOCUMENT_MAX_BYTES))
+
+# Category sets registered per API key for /classify/ (category_set_id)
+CATEGORY_SET_MAX_COUNT = int(os.getenv('CATEGORY_SET_MAX_COUNT', 50))
+CATEGORY_SET_MAX_CATEGORIES = int(os.getenv('CATEGORY_SET_MAX_CATEGORIES', 2000))
+
+# NDJSON bulk endpoint (/bulk/<service>/): lines processed concurrently per stream
+BULK_DEFAULT_WINDOW = int(os.getenv('BULK_DEFAULT_WINDOW', 8))
+BULK_MAX_WINDOW = int(os.getenv('BULK_MAX_WINDOW', 64))
+BULK_MAX_LINE_BYTES = int(os.getenv('BULK_MAX_LINE_BYTES', 1024 * 1024))
+
+# Request bodies with Content-Encoding gzip/deflate/br are decompressed while reading and
+# rejected with 413 past this size; JSON, NDJSON and text responses of at least
+# RESPONSE_COMPRESSION_MIN_BYTES are compressed when the client sends Accept-Encoding
+REQUEST_DECOMPRESSED_MAX_BYTES = int(os.getenv('REQUEST_DECOMPRESSED_MAX_BYTES', UPLOAD_MAX_BYTES))
+RESPONSE_COMPRESSION_ENABLED = os.getenv('RESPONSE_COMPRESSION_ENABLED', 'True').lower() == 'true'
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESSION_MIN_BYTES', 1024))
+
+
+# AI service token budgets
+# Per-service overrides of ai_services.logic.token_budget.DEFAULT_TOKEN_BUDGETS, e.g.
+# {'summarize': {'input': 50000, 'overflow': 'truncate'}}
+
+AI_SERVICE_TOKEN_BUDGETS = {}
+
+
+# AI model routing
+# Rules are checked in order and the first match wins. A rule may match on
+# services, min_input_tokens, max_input_tokens and the client's quality/latency hints.
+
+AI_DEFAULT_MODEL = os.getenv('AI_DEFAULT_MODEL', 'gemini-2.0-flash')
+AI_LITE_MODEL = os.getenv('AI_LITE_MODEL', 'gemini-2.0-flash-lite')
+AI_PRO_MODEL = os.getenv('AI_PRO_MODEL', 'gemini-2.5-pro')
+AI_LONG_CONTEXT_MODEL = os.getenv('AI_LONG_CONTEXT_MODEL', 'gemini-2.5-flash')
+# Inputs above the token budgets (at most 100000, summarize and answer) are rejected before
+# routing, so this threshold has to stay below the largest input budget to ever match
+AI_LONG_CONTEXT_MIN_TOKENS = int(os.getenv('AI_LONG_CONTEXT_MIN_TOKENS', 50000))
+
+AI_MODEL_ROUTES = [
+    {'quality': 'high', 'model': AI_PRO_MODEL},
+    {'latency': 'low', 'max_input_tokens': 100000, 'model': AI_LITE_MODEL},
+    {'services': ['sentiment', 'detect_language', 'classify'], 'max_input_tokens': 4000, 'model': AI_LITE_MODEL},
+    {'quality': 'low', 'max_input_tokens': 100000, 'model': AI_LITE_MODEL},
+    {'min_input_tokens': AI_LONG_CONTEXT_MIN_TOKENS, 'model': AI_LONG_CONTEXT_MODEL},
+]
+
+
+# Upstream LLM timeouts and hedging
+# Per-service overrides of ai_services.logic.upstream.DEFAULT_TIMEOUTS (seconds)
+
+AI_SERVICE_TIMEOUTS = {}
+AI_UPSTREAM_MAX_WORKERS = int(os.getenv('AI_UPSTREAM_MAX_WORKERS', 32))
+# Calls nobody waits for any more keep a worker until the provider answers; past this many
+# new calls are rejected with 503 rather than queueing behind them
+AI_UPSTREAM_MAX_ORPHANS = int(os.getenv('AI_UPSTREAM_MAX_ORPHANS', AI_UPSTREAM_MAX_WORKERS // 2))
+
+# Hedging fires a second call for idempotent low-temperature services when the first
+# is slower than the observed p95, capped at budget_ratio of all calls
+AI_HEDGING = {
+    'enabled': os.getenv('AI_HEDGING_ENABLED', 'False').lower() == 'true',
+    'budget_ratio': float(os.getenv('AI_HEDGING_BUDGET_RATIO', 0.05)),
+}
+
+# Adaptive (AIMD) limit on concurrent LLM calls per process: grows while calls succeed,
+# shrinks on errors, timeouts and latency spikes. Calls over the limit queue per API key
+# (weighted fair queueing by APIKey.weight; interactive keys ahead of bulk keys and jobs)
+# for up to queue_timeout / bulk_queue_timeout seconds and are then rejected with 503.
+# Bulk calls may use at most bulk_max_share of the limit.
+AI_CONCURRENCY = {
+    'enabled': os.getenv('AI_CONCURRENCY_ENABLED', 'True').lower() == 'true',
+    'initial_limit': int(os.getenv('AI_CONCURRENCY_INITIAL_LIMIT', 20)),
+    'min_limit': int(os.getenv('AI_CONCURRENCY_MIN_LIMIT', 2)),
+    'max_limit': int(os.getenv('AI_CONCURRENCY_MAX_LIMIT', 200)),
+    'queue_timeout': float(os.getenv('AI_CONCURRENCY_QUEUE_TIMEOUT', 2.0)),
+    'max_queue': int(os.getenv('AI_CONCURRENCY_MAX_QUEUE', 50)),
+    'bulk_queue_timeout': float(os.getenv('AI_CONCURRENCY_BULK_QUEUE_TIMEOUT', 30.0)),
+    'bulk_max_queue': int(os.getenv('AI_CONCURRENCY_BULK_MAX_QUEUE', 200)),
+    'bulk_max_share': float(os.getenv('AI_CONCURRENCY_BULK_MAX_SHARE', 0.75)),
+}
+
+# Opt-in micro-batching: short concurrent sentiment, detect_language and classify requests
+# (same options and API key) are sent as one numbered multi-item prompt
+AI_MICRO_BATCHING = {
+    'enabled': os.getenv('AI_MICRO_BATCHING_ENABLED', 'False').lower() == 'true',
+    'max_items': int(os.getenv('AI_MICRO_BATCHING_MAX_ITEMS', 16)),
+    'max_wait_ms': float(os.getenv('AI_MICRO_BATCHING_MAX_WAIT_MS', 20)),
+    'max_item_tokens': int(os.getenv('AI_MICRO_BATCHING_MAX_ITEM_TOKENS', 250)),
+}
+
+# Category sets with subcategories are classified level by level; beam_width branches are
+# kept per level and their subtrees classified concurrently
+AI_HIERARCHICAL_CLASSIFICATION = {
+    'beam_width': int(os.getenv('AI_HIERARCHICAL_BEAM_WIDTH', 2)),
+    'max_workers': int(os.getenv('AI_HIERARCHICAL_MAX_WORKERS', 16)),
+}
+
+# Auto-detected translations first run a local language check: text already in the target
+# language is returned unchanged, and in mixed text only the foreign segments are translated
+AI_TRANSLATION_SAME_LANGUAGE = {
+    'enabled': os.getenv('AI_TRANSLATION_SAME_LANGUAGE_ENABLED', 'True').lower() == 'true',
+    'min_confidence': float(os.getenv('AI_TRANSLATION_SAME_LANGUAGE_MIN_CONFIDENCE', 0.6)),
+}
+
+
+# LLM providers
+# Ordered failover list. Providers are defined in ai_services.logic.providers
+# (gemini, gemini_backup, local, simulated) and can be extended with AI_PROVIDER_DEFINITIONS.
+# Add "local" last for a deterministic degraded mode, or use it alone for tests.
+# "simulated" behaves like a remote LLM (latency, throughput, errors) for load tests.
+
+AI_PROVIDERS = [name.strip() for name in os.getenv('AI_PROVIDERS', 'gemini').split(',') if name.strip()]
+AI_PROVIDER_DEFINITIONS = {}
+AI_PROVIDER_FAILURE_THRESHOLD = int(os.getenv('AI_PROVIDER_FAILURE_THRESHOLD', 3))
+AI_PROVIDER_COOLDOWN_SECONDS = float(os.getenv('AI_PROVIDER_COOLDOWN_SECONDS', 30))
+
+AI_SIMULATED_LLM = {
+    'latency_ms': float(os.getenv('AI_SIMULATED_LATENCY_MS', 800)),  # median before generation
+    'latency_sigma': float(os.getenv('AI_SIMULATED_LATENCY_SIGMA', 0.5)),  # lognormal spread
+    'tokens_per_second': float(os.getenv('AI_SIMULATED_TOKENS_PER_SECOND', 80)),
+    'error_rate': float(os.getenv('AI_SIMULATED_ERROR_RATE', 0.0)),
+}
+
+
+# Job queue
+# Long-running requests submitted to /jobs/ are executed by `manage.py run_jobs`
+
+JOB_WORKER_CONCURRENCY = int(os.getenv('JOB_WORKER_CONCURRENCY', 4))
+JOB_WORKER_POOL = os.getenv('JOB_WORKER_POOL', 'thread')  # 'thread' or 'process'
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+JOB_RETRY_BASE_SECONDS = float(os.getenv('JOB_RETRY_BASE_SECONDS', 5))
+# Running jobs are re-queued when their worker has not sent a heartbeat for this long
+JOB_LOCK_TIMEOUT_SECONDS = int(os.getenv('JOB_LOCK_TIMEOUT_SECONDS', 15 * 60))
+JOB_HEARTBEAT_SECONDS = int(os.getenv('JOB_HEARTBEAT_SECONDS', 60))
+JOB_RESULT_TTL_SECONDS = int(os.getenv('JOB_RESULT_TTL_SECONDS', 24 * 60 * 60))
+
+
+# Metrics
+# /metrics serves Prometheus text format to `Authorization: Bearer <METRICS_TOKEN>` and staff
+# users; METRICS_PUBLIC=True opens it to anyone. Under multi-process servers point
+# METRICS_MULTIPROC_DIR at a directory shared by the workers (emptied on deploy).
+
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+METRICS_PUBLIC = os.getenv('METRICS_PUBLIC', 'False').lower() == 'true'
+METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 1.0))
+
+# Server-Timing header with a per-phase breakdown (always sent to staff users)
+SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', 'False').lower() == 'true'
+SERVER_TIMING_LOG = os.getenv('SERVER_TIMING_LOG', 'False').lower() == 'true'
+
+
+# Idempotency keys
+# Responses to requests with an Idempotency-Key header are replayed to retries for
+# IDEMPOTENCY_TTL_SECONDS; a retry waits up to IDEMPOTENCY_WAIT_SECONDS for the original
+# to finish, and a key held longer than IDEMPOTENCY_LOCK_SECONDS is treated as abandoned.
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', 24 * 60 * 60))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv('IDEMPOTENCY_WAIT_SECONDS', 60))
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv('IDEMPOTENCY_LOCK_SECONDS', 300))
+
+
+# Usage tracking
+# Service requests are logged as UsageEvent rows written in batches off the request
+# path, and summed into hourly/daily rollups read by the dashboard and admin.
+
+USAGE_TRACKING_ENABLED = os.getenv('USAGE_TRACKING_ENABLED', 'True').lower() == 'true'
+USAGE_BATCH_SIZE = int(os.getenv('USAGE_BATCH_SIZE', 200))
+USAGE_FLUSH_INTERVAL = float(os.getenv('USAGE_FLUSH_INTERVAL', 5))
+USAGE_MAX_BUFFER = int(os.getenv('USAGE_MAX_BUFFER', 10000))